@@ -0,0 +1,367 @@
+"""
+Benchmarks for the venv commands, run against synthetic packages served from a local package index.
+
+Run from the root of the repository:
+
+    python benchmarks/benchmark.py --sizes small,medium --output results.json
+    python benchmarks/benchmark.py compare old-results.json results.json
+    python benchmarks/benchmark.py startup
+
+See the 'Benchmarks' section of the README for details.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import dataclass, field
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator
+
+_venv_cli_path = Path(__file__).resolve().parent.parent / "src" / "venv-cli" / "venv.sh"
+_venv_stub_path = _venv_cli_path.with_name("venv-stub.sh")
+_package_prefix = "benchpkg"
+_extra_package = f"{_package_prefix}-extra"
+
+# Number of packages in the dependency tree of each environment size
+SIZES = {"small": 10, "medium": 100, "large": 1000}
+
+
+@dataclass
+class Benchmark:
+    """A command to time, and the commands that prepare the environment and caches before each run"""
+
+    name: str
+    command: str
+    setup: list[str] = field(default_factory=list)
+    cold: bool = False
+
+
+BENCHMARKS = [
+    Benchmark("create (cold)", "venv create {python}", setup=["rm -rf .venv"], cold=True),
+    Benchmark("create (warm)", "venv create {python}", setup=["rm -rf .venv"]),
+    Benchmark("install txt (cold)", "venv install -r requirements.txt", setup=["venv clear"], cold=True),
+    Benchmark("install txt (warm)", "venv install -r requirements.txt", setup=["venv clear"]),
+    Benchmark("install txt (unchanged)", "venv install -r requirements.txt"),
+    Benchmark("lock", "venv lock"),
+    Benchmark("install lock (cold)", "venv install -r requirements.lock", setup=["venv clear"], cold=True),
+    Benchmark("install lock (warm)", "venv install -r requirements.lock", setup=["venv clear"]),
+    Benchmark("clear", "venv clear", setup=["venv install -r requirements.txt"]),
+    Benchmark(
+        "uninstall",
+        f"venv uninstall {_extra_package}",
+        setup=[f"venv install {_extra_package}"],
+    ),
+]
+
+
+def package_name(index: int) -> str:
+    return f"{_package_prefix}-{index:04d}"
+
+
+def build_wheel(name: str, version: str, requires: list[str], payload_size: int, wheel_dir: Path) -> Path:
+    """Build a pure python wheel for the package 'name', with a module of 'payload_size' bytes
+
+    Args:
+        name: The name of the package.
+        version: The version of the package.
+        requires: The requirements of the package, written to 'Requires-Dist'.
+        payload_size: The size of the module in the package, in bytes.
+        wheel_dir: The folder to write the wheel to.
+
+    Returns:
+        The path to the wheel.
+    """
+    module = name.replace("-", "_")
+    dist_info = f"{module}-{version}.dist-info"
+    metadata_lines = ["Metadata-Version: 2.1", f"Name: {name}", f"Version: {version}"]
+    metadata_lines += [f"Requires-Dist: {requirement}" for requirement in requires]
+    # Pseudo-random, but reproducible, payload that does not compress away
+    payload = "".join(hashlib.sha256(f"{name}-{block}".encode()).hexdigest() for block in range(payload_size // 64 + 1))
+    files = {
+        f"{module}/__init__.py": f'PAYLOAD = "{payload[:payload_size]}"\n',
+        f"{dist_info}/METADATA": "\n".join(metadata_lines) + "\n",
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nGenerator: venv-cli-benchmark\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    record_lines = []
+    for path, contents in files.items():
+        digest = base64.urlsafe_b64encode(hashlib.sha256(contents.encode()).digest()).rstrip(b"=").decode()
+        record_lines.append(f"{path},sha256={digest},{len(contents.encode())}")
+    files[f"{dist_info}/RECORD"] = "\n".join([*record_lines, f"{dist_info}/RECORD,,"]) + "\n"
+
+    wheel_path = wheel_dir / f"{module}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(wheel_path, "w", compression=zipfile.ZIP_DEFLATED) as wheel:
+        for path, contents in files.items():
+            wheel.writestr(path, contents)
+    return wheel_path
+
+
+def build_index(index_dir: Path, package_count: int, payload_size: int) -> None:
+    """Build a PEP 503 package index of 'package_count' synthetic packages, plus one extra package.
+
+    The packages form a binary tree of dependencies: Package i requires packages 2i+1 and 2i+2,
+    so installing the first package installs all of them.
+
+    Args:
+        index_dir: The folder to build the index in. The index itself is in the 'simple' folder inside it.
+        package_count: The number of packages in the dependency tree.
+        payload_size: The size of the module in each package, in bytes.
+    """
+    files_dir = index_dir / "files"
+    files_dir.mkdir(parents=True)
+    packages = {
+        package_name(index): [package_name(child) for child in (2 * index + 1, 2 * index + 2)]
+        for index in range(package_count)
+    }
+    packages = {name: [child for child in children if child in packages] for name, children in packages.items()}
+    packages[_extra_package] = []
+
+    for name, requires in packages.items():
+        wheel_path = build_wheel(name, "1.0", requires, payload_size, files_dir)
+        project_dir = index_dir / "simple" / name
+        project_dir.mkdir(parents=True)
+        (project_dir / "index.html").write_text(f'<a href="../../files/{wheel_path.name}">{wheel_path.name}</a>\n')
+    (index_dir / "simple" / "index.html").write_text(
+        "".join(f'<a href="{name}/">{name}</a>\n' for name in sorted(packages))
+    )
+
+
+@dataclass
+class IndexServer:
+    """Serves a local package index over HTTP, like a remote index, in a background thread"""
+
+    index_dir: Path
+    server: ThreadingHTTPServer | None = None
+
+    def __enter__(self) -> str:
+        handler = partial(_QuietRequestHandler, directory=str(self.index_dir))
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/simple/"
+
+    def __exit__(self, *args: Any) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class _QuietRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class Runner:
+    """Runs venv commands in a project folder, with the package index and caches of the benchmark"""
+
+    def __init__(self, project_dir: Path, index_url: str, python: str):
+        self.project_dir = project_dir
+        self.index_url = index_url
+        self.python = python
+        self.cache_dir = project_dir.parent / "cache"
+        self.trace_file = project_dir.parent / "trace.jsonl"
+
+    def reset_caches(self) -> None:
+        """Remove the venv-cli and pip caches, so the next command runs cold"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def run(self, command: str) -> subprocess.CompletedProcess[str]:
+        """Run a venv command in the project folder, activating the environment first if it exists
+
+        Args:
+            command: The command to run.
+
+        Raises:
+            subprocess.CalledProcessError: If the command returns a non-zero exit code.
+        """
+        activate = "if [ -d .venv ]; then venv activate; fi"
+        script = f". {_venv_cli_path}; {activate}; {command.format(python=self.python)}"
+        env = {
+            **os.environ,
+            "XDG_CACHE_HOME": str(self.cache_dir),
+            "PIP_CACHE_DIR": str(self.cache_dir / "pip"),
+            "PIP_INDEX_URL": self.index_url,
+            "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+            "VENV_CLI_TRACE": str(self.trace_file),
+        }
+        env.pop("VIRTUAL_ENV", None)
+        return subprocess.run(
+            ["bash", "-c", script], cwd=self.project_dir, env=env, capture_output=True, text=True, check=True
+        )
+
+    def time(self, benchmark: Benchmark) -> tuple[float, dict[str, float]]:
+        """Prepare and time one run of a benchmark
+
+        Returns:
+            The duration of the command in seconds, and the duration of every traced phase of it.
+        """
+        if benchmark.cold:
+            self.reset_caches()
+        for setup_command in benchmark.setup:
+            self.run(setup_command)
+
+        self.trace_file.unlink(missing_ok=True)
+        start = time.perf_counter()
+        self.run(benchmark.command)
+        duration = time.perf_counter() - start
+
+        phases: dict[str, float] = {}
+        for line in self.trace_file.read_text().splitlines() if self.trace_file.exists() else []:
+            event = json.loads(line)
+            phases[event["name"]] = phases.get(event["name"], 0.0) + event["dur"] / 1_000_000
+        return duration, phases
+
+
+def run_size(size: str, package_count: int, args: argparse.Namespace) -> Iterator[dict[str, Any]]:
+    """Run every benchmark on an environment of 'package_count' packages, yielding the result of each"""
+    with tempfile.TemporaryDirectory(prefix=f"venv-cli-benchmark-{size}-") as work_dir:
+        index_dir = Path(work_dir) / "index"
+        build_index(index_dir, package_count, args.package_size)
+        project_dir = Path(work_dir) / "project"
+        project_dir.mkdir()
+        (project_dir / "requirements.txt").write_text(f"{package_name(0)}\n")
+
+        with IndexServer(index_dir) as index_url:
+            runner = Runner(project_dir, index_url, args.python)
+            for benchmark in BENCHMARKS:
+                runs = []
+                phase_runs: dict[str, list[float]] = {}
+                for _ in range(args.repeat):
+                    duration, phases = runner.time(benchmark)
+                    runs.append(duration)
+                    for phase, phase_duration in phases.items():
+                        phase_runs.setdefault(phase, []).append(phase_duration)
+
+                result = {
+                    "size": size,
+                    "packages": package_count + 1,
+                    "benchmark": benchmark.name,
+                    "runs": runs,
+                    "min": min(runs),
+                    "median": statistics.median(runs),
+                    "phases": {phase: statistics.median(durations) for phase, durations in phase_runs.items()},
+                }
+                print(f"{size:<8} {benchmark.name:<26} {result['median']:>8.3f}s", file=sys.stderr)
+                yield result
+
+
+def git_commit() -> str | None:
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=_venv_cli_path.parent, capture_output=True, text=True, check=False
+    )
+    return result.stdout.strip() or None
+
+
+def run(args: argparse.Namespace) -> int:
+    sizes = args.sizes.split(",")
+    unknown_sizes = [size for size in sizes if size not in SIZES]
+    if unknown_sizes:
+        print(f"Unknown sizes {unknown_sizes}, must be one of {list(SIZES)}", file=sys.stderr)
+        return 1
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": args.python,
+        "platform": platform.platform(),
+        "package_size": args.package_size,
+        "repeat": args.repeat,
+        "results": [result for size in sizes for result in run_size(size, SIZES[size], args)],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    """Print the median duration of every benchmark in two result files, and the change between them"""
+    baseline, current = (json.loads(Path(path).read_text()) for path in (args.baseline, args.current))
+    baseline_medians = {(result["size"], result["benchmark"]): result["median"] for result in baseline["results"]}
+
+    print(f"{'Size':<8} {'Benchmark':<26} {'Baseline':>9} {'Current':>9} {'Change':>8}")
+    for result in current["results"]:
+        baseline_median = baseline_medians.get((result["size"], result["benchmark"]))
+        if baseline_median is None:
+            continue
+        change = (result["median"] - baseline_median) / baseline_median * 100
+        print(
+            f"{result['size']:<8} {result['benchmark']:<26} {baseline_median:>8.3f}s {result['median']:>8.3f}s"
+            f" {change:>+7.1f}%"
+        )
+    return 0
+
+
+def startup(args: argparse.Namespace) -> int:
+    """Time how long it takes to start a shell that sources the stub or the full script"""
+    commands = {
+        "bash": "true",
+        "bash + venv stub": f". {_venv_stub_path}",
+        "bash + venv.sh": f". {_venv_cli_path}",
+    }
+    env = {**os.environ, "VENV_CLI_SCRIPT": str(_venv_cli_path)}
+
+    results: list[dict[str, Any]] = []
+    for name, command in commands.items():
+        durations = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run(["bash", "--norc", "--noprofile", "-c", command], env=env, check=True)
+            durations.append(time.perf_counter() - start)
+        results.append({"benchmark": name, "median": statistics.median(durations), "min": min(durations)})
+
+    for result in results:
+        print(f"{result['benchmark']:<18} {result['median'] * 1000:>7.2f}ms (min {result['min'] * 1000:.2f}ms)")
+    if args.output:
+        Path(args.output).write_text(json.dumps({"repeat": args.repeat, "results": results}, indent=2) + "\n")
+    return 0
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the venv commands against a local package index")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks (default)")
+    run_parser.add_argument("--sizes", default="small,medium,large", help=f"Comma-separated sizes of {list(SIZES)}")
+    run_parser.add_argument("--package-size", type=int, default=10_000, help="Size of each package in bytes")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each benchmark")
+    run_parser.add_argument(
+        "--python",
+        default=f"{sys.version_info.major}.{sys.version_info.minor}",
+        help="Python version passed to 'venv create'",
+    )
+    run_parser.add_argument("--output", help="File to write the JSON results to, instead of stdout")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline", help="JSON results to compare against")
+    compare_parser.add_argument("current", help="JSON results to compare")
+    compare_parser.set_defaults(func=compare)
+
+    startup_parser = subparsers.add_parser("startup", help="Time sourcing the venv stub and the full script")
+    startup_parser.add_argument("--repeat", type=int, default=50, help="Number of shells to start for each case")
+    startup_parser.add_argument("--output", help="File to also write the JSON results to")
+    startup_parser.set_defaults(func=startup)
+
+    if not argv or argv[0] not in ("run", "compare", "startup", "-h", "--help"):
+        argv = ["run", *argv]
+    args = parser.parse_args(argv)
+    return int(args.func(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
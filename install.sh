@@ -12,7 +12,9 @@ install_common() {
 
   set -x
   sudo mkdir -p /usr/local/share/venv
-  sudo cp "${_src_dir}/venv.sh" "${_install_dir}/venv"
+  # The rc-file sources the small 'venv' stub, which loads the full 'venv.sh' script the first time 'venv' is used
+  sudo cp "${_src_dir}/venv.sh" "${_install_dir}/venv.sh"
+  sudo cp "${_src_dir}/venv-stub.sh" "${_install_dir}/venv"
   sudo cp "${_src_dir}/uninstall.sh" "${_install_dir}/uninstall.sh"
 
   if [ -n "${completion_file}" ]; then
@@ -40,11 +42,12 @@ install_bash() {
 
 install_zsh() {
   local rcfile="${HOME}/.zshrc"
-  # local completion_file="${_src_dir}/completions/zsh/venv_completion.sh"
-  # local completion_target="/usr/local/share/zsh/site-functions/_venv"
-  echo "Command completions currently not supported for zsh"
+  local completion_file="${_src_dir}/completions/zsh/venv_completion.sh"
+  local completion_target="/usr/local/share/zsh/site-functions/_venv"
+  PS4="\000"  # Remove '++' from beginning of lines while printing commands
 
-  install_common "${rcfile}"
+  sudo mkdir -p "$(dirname "${completion_target}")"
+  install_common "${rcfile}" "${completion_file}" "${completion_target}"
   if ! command grep -q "${_source_comment}" "${rcfile}"; then
     echo "fpath+=( ${_install_dir} )" >> "${rcfile}"
     echo "autoload -Uz venv" >> "${rcfile}"
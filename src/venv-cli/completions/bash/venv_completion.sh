@@ -1,5 +1,39 @@
 # bash completion for venv                                -*- shell-script -*-
 
+_venv_package_names() {
+    # Print the names of known packages starting with the given prefix, from the sorted file of package names kept
+    # by 'venv install' and 'venv cache names'. 'look' finds them using a binary search, if it is installed.
+    # This never contacts the package index, so completion stays fast.
+    local names_file="${XDG_CACHE_HOME:-${HOME}/.cache}/venv-cli/package-names"
+    local prefix="${1,,}"
+    prefix="${prefix//[_.]/-}"
+    if [ ! -f "${names_file}" ] || [[ ! "${prefix}" =~ ^[a-z0-9-]*$ ]]; then
+        return
+    fi
+
+    if command -v look > /dev/null; then
+        LC_ALL=C look -- "${prefix}" "${names_file}" | head -n 1000
+    else
+        LC_ALL=C grep -m 1000 "^${prefix}" "${names_file}"
+    fi
+}
+
+_venv_requirement_names() {
+    # Print the names of the packages in the requirements file given with '-r' on the command line,
+    # or in 'requirements.txt'
+    local requirements_file="requirements.txt"
+    local i
+    for (( i=2; i < COMP_CWORD; i++ )); do
+        if [ "${COMP_WORDS[i]}" == "-r" ] || [ "${COMP_WORDS[i]}" == "--requirement" ]; then
+            requirements_file="${COMP_WORDS[i+1]}"
+        fi
+    done
+
+    if [ -f "${requirements_file}" ]; then
+        sed -E -n 's/^[[:space:]]*([A-Za-z0-9][A-Za-z0-9._-]*)[[:space:]]*([][<>=!~;@(,].*)?$/\1/p' "${requirements_file}"
+    fi
+}
+
 _venv() {
     local first_word second_word cur_word prev_word _subcommands subcommands help_options
     first_word="${COMP_WORDS[0]}"
@@ -7,7 +41,7 @@ _venv() {
     cur_word="${COMP_WORDS[COMP_CWORD]}"
     prev_word="${COMP_WORDS[COMP_CWORD-1]}"
 
-    _subcommands="activate clear create deactivate delete install lock uninstall"
+    _subcommands="activate cache clear create deactivate delete install lock pack profile-imports rollback status store trace uninstall unpack"
     subcommands=( $(compgen -W "${_subcommands}" -- "${cur_word}") )
     help_options=( $(compgen -W "-h --help" -- "${cur_word}") )
 
@@ -31,21 +65,31 @@ _venv() {
     case "${second_word}" in
         "create")
             # Generate list of all available python3 versions
-
-            # The command below does the following, by line:
-            # * List all python commands, e.g. "python3", "python3.10-config", ...
-            # * Select only "python3.X" or "python3.XX"
-            # * Remove the "python", leaving the version number
-            # * Select unique entries, sorted by numerical value
             local python_versions
-            python_versions=( $( \
-                    compgen -c "python${cur_word}" \
-                    | grep -P '^python3.\d+$' \
-                    | sed 's|python||' \
-                    | sort -n --unique \
-                ) )
+            if declare -F venv::_python_registry > /dev/null; then
+                # Read the versions from the registry of python interpreters on $PATH, sorted by version
+                python_versions=( $( \
+                        tail -n +2 "$(venv::_python_registry)" \
+                        | cut -f 1 \
+                        | sort -V \
+                    ) )
+                python_versions=( $(compgen -W "${python_versions[*]}" -- "${cur_word}") )
+            else
+                # venv-cli is not loaded yet, so the registry can't be used. The command below does the following, by line:
+                # * List all python commands, e.g. "python3", "python3.10-config", ...
+                # * Select only "python3.X" or "python3.XX"
+                # * Remove the "python", leaving the version number
+                # * Select unique entries, sorted by numerical value
+                python_versions=( $( \
+                        compgen -c "python${cur_word}" \
+                        | grep -P '^python3.\d+$' \
+                        | sed 's|python||' \
+                        | sort -V --unique \
+                    ) )
+            fi
             COMPREPLY+=( ${python_versions[*]} )
             COMPREPLY+=( ${help_options[*]} )
+            COMPREPLY+=( $(compgen -W "--no-template" -- "${cur_word}") )
             ;;
         "delete")
             # Generate completion for help_options plus the '-y' option
@@ -59,9 +103,16 @@ _venv() {
                     COMPREPLY+=( $(compgen -f -X '!(*.txt|*.lock)' -- "${cur_word}" | sort) )
                     compopt -o plusdirs +o nosort  # Add directories after generated completions
                     ;;
+                "-j"|"--jobs"|"--pip-args")
+                    # Nothing to generate
+                    ;;
                 *)
+                    if [[ "${cur_word}" != -* ]]; then
+                        # Generate completions for package names
+                        COMPREPLY+=( $(_venv_package_names "${cur_word}") )
+                    fi
                     COMPREPLY+=( ${help_options[*]} )
-                    COMPREPLY+=( $(compgen -W "-r --requirement -s --skip-lock --pip-args" -- "${cur_word}") )
+                    COMPREPLY+=( $(compgen -W "-r --requirement -s --skip-lock --clean --no-wheelhouse --refresh -j --jobs --pip-args --atomic --store --base --compile --no-compile" -- "${cur_word}") )
                     ;;
             esac
             ;;
@@ -72,19 +123,104 @@ _venv() {
                     COMPREPLY+=( $(compgen -f -X '!(*.txt)' -- "${cur_word}" | sort) )
                     compopt -o plusdirs +o nosort  # Add directories after generated completions
                     ;;
+                "--pip-args")
+                    # Nothing to generate
+                    ;;
                 *)
+                    if [[ "${cur_word}" != -* ]]; then
+                        # Generate completions for the names of the packages in the requirements file
+                        COMPREPLY+=( $(compgen -W "$(_venv_requirement_names)" -- "${cur_word}") )
+                    fi
                     COMPREPLY+=( ${help_options[*]} )
-                    COMPREPLY+=( $(compgen -W "-r --requirement -s --skip-lock --pip-args" -- "${cur_word}") )
+                    COMPREPLY+=( $(compgen -W "-r --requirement -s --skip-lock --full-reinstall --clean --pip-args" -- "${cur_word}") )
                     ;;
             esac
             ;;
         "lock")
+            case "${prev_word}" in
+                "-r" | "--requirement")
+                    # Generate completions for requirement file paths
+                    COMPREPLY+=( $(compgen -f -X '!(*.txt)' -- "${cur_word}" | sort) )
+                    compopt -o plusdirs +o nosort  # Add directories after generated completions
+                    ;;
+                *)
+                    # Generate completions for lock file paths
+                    COMPREPLY+=( $(compgen -f -X '!(*.lock)' -- "${cur_word}" | sort) )
+                    COMPREPLY+=( ${help_options[*]} )
+                    COMPREPLY+=( $(compgen -W "-r --requirement --verify" -- "${cur_word}") )
+                    compopt -o plusdirs +o nosort  # Add directories after generated completions
+                    ;;
+            esac
+            ;;
+        "status")
             # Generate completions for lock file paths
             COMPREPLY+=( $(compgen -f -X '!(*.lock)' -- "${cur_word}" | sort) )
             COMPREPLY+=( ${help_options[*]} )
+            COMPREPLY+=( $(compgen -W "-q --quiet" -- "${cur_word}") )
+            compopt -o plusdirs +o nosort  # Add directories after generated completions
+            ;;
+        "trace")
+            # Generate trace commands directly after 'venv trace', and trace files after 'venv trace summary'
+            if [ "${COMP_CWORD}" -eq 2 ]; then
+                COMPREPLY+=( $(compgen -W "summary" -- "${cur_word}") )
+                COMPREPLY+=( ${help_options[*]} )
+            elif [ "${COMP_CWORD}" -eq 3 ]; then
+                COMPREPLY+=( $(compgen -f -- "${cur_word}" | sort) )
+                compopt -o plusdirs +o nosort  # Add directories after generated completions
+            fi
+            ;;
+        "cache")
+            # Generate cache commands directly after 'venv cache', and options after 'venv cache names'
+            if [ "${COMP_CWORD}" -eq 2 ]; then
+                COMPREPLY+=( $(compgen -W "info prune purge names" -- "${cur_word}") )
+                COMPREPLY+=( ${help_options[*]} )
+            elif [ "${COMP_CWORD}" -eq 3 ] && [ "${COMP_WORDS[2]}" == "names" ]; then
+                COMPREPLY+=( $(compgen -W "--fetch" -- "${cur_word}") )
+            fi
+            ;;
+        "pack")
+            # Generate completions for archive paths
+            COMPREPLY+=( $(compgen -f -X '!(*.tar*)' -- "${cur_word}" | sort) )
+            COMPREPLY+=( ${help_options[*]} )
+            COMPREPLY+=( $(compgen -W "--strip" -- "${cur_word}") )
             compopt -o plusdirs +o nosort  # Add directories after generated completions
             ;;
-        "activate"|"deactivate"|"clear")
+        "unpack")
+            # Generate completions for the archive, then for the environment folder
+            if [ "${COMP_CWORD}" -eq 2 ]; then
+                COMPREPLY+=( $(compgen -f -X '!(*.tar*)' -- "${cur_word}" | sort) )
+                COMPREPLY+=( ${help_options[*]} )
+                compopt -o plusdirs +o nosort  # Add directories after generated completions
+            elif [ "${COMP_CWORD}" -eq 3 ]; then
+                COMPREPLY+=( $(compgen -d -- "${cur_word}") )
+            fi
+            ;;
+        "profile-imports")
+            case "${prev_word}" in
+                "-n"|"--runs")
+                    # Nothing to generate
+                    ;;
+                "--json")
+                    COMPREPLY+=( $(compgen -f -X '!(*.json)' -- "${cur_word}" | sort) )
+                    compopt -o plusdirs +o nosort  # Add directories after generated completions
+                    ;;
+                *)
+                    # Generate completions for scripts
+                    COMPREPLY+=( $(compgen -f -X '!(*.py)' -- "${cur_word}" | sort) )
+                    COMPREPLY+=( ${help_options[*]} )
+                    COMPREPLY+=( $(compgen -W "-n --runs --json" -- "${cur_word}") )
+                    compopt -o plusdirs +o nosort  # Add directories after generated completions
+                    ;;
+            esac
+            ;;
+        "store")
+            # Generate store commands directly after 'venv store'
+            if [ "${COMP_CWORD}" -eq 2 ]; then
+                COMPREPLY+=( $(compgen -W "info gc" -- "${cur_word}") )
+                COMPREPLY+=( ${help_options[*]} )
+            fi
+            ;;
+        "activate"|"deactivate"|"clear"|"rollback")
             # Only generate help options
             COMPREPLY+=( ${help_options[*]} )
             ;;
@@ -1,28 +1,184 @@
 #compdef venv
 
-local curcontext="${curcontext}" state line
-typeset -A opt_args
-
-# List of available options
-local -a subcommands=("create" "activate" "install" "lock" "clear" "deactivate" "-V" "--version")
-local -a command_options=("-h" "--help")
-local -a all=("${subcommands[@]} ${command_options[@]}")
-
-case "${words}[2]" in
-    "${subcommands}")
-        # Complete the options if the second word matches any of the available options
-        _describe "option" command_options
-        ;;
-    *)
-        case "${words}[1]" in
-            venv)
-                # Complete the base command options if the first word is "venv"
-                _describe "option" all
-                ;;
-            # *)
-            #     # If none of the above matches, complete file paths
-            #     _files
-            #     ;;
-        esac
-        ;;
-esac
+# zsh completion for venv
+
+_venv_package_names() {
+    # Print the names of known packages starting with the given prefix, from the sorted file of package names kept
+    # by 'venv install' and 'venv cache names'. 'look' finds them using a binary search, if it is installed.
+    # This never contacts the package index, so completion stays fast.
+    local names_file="${XDG_CACHE_HOME:-${HOME}/.cache}/venv-cli/package-names"
+    local prefix="${1:l}"
+    prefix="${prefix//[_.]/-}"
+    if [[ ! -f "${names_file}" || ! "${prefix}" =~ '^[a-z0-9-]*$' ]]; then
+        return
+    fi
+
+    if (( ${+commands[look]} )); then
+        LC_ALL=C look -- "${prefix}" "${names_file}" | head -n 1000
+    else
+        LC_ALL=C grep -m 1000 "^${prefix}" "${names_file}"
+    fi
+}
+
+_venv_requirement_names() {
+    # Print the names of the packages in the requirements file given with '-r' on the command line,
+    # or in 'requirements.txt'
+    local requirements_file="requirements.txt"
+    local option_index="${words[(I)(-r|--requirement)]}"
+    if (( option_index )); then
+        requirements_file="${words[option_index + 1]}"
+    fi
+
+    if [[ -f "${requirements_file}" ]]; then
+        sed -E -n 's/^[[:space:]]*([A-Za-z0-9][A-Za-z0-9._-]*)[[:space:]]*([][<>=!~;@(,].*)?$/\1/p' "${requirements_file}"
+    fi
+}
+
+_venv_python_versions() {
+    # Print the python versions available for 'venv create', from the registry of python interpreters on $PATH
+    # if venv-cli has been loaded, or else from the python3.X commands on $PATH
+    if (( ${+functions[venv::_python_registry]} )); then
+        tail -n +2 "$(venv::_python_registry)" | cut -f 1 | sort -V
+    else
+        print -l ${${(k)commands[(I)python3.<->]}#python} | sort -V
+    fi
+}
+
+_venv_install_packages() {
+    local -a package_names
+    package_names=( ${(f)"$(_venv_package_names "${PREFIX}")"} )
+    _describe -t packages "package" package_names
+}
+
+_venv_uninstall_packages() {
+    local -a package_names
+    package_names=( ${(f)"$(_venv_requirement_names)"} )
+    _describe -t packages "package" package_names
+}
+
+_venv() {
+    local curcontext="${curcontext}" state line
+    typeset -A opt_args
+
+    local -a subcommands=(
+        "create:Create a new virtual environment in the current folder"
+        "activate:Activate the virtual environment in the current folder"
+        "delete:Delete the virtual environment in the current folder"
+        "install:Install packages, or requirements from a requirements file, in the current environment"
+        "uninstall:Uninstall packages from the current environment and reinstall from a requirements file"
+        "lock:Lock installed requirements in a '.lock'-file"
+        "rollback:Restore the environment replaced by 'venv install --atomic'"
+        "status:Check whether the installed packages match a '.lock'-file"
+        "clear:Remove all installed packages in the current environment"
+        "cache:Show information about, or clean up, the wheelhouse shared by all environments"
+        "pack:Pack the current environment into a compressed archive, which can be unpacked anywhere"
+        "unpack:Unpack an environment packed with 'venv pack'"
+        "profile-imports:Show how long importing a module or running a script spends importing each installed package"
+        "store:Show information about, or clean up, the store of installed files shared by all environments"
+        "trace:Show how long each phase of the venv commands took"
+        "deactivate:Deactivate the currently activated virtual environment"
+    )
+    local -a help_option=( '(- *)'{-h,--help}'[Show help and exit]' )
+
+    _arguments -C \
+        "${help_option[@]}" \
+        '(- *)'{-V,--version}'[Show the venv-cli version number and exit]' \
+        '1: :->subcommand' \
+        '*:: :->args'
+
+    case "${state}" in
+        subcommand)
+            _describe -t commands "command" subcommands
+            ;;
+        args)
+            curcontext="${curcontext%:*:*}:venv-${words[1]}:"
+            case "${words[1]}" in
+                create)
+                    _arguments \
+                        "${help_option[@]}" \
+                        "--no-template[Create the environment using 'python -m venv' instead of copying a template]" \
+                        "1:python version:(${(f)$(_venv_python_versions)})" \
+                        "2:environment name:"
+                    ;;
+                delete)
+                    _arguments "${help_option[@]}" "-y[Don't ask for confirmation]"
+                    ;;
+                install)
+                    _arguments \
+                        "${help_option[@]}" \
+                        {-r,--requirement}'[Install from the given requirements file]:requirements file:_files -g "*.(txt|lock)"' \
+                        {-s,--skip-lock}'[Skip locking packages to a .lock-file after installation]' \
+                        "--clean[Clear the entire environment before installing]" \
+                        "--no-wheelhouse[Don't use or fill the local wheelhouse]" \
+                        "--refresh[Resolve the requirements again, even if they are unchanged]" \
+                        {-j,--jobs}'[Number of parallel downloads]:jobs:' \
+                        "--pip-args[Additional arguments to pass through to pip install]:pip arguments:" \
+                        "--atomic[Install into a copy of the environment and swap it into place]" \
+                        "--store[Hardlink the installed files to the store shared by all environments]" \
+                        '--base=-[Install a .lock-file into a shared base environment, and the rest on top of it]::base lock file:_files -g "*.lock"' \
+                        "(--no-compile)--compile=-[Compile the bytecode in parallel after installing]::jobs:" \
+                        "(--compile)--no-compile[Don't compile the bytecode of the installed packages]" \
+                        "*:package:_venv_install_packages"
+                    ;;
+                uninstall)
+                    _arguments \
+                        "${help_option[@]}" \
+                        {-r,--requirement}'[Remove the packages from the given requirements file]:requirements file:_files -g "*.txt"' \
+                        {-s,--skip-lock}'[Skip locking packages to a .lock-file after uninstalling]' \
+                        "--full-reinstall[Reinstall the environment instead of only uninstalling orphaned packages]" \
+                        "--clean[Clear the entire environment and reinstall it]" \
+                        "--pip-args[Additional arguments to pass through to pip install]:pip arguments:" \
+                        "*:package:_venv_uninstall_packages"
+                    ;;
+                lock)
+                    _arguments \
+                        "${help_option[@]}" \
+                        {-r,--requirement}'[Restore credentials from the given requirements file]:requirements file:_files -g "*.txt"' \
+                        "--verify[Compare the lock file with the output of 'pip freeze']" \
+                        '1:lock file:_files -g "*.lock"'
+                    ;;
+                status)
+                    _arguments \
+                        "${help_option[@]}" \
+                        {-q,--quiet}"[Don't print anything, only set the exit code]" \
+                        '1:lock file:_files -g "*.lock"'
+                    ;;
+                trace)
+                    _arguments "${help_option[@]}" "1:trace command:(summary)" "2:trace file:_files"
+                    ;;
+                cache)
+                    if [[ "${words[2]}" == names ]]; then
+                        _arguments "1:cache command:(names)" "2::option:(--fetch)"
+                    else
+                        _arguments "${help_option[@]}" "1:cache command:(info prune purge names)"
+                    fi
+                    ;;
+                pack)
+                    _arguments \
+                        "${help_option[@]}" \
+                        "--strip[Leave out bytecode, and the tests and docs folders of the installed packages]" \
+                        '1:archive:_files -g "*.tar*"'
+                    ;;
+                unpack)
+                    _arguments "${help_option[@]}" '1:archive:_files -g "*.tar*"' "2:environment folder:_directories"
+                    ;;
+                profile-imports)
+                    _arguments \
+                        "${help_option[@]}" \
+                        {-n,--runs}'[Number of times to import the module or run the script]:runs:' \
+                        '--json[Write the full report to the given file]:report file:_files -g "*.json"' \
+                        '1:module or script:_files -g "*.py"' \
+                        '*::script arguments:_files'
+                    ;;
+                store)
+                    _arguments "${help_option[@]}" "1:store command:(info gc)"
+                    ;;
+                activate|deactivate|clear|rollback)
+                    _arguments "${help_option[@]}"
+                    ;;
+            esac
+            ;;
+    esac
+}
+
+_venv "$@"
@@ -0,0 +1,14 @@
+#!/bin/bash
+
+# Lightweight stand-in for the 'venv' command, sourced by the shell rc-file instead of the full venv.sh script.
+# Sourcing the full script on every shell startup is slow, so it is only sourced the first time 'venv' is used.
+# The full script then replaces this 'venv' function, along with every 'venv::' function.
+# Set $VENV_CLI_SCRIPT to load the full script from a different location.
+
+venv() {
+  if ! source "${VENV_CLI_SCRIPT:-/usr/local/share/venv/venv.sh}"; then
+    echo "Could not load venv-cli from '${VENV_CLI_SCRIPT:-/usr/local/share/venv/venv.sh}'" >&2
+    return 1
+  fi
+  venv "$@"
+}
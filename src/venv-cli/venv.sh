@@ -11,6 +11,33 @@ _red="\033[31m"
 # Version number has to follow pattern "^v\d+\.\d+\.\d+.*$"
 _version="v2.0.0"
 
+# Cache folder shared by all environments, and the wheelhouse inside it
+_cache_dir="${XDG_CACHE_HOME:-${HOME}/.cache}/venv-cli"
+_wheelhouse_dir="${VENV_CLI_WHEELHOUSE:-${_cache_dir}/wheels}"
+_wheelhouse_max_size="${VENV_CLI_WHEELHOUSE_MAX_SIZE:-10G}"
+_vcs_cache_dir="${_cache_dir}/vcs"
+_templates_dir="${_cache_dir}/templates"
+_resolutions_dir="${_cache_dir}/resolutions"
+_bases_dir="${_cache_dir}/bases"
+_python_registry_file="${_cache_dir}/pythons.tsv"
+
+# Content-addressed store of installed files, hardlinked into the environments by 'venv install --store'
+_store_dir="${VENV_CLI_STORE:-${_cache_dir}/store}"
+
+# Sorted package names used for completing 'venv install', and the names listed by the package index
+_package_names_file="${_cache_dir}/package-names"
+_index_names_file="${_cache_dir}/index-names"
+
+# Number of parallel downloads when installing from a .lock-file
+_default_jobs="${VENV_CLI_JOBS:-8}"
+
+# Advisory locks on environments and requirements files, held by the running venv commands,
+# and the number of seconds to wait for another venv command to release them
+_lock_dir="${XDG_RUNTIME_DIR:-${TMPDIR:-/tmp}}/venv-cli-${UID}"
+_lock_timeout="${VENV_CLI_LOCK_TIMEOUT:-600}"
+_held_locks=""
+_template_prompt="__venv_cli_template__"
+
 # Valid VCS URL environment variable pattern
 # https://peps.python.org/pep-0610/#specification
 _env_var_auth_pattern='\${[-_A-Za-z0-9]+}(:\${[-_A-Za-z0-9]+})?'
@@ -87,17 +114,1892 @@ venv::_get_requirements_from_lock() {
   echo "${lock_file/.lock/.txt}"
 }
 
+venv::_state_dir() {
+  ### Print the path of the folder inside the active environment where venv-cli keeps its state,
+  ### creating it if it does not exist
+  local state_dir="${VIRTUAL_ENV}/.venv-cli"
+  mkdir -p "${state_dir}"
+  echo "${state_dir}"
+}
+
+venv::_timestamp_us() {
+  ### Print the current time in microseconds since the epoch
+  if [ -n "${EPOCHREALTIME}" ]; then
+    # Bash 5 and zsh (with the zsh/datetime module) provide the time without starting a process
+    local timestamp="${EPOCHREALTIME/[.,]/}"
+    echo "${timestamp:0:16}"
+  else
+    date +%s%6N
+  fi
+}
+
+venv::_trace() {
+  ### Run the command given by the remaining arguments as the phase <name>, and return its exit code.
+  ### If $VENV_CLI_TRACE is set to a file path, a Chrome trace event with the start time, duration, exit code and
+  ### number of installed packages of the phase is appended to that file as a JSON line
+  local name="$1"
+  shift
+  if [ -z "${VENV_CLI_TRACE}" ]; then
+    "$@"
+    return "$?"
+  fi
+
+  local start="$(venv::_timestamp_us)"
+  "$@"
+  local exit_code="$?"
+  local end="$(venv::_timestamp_us)"
+
+  local installed_packages="null"
+  if [ -n "${VIRTUAL_ENV}" ]; then
+    installed_packages="$(find "${VIRTUAL_ENV}"/lib/python*/site-packages -maxdepth 1 -name '*.dist-info' 2> /dev/null | wc -l)"
+  fi
+  printf '{"name": "%s", "cat": "venv-cli", "ph": "X", "ts": %s, "dur": %s, "pid": %s, "tid": %s, "args": {"exit_code": %s, "installed_packages": %s}}\n' \
+    "${name}" "${start}" "$((end - start))" "$$" "$$" "${exit_code}" "${installed_packages// /}" >> "${VENV_CLI_TRACE}"
+  return "${exit_code}"
+}
+
+venv::_lock_file() {
+  ### Print the path of the lock file for <path>, named by a checksum of the absolute path
+  local path_checksum="$(realpath -m -- "$1" | cksum)"
+  echo "${_lock_dir}/${path_checksum%% *}.lock"
+}
+
+venv::_holds_lock() {
+  ### Succeed if this venv command, or a venv command calling it, already holds the lock on <path>
+  local lock_file="$(venv::_lock_file "$1")"
+  [[ "${_held_locks}" == *"${lock_file}"* ]]
+}
+
+venv::_with_lock() {
+  ### Run the command given by the remaining arguments while holding a 'shared' or 'exclusive' advisory lock on
+  ### <path>, waiting up to $VENV_CLI_LOCK_TIMEOUT seconds for other venv commands to release it, and return
+  ### its exit code. Commands that only read the environment share the lock, while commands changing it
+  ### wait for each other. The command is run without a lock if <mode> or <path> is empty, if the lock is
+  ### already held further up the call stack, or if 'flock' is not installed
+  local mode="$1"
+  local path="$2"
+  shift 2
+  if [ -z "${mode}" ] || [ -z "${path}" ] || venv::_holds_lock "${path}"; then
+    "$@"
+    return "$?"
+  fi
+
+  # The lock is held until the command returns, including by venv commands it calls, which won't lock it again
+  local lock_file="$(venv::_lock_file "${path}")"
+  local _held_locks="${_held_locks}${lock_file}"$'\n'
+  if ! command -v flock > /dev/null; then
+    "$@"
+    return "$?"
+  fi
+
+  local flock_mode="--shared"
+  if [ "${mode}" = "exclusive" ]; then
+    flock_mode="--exclusive"
+  fi
+
+  local lock_fd
+  mkdir -p -m 700 "${_lock_dir}" && exec {lock_fd}>> "${lock_file}" || return "${_fail}"
+  if ! flock "${flock_mode}" --nonblock "${lock_fd}"; then
+    venv::color_echo "${_yellow}" "Waiting for another venv command using ${path} to finish ..."
+    if ! venv::_trace "wait for lock" flock "${flock_mode}" --wait "${_lock_timeout}" "${lock_fd}"; then
+      exec {lock_fd}>&-
+      venv::raise "Timed out after ${_lock_timeout} seconds waiting for another venv command using ${path}. Set \$VENV_CLI_LOCK_TIMEOUT to wait longer"
+      return "$?"
+    fi
+  fi
+
+  "$@"
+  local exit_code="$?"
+  flock --unlock "${lock_fd}"
+  exec {lock_fd}>&-
+  return "${exit_code}"
+}
+
+venv::_python_helper() {
+  ### Run one of the embedded python helpers, e.g. 'venv::_python_helper stale-packages <target file>'.
+  ### Runs with the 'python' on $PATH, which is the environment python when an environment is activated,
+  ### falling back to 'python3' for the helpers that do not need an environment.
+  ### The helpers may only use the python standard library, so no packages are needed to run them.
+  local python="python"
+  if ! command -v python > /dev/null; then
+    python="python3"
+  fi
+  "${python}" -I - "$@" <<'EOF'
+import json
+import os
+import re
+import sys
+import sysconfig
+
+# Modules that are slow to import are imported by the helpers that need them,
+# so that quick helpers like 'status' start in a few milliseconds
+
+_always_installed = {"pip", "setuptools", "wheel"}
+
+# The options of 'pip install' choosing where packages are found, which also apply to 'pip wheel' and 'pip download'
+_index_options = {"-i", "--index-url", "--extra-index-url", "-f", "--find-links", "--trusted-host", "--cert"}
+_index_options |= {"--client-cert", "--proxy", "--timeout", "--retries"}
+
+# The .pth-file pointing a layered environment at the site-packages of its base environment
+_base_pth_file = "_venv_cli_base.pth"
+
+# A line written by 'python -X importtime': self and cumulative microseconds, then the module indented by its depth
+_importtime_pattern = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+_name_version_pattern = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[[^\]]*\])?\s*===?\s*([^\s;#]+)")
+_direct_reference_pattern = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[[^\]]*\])?\s*@\s*([^\s;]+)")
+_requirement_name_pattern = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?=[\[(<>=!~;@,#]|$)")
+# Lines of a requirements file adding requirements, rather than setting options
+_requirement_option_pattern = re.compile(r"^(-r|--requirement|-c|--constraint|-e|--editable)(?=[\s=]|$)")
+_egg_pattern = re.compile(r"[#&]egg=([A-Za-z0-9][A-Za-z0-9._-]*)")
+_url_auth_pattern = re.compile(r"(?<=://)[^/@]*@")
+_env_var_auth_pattern = re.compile(r"(?<=://)\$\{[-_A-Za-z0-9]+\}(?::\$\{[-_A-Za-z0-9]+\})?@")
+
+
+def canonicalize_name(name):
+    """PEP 503 normalized name of a distribution"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def strip_url_auth(url):
+    """Remove the 'user:password@' part of a URL, including '${USER}:${PASS}@' placeholders"""
+    return _url_auth_pattern.sub("", url)
+
+
+def normalize_version(version):
+    """The normalized form of a PEP 440 version, e.g. '1.0.0b1' for '1.0.0-beta1', or None if it is not valid"""
+    if re.match(r"^(0|[1-9][0-9]*)(\.(0|[1-9][0-9]*))*$", version):
+        # Release versions are already normalized, avoid importing packaging
+        return version
+    try:
+        from pip._vendor.packaging.version import InvalidVersion, Version
+    except ImportError:
+        return version
+    try:
+        return str(Version(version))
+    except InvalidVersion:
+        return None
+
+
+def site_packages():
+    """The site-packages folders of the running environment"""
+    paths = sysconfig.get_paths()
+    return list(dict.fromkeys([paths["purelib"], paths["platlib"]]))
+
+
+def base_site_packages():
+    """The site-packages folders of the base environment, if the running environment is a layer on top of one"""
+    paths = []
+    for site_dir in site_packages():
+        try:
+            with open(os.path.join(site_dir, _base_pth_file)) as file:
+                paths.extend(line.strip() for line in file if line.strip())
+        except FileNotFoundError:
+            pass
+    return list(dict.fromkeys(paths))
+
+
+def environment_site_packages():
+    """The site-packages folders of the running environment, followed by the ones of its base environment, if any"""
+    return site_packages() + base_site_packages()
+
+
+def installed_distributions(paths=None):
+    """
+    All distributions installed in the environment, or in the given site-packages folders,
+    except the ones 'venv clear' leaves in place
+    """
+    from importlib import metadata
+
+    seen = set()
+    for dist in metadata.distributions(path=site_packages() if paths is None else paths):
+        name = canonicalize_name(dist.metadata["Name"] or "")
+        if not name or name in seen or name in _always_installed:
+            continue
+        seen.add(name)
+        yield name, dist
+
+
+def direct_reference(name, direct_url):
+    """Format a PEP 610 'direct_url.json' dict the same way 'pip freeze' does, e.g. 'name @ git+https://...@<commit>'"""
+    url = direct_url["url"]
+    fragments = []
+    if "vcs_info" in direct_url:
+        vcs_info = direct_url["vcs_info"]
+        url = f"{vcs_info['vcs']}+{url}@{vcs_info['commit_id']}"
+    elif "archive_info" in direct_url:
+        archive_hash = direct_url["archive_info"].get("hash")
+        if archive_hash:
+            fragments.append(archive_hash)
+    if direct_url.get("subdirectory"):
+        fragments.append(f"subdirectory={direct_url['subdirectory']}")
+    if fragments:
+        url += "#" + "&".join(fragments)
+    return f"{name} @ {url}"
+
+
+def cached_vcs_direct_url(direct_url):
+    """
+    Wheels built from VCS requirements are cached next to the 'direct_url.json' pip would have recorded
+    when installing directly from VCS. For a wheel from that cache, return the original 'direct_url.json'
+    """
+    if not direct_url or not direct_url["url"].startswith("file://") or "archive_info" not in direct_url:
+        return direct_url
+
+    from urllib.parse import unquote, urlsplit
+
+    wheel_path = unquote(urlsplit(direct_url["url"]).path)
+    cached_direct_url = os.path.join(os.path.dirname(wheel_path), "direct_url.json")
+    if not wheel_path.endswith(".whl") or not os.path.isfile(cached_direct_url):
+        return direct_url
+    with open(cached_direct_url) as file:
+        return json.load(file)
+
+
+def requirement_key(name, version, direct_url):
+    """
+    Key identifying exactly what is installed for a distribution. Two distributions with the same key
+    are interchangeable, so a package only has to be reinstalled if its key changes.
+    """
+    name = canonicalize_name(name)
+    direct_url = cached_vcs_direct_url(direct_url)
+    if not direct_url:
+        return f"{name}=={normalize_version(version) or version}"
+    if direct_url.get("dir_info", {}).get("editable", False):
+        return f"-e {name}"
+    return strip_url_auth(direct_reference(name, direct_url))
+
+
+def installed_keys(paths=None):
+    """Map of installed distribution names to their requirement keys"""
+    keys = {}
+    for name, dist in installed_distributions(paths):
+        direct_url_json = dist.read_text("direct_url.json")
+        direct_url = json.loads(direct_url_json) if direct_url_json else None
+        keys[name] = requirement_key(name, dist.version, direct_url)
+    return keys
+
+
+def cached_installed_keys():
+    """
+    Map of installed distribution names to their requirement keys, cached in the environment until a
+    site-packages folder changes. Installing or removing a distribution always adds or removes a folder
+    in site-packages, which changes its modification time.
+    """
+    import tempfile
+
+    index_file = os.path.join(sys.prefix, ".venv-cli", "installed-index.json")
+    paths = environment_site_packages()
+    mtimes = [os.stat(path).st_mtime_ns if os.path.isdir(path) else 0 for path in paths]
+    try:
+        with open(index_file) as file:
+            index = json.load(file)
+        if index["paths"] == paths and index["mtimes"] == mtimes:
+            return index["keys"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    keys = installed_keys(paths)
+    try:
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(index_file), delete=False) as file:
+            json.dump({"paths": paths, "mtimes": mtimes, "keys": keys}, file)
+        os.replace(file.name, index_file)
+    except OSError:
+        pass
+    return keys
+
+
+def requirement_file_lines(requirements_file):
+    """Lines of a requirements file, with comments removed and '-r' includes expanded"""
+    if not os.path.isfile(requirements_file):
+        # Missing files are reported by pip
+        return
+    base_dir = os.path.dirname(requirements_file)
+    with open(requirements_file) as file:
+        for line in file:
+            line = re.sub(r"(^|\s)#.*$", "", line).strip()
+            include = re.match(r"^(?:-r|--requirement)(?:\s+|=)(.+)$", line)
+            if include:
+                yield from requirement_file_lines(os.path.join(base_dir, include.group(1).strip()))
+            elif line:
+                yield line
+
+
+def lock_file_requirements(lock_file):
+    """Map of distribution names to the requirement keys of every pinned requirement in a .lock-file"""
+    requirements = {}
+    for line in requirement_file_lines(lock_file):
+        name_version = _name_version_pattern.match(line)
+        direct = _direct_reference_pattern.match(line)
+        egg = _egg_pattern.search(line)
+        if name_version:
+            name = canonicalize_name(name_version.group(1))
+            requirements[name] = requirement_key(name, name_version.group(2), None)
+        elif direct and direct.group(3).startswith("file://"):
+            direct_url = {"url": direct.group(3), "archive_info": {}}
+            requirements[canonicalize_name(direct.group(1))] = requirement_key(direct.group(1), None, direct_url)
+        elif direct:
+            name = canonicalize_name(direct.group(1))
+            requirements[name] = strip_url_auth(f"{name} @ {direct.group(3)}")
+        elif re.match(r"^(-e|--editable)\s", line) and egg:
+            name = canonicalize_name(egg.group(1))
+            requirements[name] = f"-e {name}"
+    return requirements
+
+
+def lock_file_keys(lock_file):
+    """Requirement keys of every pinned requirement in a .lock-file"""
+    return set(lock_file_requirements(lock_file).values())
+
+
+def report_keys(report_file):
+    """Requirement keys of every distribution pip would install, read from a 'pip install --report' file"""
+    with open(report_file) as file:
+        report = json.load(file)
+
+    keys = set()
+    for item in report["install"]:
+        direct_url = item["download_info"] if item.get("is_direct", False) else None
+        keys.add(requirement_key(item["metadata"]["name"], item["metadata"]["version"], direct_url))
+    return keys
+
+
+def requirement_options(requirements_file):
+    """
+    Option lines of a requirements file, like '--index-url', which apply to every requirement.
+    Returns None if '--find-links' is given a path relative to the requirements file, which only works from its folder
+    """
+    options = []
+    for line in requirement_file_lines(requirements_file):
+        if not line.startswith("-") or _requirement_option_pattern.match(line):
+            continue
+        find_links = re.match(r"^(?:-f|--find-links)(?:\s+|=)?(\S+)$", line)
+        if find_links and "://" not in find_links.group(1) and not os.path.isabs(find_links.group(1)):
+            return None
+        options.append(line)
+    return options
+
+
+def report_lock(report_file, requirements_file):
+    """
+    Print the distributions pip would install, read from a 'pip install --report' file, pinned like a .lock-file,
+    so they can be installed without resolving the requirements again. Options of the requirements file, like
+    '--index-url', are printed before the pins. Returns 1 without printing anything if the requirements can not be
+    pinned this way: When they use hashes, which the pins would drop, local folders, which are built again when
+    installed, or '--find-links' with a path relative to the requirements file.
+    """
+    for line in requirement_file_lines(requirements_file):
+        if re.search(r"(^|\s)--(hash|require-hashes)\b", line):
+            return 1
+    options = requirement_options(requirements_file)
+    if options is None:
+        return 1
+
+    with open(report_file) as file:
+        report = json.load(file)
+
+    pins = []
+    for item in report["install"]:
+        name, version = item["metadata"]["name"], item["metadata"]["version"]
+        if not item.get("is_direct", False):
+            pins.append(f"{name}=={version}")
+        elif "dir_info" in item["download_info"]:
+            return 1
+        else:
+            pins.append(direct_reference(name, item["download_info"]))
+
+    for line in options + sorted(pins, key=str.lower):
+        print(line)
+    return 0
+
+
+def stale_packages(target_file, report_file=None):
+    """
+    Print the names of installed distributions that are not part of the target set, either because they
+    are not needed anymore, or because a different version (or source) is required. In a layered environment,
+    distributions also installed in the same version in the base environment are not needed either.
+    """
+    target_keys = report_keys(report_file) if report_file else lock_file_keys(target_file)
+    base_keys = set(installed_keys(base_site_packages()).values())
+    for name, key in sorted(installed_keys().items()):
+        if key not in target_keys or key in base_keys:
+            print(name)
+
+
+def freeze_version(version):
+    """'==<version>' as 'pip freeze' writes it, normalized, or '===<version>' if it is not a valid PEP 440 version"""
+    normalized_version = normalize_version(version)
+    return f"=={normalized_version}" if normalized_version else f"==={version}"
+
+
+def env_var_auth(reference_file):
+    """
+    Map of distribution names to the '${USER}:${PASS}@' placeholders used for their URLs in a requirements file.
+    pip expands the placeholders on installation, so they are lost from the recorded 'direct_url.json'
+    """
+    auth = {}
+    for line in requirement_file_lines(reference_file) if reference_file else []:
+        direct = _direct_reference_pattern.match(line)
+        egg = _egg_pattern.search(line)
+        name = direct.group(1) if direct else egg.group(1) if egg else None
+        placeholder = _env_var_auth_pattern.search(line)
+        if name and placeholder:
+            auth[canonicalize_name(name)] = placeholder.group(0)
+    return auth
+
+
+def freeze(reference_file=None, include_required=""):
+    """
+    Print the installed distributions exactly like 'pip freeze' does, but by reading their metadata directly
+    instead of starting pip. Credentials placeholders for direct URLs are restored from the reference
+    requirements file, if one is given. Editable installs need pip's VCS detection, so 'pip freeze'
+    is used when there are any. With 'include_required', the distributions 'pip freeze' leaves out
+    (e.g. 'wheel') are printed anyway if they were resolved, i.e. the reference requirements file
+    or any installed distribution requires them, and the options of the reference requirements file,
+    like '--index-url', are printed first, so the output can be installed without the requirements file.
+    """
+    from importlib import metadata
+
+    skip = {"pip"} | ({"setuptools", "distribute", "wheel"} if sys.version_info < (3, 12) else set())
+    if include_required and reference_file:
+        skip -= {canonicalize_name(requirement_name(line) or "") for line in requirement_file_lines(reference_file)}
+        for dist in metadata.distributions(path=environment_site_packages()):
+            skip -= {canonicalize_name(requirement.name) for requirement in requirements_of(dist) or []}
+        for line in requirement_options(reference_file) or []:
+            print(line)
+    auth = env_var_auth(reference_file)
+    requirements = {}
+    for dist in metadata.distributions():
+        name = dist.metadata["Name"]
+        canonical_name = canonicalize_name(name or "")
+        if not canonical_name or canonical_name in requirements or canonical_name in skip:
+            continue
+        direct_url_json = dist.read_text("direct_url.json")
+        direct_url = json.loads(direct_url_json) if direct_url_json else None
+        if direct_url and direct_url.get("dir_info", {}).get("editable", False):
+            return freeze_with_pip()
+        if not direct_url:
+            requirements[canonical_name] = (name, f"{name}{freeze_version(dist.version)}")
+            continue
+        requirement = direct_reference(name, direct_url)
+        if canonical_name in auth and not _url_auth_pattern.search(direct_url["url"]):
+            requirement = requirement.replace("://", f"://{auth[canonical_name]}", 1)
+        requirements[canonical_name] = (name, requirement)
+
+    # Legacy editable installs ('setup.py develop') are only known to pip
+    for site_dir in site_packages():
+        if os.path.isdir(site_dir) and any(entry.endswith(".egg-link") for entry in os.listdir(site_dir)):
+            return freeze_with_pip()
+
+    for _, requirement in sorted(requirements.values(), key=lambda item: item[0].lower()):
+        print(requirement)
+    return 0
+
+
+def freeze_with_pip():
+    """Print the installed distributions with 'pip freeze'"""
+    import subprocess
+
+    sys.stdout.flush()
+    return subprocess.run([sys.executable, "-m", "pip", "freeze", "--require-virtualenv"]).returncode
+
+
+def requirements_of(dist, extra=""):
+    """
+    The parsed 'Requires-Dist' requirements of a distribution that apply to this environment,
+    when installed with the given extra. Returns None if 'packaging' (vendored by pip) is not available.
+    """
+    try:
+        from pip._vendor.packaging.requirements import InvalidRequirement, Requirement
+    except ImportError:
+        return None
+
+    requirements = []
+    for requirement_string in dist.requires or []:
+        try:
+            requirement = Requirement(requirement_string)
+        except InvalidRequirement:
+            continue
+        if requirement.marker is None or requirement.marker.evaluate({"extra": extra}):
+            requirements.append(requirement)
+    return requirements
+
+
+def check_dependencies():
+    """
+    Check that the dependencies in the 'Requires-Dist' metadata of every installed distribution are installed
+    in a matching version, like 'pip check' does. Prints every unmet dependency and returns 1 if there are any.
+    """
+    from importlib import metadata
+
+    installed = {}
+    for dist in metadata.distributions(path=environment_site_packages()):
+        installed.setdefault(canonicalize_name(dist.metadata["Name"] or ""), dist)
+
+    problems = []
+    to_check = [(name, "") for name in sorted(installed)]
+    checked = set()
+    while to_check:
+        name, extra = to_check.pop()
+        if (name, extra) in checked or name not in installed:
+            continue
+        checked.add((name, extra))
+        dist = installed[name]
+        requirements = requirements_of(dist, extra)
+        if requirements is None:
+            import subprocess
+
+            return subprocess.run([sys.executable, "-m", "pip", "check"]).returncode
+
+        for requirement in requirements:
+            dependency = installed.get(canonicalize_name(requirement.name))
+            dist_name_version = f"{dist.metadata['Name']} {dist.version}"
+            if dependency is None:
+                problems.append(f"{dist_name_version} requires {requirement.name}, which is not installed.")
+            elif not requirement.specifier.contains(dependency.version, prereleases=True):
+                problems.append(
+                    f"{dist_name_version} has requirement {requirement}, "
+                    f"but you have {dependency.metadata['Name']} {dependency.version}."
+                )
+            else:
+                to_check.extend((canonicalize_name(requirement.name), extra) for extra in requirement.extras)
+
+    for problem in sorted(set(problems)):
+        print(problem)
+    return 1 if problems else 0
+
+
+def missing_always_installed():
+    """
+    Print a requirement for each of pip, setuptools and wheel that an installed distribution requires,
+    but that is not installed in a matching version. Like 'pip freeze', .lock-files leave these out,
+    so they are not installed along with the locked packages when dependencies are not resolved
+    """
+    from importlib import metadata
+
+    installed = {}
+    for dist in metadata.distributions(path=environment_site_packages()):
+        installed.setdefault(canonicalize_name(dist.metadata["Name"] or ""), dist)
+
+    required = {}
+    for dist in installed.values():
+        for requirement in requirements_of(dist) or []:
+            name = canonicalize_name(requirement.name)
+            if name in _always_installed:
+                required.setdefault(name, []).append(requirement)
+
+    for name, requirements in sorted(required.items()):
+        dependency = installed.get(name)
+        if dependency is None or not all(
+            requirement.specifier.contains(dependency.version, prereleases=True) for requirement in requirements
+        ):
+            print(name + ",".join(str(requirement.specifier) for requirement in requirements if requirement.specifier))
+    return 0
+
+
+def orphaned_packages(requirements_file):
+    """
+    Print the name of every installed distribution that is neither in the requirements file nor a dependency of one
+    that is, following the 'Requires-Dist' metadata of the installed distributions.
+    Returns 1 if not every requirement can be matched to an installed distribution, e.g. editable installs,
+    local paths or requirements that are not installed.
+    """
+    try:
+        from pip._vendor.packaging.requirements import InvalidRequirement, Requirement
+    except ImportError:
+        return 1
+
+    installed = dict(installed_distributions(environment_site_packages()))
+    to_visit = []
+    for line in requirement_file_lines(requirements_file):
+        if line.startswith(("-e", "--editable")):
+            return 1
+        elif line.startswith("-"):
+            # Options like '--index-url' don't name any packages
+            continue
+
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            egg = _egg_pattern.search(line)
+            if not egg:
+                return 1
+            requirement = Requirement(egg.group(1))
+        if requirement.marker is not None and not requirement.marker.evaluate({"extra": ""}):
+            continue
+        name = canonicalize_name(requirement.name)
+        if name not in installed and name not in _always_installed:
+            return 1
+        to_visit.extend((name, extra) for extra in ["", *requirement.extras])
+
+    required = set()
+    visited = set()
+    while to_visit:
+        name, extra = to_visit.pop()
+        if (name, extra) in visited or name not in installed:
+            continue
+        visited.add((name, extra))
+        required.add(name)
+        for requirement in requirements_of(installed[name], extra):
+            dependency = canonicalize_name(requirement.name)
+            to_visit.extend((dependency, dependency_extra) for dependency_extra in ["", *requirement.extras])
+
+    for name in sorted(set(installed) - required):
+        print(name)
+    return 0
+
+
+def status(lock_file):
+    """
+    Print every difference between the installed distributions and a .lock-file: Requirements that are not
+    installed, installed distributions that are not in the .lock-file, and distributions installed in a
+    different version or from a different source. Returns 1 if there are any differences.
+    """
+    locked = lock_file_requirements(lock_file)
+    installed = cached_installed_keys()
+    differences = []
+    for name in sorted(locked.keys() | installed.keys()):
+        if name not in installed:
+            differences.append(f"missing:    {locked[name]}")
+        elif name not in locked:
+            differences.append(f"extra:      {installed[name]}")
+        elif locked[name] != installed[name]:
+            differences.append(f"mismatched: {locked[name]} (installed: {installed[name]})")
+
+    for difference in differences:
+        print(f"  {difference}")
+    return 1 if differences else 0
+
+
+def requirement_name(line):
+    """The name given in a requirement specifier, or None for comments, options and URLs"""
+    match = _requirement_name_pattern.match(line)
+    return match.group(1) if match else None
+
+
+def read_requirements(requirements_file):
+    """The lines of the requirements file, and the normalized name of the requirement on each line, or None"""
+    lines = []
+    if os.path.isfile(requirements_file):
+        with open(requirements_file) as f:
+            lines = f.read().splitlines()
+    names = [requirement_name(line) for line in lines]
+    return lines, [name and canonicalize_name(name) for name in names]
+
+
+def write_requirements(requirements_file, lines):
+    """
+    Write the lines to the requirements file in one step, sorted like 'LC_COLLATE=C sort --ignore-case --stable',
+    which puts lines beginning with '-' first
+    """
+    import stat
+
+    lines = sorted((line for line in lines if line is not None), key=lambda line: line.encode().upper())
+    tmp_file = f"{requirements_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        f.writelines(f"{line}\n" for line in lines)
+    if os.path.exists(requirements_file):
+        os.chmod(tmp_file, stat.S_IMODE(os.stat(requirements_file).st_mode))
+    os.replace(tmp_file, requirements_file)
+
+
+def add_requirements(requirements_file, *specs):
+    """
+    Add the requirement specifiers to the requirements file in a single pass, replacing the requirement of the same
+    package if there is one. For every specifier, prints 'added', 'replaced' or 'unparsed', the package name
+    (or '-') and the specifier, separated by tabs.
+    """
+    lines, keys = read_requirements(requirements_file)
+    for spec in specs:
+        name = requirement_name(spec)
+        key = name and canonicalize_name(name)
+        if key and key in keys:
+            print(f"replaced\t{name}\t{spec}")
+            # Replace the first requirement of the package, and remove any others
+            first = keys.index(key)
+            for index in range(first + 1, len(keys)):
+                if keys[index] == key:
+                    lines[index] = keys[index] = None
+            lines[first] = spec
+        else:
+            print(f"added\t{name}\t{spec}" if name else f"unparsed\t-\t{spec}")
+            lines.append(spec)
+            keys.append(key)
+    write_requirements(requirements_file, lines)
+
+
+def remove_requirements(requirements_file, *names):
+    """
+    Remove the requirements of the packages from the requirements file in a single pass.
+    For every package, prints 'removed' or 'missing' and the package name, separated by tabs.
+    """
+    lines, keys = read_requirements(requirements_file)
+    removed = False
+    for name in names:
+        key = canonicalize_name(requirement_name(name) or name)
+        if key not in keys:
+            print(f"missing\t{name}")
+            continue
+        for index, line_key in enumerate(keys):
+            if line_key == key:
+                lines[index] = keys[index] = None
+        removed = True
+        print(f"removed\t{name}")
+    if removed:
+        write_requirements(requirements_file, lines)
+
+
+def included_requirement_files(requirements_file):
+    """The requirements file itself, and every file it includes with '-r' or '-c', recursively"""
+    yield requirements_file
+    if not os.path.isfile(requirements_file):
+        return
+
+    base_dir = os.path.dirname(requirements_file)
+    with open(requirements_file) as file:
+        for line in file:
+            include = re.match(r"^\s*(?:-r|--requirement|-c|--constraint)(?:\s+|=)(\S+)", line)
+            if include:
+                yield from included_requirement_files(os.path.join(base_dir, include.group(1)))
+
+
+def requirements_hash(requirements_file):
+    """Hash of the contents of the requirements file and every file it includes"""
+    import hashlib
+
+    requirements_hash = hashlib.sha256()
+    for path in included_requirement_files(requirements_file):
+        requirements_hash.update(f"{path}\0".encode())
+        if os.path.isfile(path):
+            with open(path, "rb") as file:
+                requirements_hash.update(file.read())
+        requirements_hash.update(b"\0")
+    return requirements_hash.hexdigest()
+
+
+def install_stamp(requirements_file, pip_args=""):
+    """
+    Print a stamp identifying an installation: The contents of the requirements file and every file it includes,
+    the pip arguments, the python version and the set of installed packages. If the stamp of an installation
+    matches the stamp of the previous installation, there is nothing to install.
+    """
+    import hashlib
+
+    installed_hash = hashlib.sha256("\n".join(sorted(installed_keys(environment_site_packages()).values())).encode())
+    print(f"requirements {requirements_hash(requirements_file)}")
+    print(f"pip-args {pip_args}")
+    print(f"python {sys.version.split()[0]} {sys.implementation.cache_tag}")
+    print(f"installed {installed_hash.hexdigest()}")
+
+
+def requirements_fingerprint(requirements_file, pip_args=""):
+    """
+    Print a fingerprint of everything that decides how requirements are resolved, except the package index:
+    The contents of the requirements file and every file it includes, the pip arguments, the python version
+    and the platform. Returns 1 without printing anything if the requirements include local paths or editable
+    installs, since their dependencies can change without the requirements files changing.
+    """
+    import hashlib
+
+    for line in requirement_file_lines(requirements_file):
+        # Options like '--index-url file:///...' choose the index, which is not part of the fingerprint either
+        is_option = line.startswith("-") and not _requirement_option_pattern.match(line)
+        if (
+            re.match(r"^(-e|--editable)\s", line)
+            or line.startswith((".", "/", "~"))
+            or ("file:" in line and not is_option)
+        ):
+            return 1
+    if requirement_options(requirements_file) is None:
+        return 1
+
+    fingerprint = "\0".join(
+        [
+            requirements_hash(requirements_file),
+            pip_args,
+            sys.version.split()[0],
+            sys.implementation.cache_tag,
+            sysconfig.get_platform(),
+        ]
+    )
+    print(hashlib.sha256(fingerprint.encode()).hexdigest())
+    return 0
+
+
+def supported_wheel_tags():
+    """Wheel tags the running python can install, or None if they cannot be determined"""
+    try:
+        from pip._vendor.packaging.tags import sys_tags
+    except ImportError:
+        return None
+    return {str(tag) for tag in sys_tags()}
+
+
+def wheel_name_version(filename, supported_tags):
+    """
+    The (name, version) of a wheel file, if it can be installed with this python, given the result of
+    'supported_wheel_tags'. Returns None for other files, and for wheels for other pythons or platforms
+    """
+    parts = filename[: -len(".whl")].split("-")
+    if not filename.endswith(".whl") or len(parts) not in (5, 6):
+        return None
+    name, version, python_tags, abi_tags, platform_tags = parts[:2] + parts[-3:]
+    tags = {
+        f"{python_tag}-{abi_tag}-{platform_tag}"
+        for python_tag in python_tags.split(".")
+        for abi_tag in abi_tags.split(".")
+        for platform_tag in platform_tags.split(".")
+    }
+    if supported_tags is not None and not tags & supported_tags:
+        return None
+    return name, version
+
+
+def wheelhouse_index(wheelhouse):
+    """Map of (name, version) to the path of every wheel in the wheelhouse that can be installed with this python"""
+    supported_tags = supported_wheel_tags()
+    index = {}
+    for entry in os.scandir(wheelhouse) if os.path.isdir(wheelhouse) else []:
+        name_version = wheel_name_version(entry.name, supported_tags)
+        if name_version is not None:
+            name, version = name_version
+            index[canonicalize_name(name), version] = entry.path
+    return index
+
+
+def wheelhouse_missing(wheelhouse):
+    """
+    Print 'name==version' for every package installed from an index that has no wheel in the wheelhouse.
+    The wheels of the packages that are found are marked as recently used.
+    """
+    index = wheelhouse_index(wheelhouse)
+    for name, dist in installed_distributions():
+        if dist.read_text("direct_url.json"):
+            # Packages installed from a URL cannot be installed from the wheelhouse by name and version
+            continue
+        wheel = index.get((name, dist.version))
+        if wheel is None:
+            print(f"{name}=={dist.version}")
+        else:
+            os.utime(wheel)
+
+
+def wheelhouse_has_lock(wheelhouse, lock_file):
+    """
+    Exit with 0 if every requirement in the .lock-file has a wheel in the wheelhouse,
+    or refers to a wheel on the local file system, otherwise 1
+    """
+    index = wheelhouse_index(wheelhouse)
+    lines = list(requirement_file_lines(lock_file))
+    if not lines:
+        return 1
+    for line in lines:
+        name_version = _name_version_pattern.match(line)
+        direct = _direct_reference_pattern.match(line)
+        if line.startswith("-") and not _requirement_option_pattern.match(line):
+            # Options like '--index-url' don't need a wheel
+            continue
+        if name_version:
+            if (canonicalize_name(name_version.group(1)), name_version.group(2)) not in index:
+                return 1
+        elif not direct or not direct.group(3).startswith("file://") or not direct.group(3).endswith(".whl"):
+            return 1
+    return 0
+
+
+def wheelhouse_prune(wheelhouse, max_size):
+    """Remove the least recently used wheels from the wheelhouse until its total size is at most 'max_size' bytes"""
+    wheels = [entry for entry in os.scandir(wheelhouse) if entry.name.endswith(".whl")]
+    wheels.sort(key=lambda entry: entry.stat().st_mtime)
+    total_size = sum(entry.stat().st_size for entry in wheels)
+
+    removed = 0
+    for entry in wheels:
+        if total_size <= int(max_size):
+            break
+        total_size -= entry.stat().st_size
+        os.remove(entry.path)
+        removed += 1
+    print(removed)
+
+
+def write_names(names, names_file):
+    """Write the names sorted by code point, like 'sort' with LC_ALL=C, replacing the file in one step"""
+    tmp_file = f"{names_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        f.writelines(f"{name}\n" for name in sorted(names))
+    os.replace(tmp_file, names_file)
+
+
+def package_names(names_file, index_names_file, *wheel_dirs):
+    """
+    Write the normalized names of the packages in the wheel folders, pip's wheel cache and the listing of the
+    package index to 'names_file', sorted so the completion can look up names by prefix without reading all of it
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    pip_wheel_cache = os.path.join(os.environ.get("PIP_CACHE_DIR") or os.path.join(cache_home, "pip"), "wheels")
+
+    names = set()
+    for wheel_dir in (*wheel_dirs, pip_wheel_cache):
+        for _, _, files in os.walk(wheel_dir):
+            names.update(canonicalize_name(file.split("-", 1)[0]) for file in files if file.endswith(".whl"))
+    if os.path.isfile(index_names_file):
+        with open(index_names_file) as f:
+            names.update(line.strip() for line in f)
+    write_names(names, names_file)
+
+
+def fetch_package_names(index_url, index_names_file):
+    """Write the names of all projects listed by the simple API of the package index to 'index_names_file'"""
+    import base64
+    import urllib.parse
+    import urllib.request
+
+    parsed_url = urllib.parse.urlsplit(index_url)
+    if parsed_url.scheme == "file":
+        # Local indexes are folders with a folder per project
+        names = [entry.name for entry in os.scandir(urllib.request.url2pathname(parsed_url.path)) if entry.is_dir()]
+    else:
+        headers = {"Accept": "application/vnd.pypi.simple.v1+json, text/html;q=0.1"}
+        if parsed_url.username:
+            credentials = f"{parsed_url.username}:{parsed_url.password or ''}"
+            headers["Authorization"] = f"Basic {base64.b64encode(credentials.encode()).decode()}"
+        request = urllib.request.Request(strip_url_auth(index_url).rstrip("/") + "/", headers=headers)
+        with urllib.request.urlopen(request, timeout=300) as response:
+            content_type = response.headers.get_content_type()
+            body = response.read().decode()
+        if content_type == "application/vnd.pypi.simple.v1+json":
+            names = [project["name"] for project in json.loads(body)["projects"]]
+        else:
+            names = re.findall(r"<a[^>]*>([^<]+)</a>", body)
+
+    write_names({canonicalize_name(name) for name in names}, index_names_file)
+    print(len(names))
+
+
+def index_args(pip_args):
+    """
+    The arguments choosing where packages are found, like '--index-url', out of the arguments for 'pip install'.
+    Install options like '--upgrade' make 'pip wheel' and 'pip download' fail, so only these are passed on to them
+    """
+    import shlex
+
+    args = shlex.split(pip_args)
+    kept = []
+    for index, arg in enumerate(args):
+        option = arg.partition("=")[0]
+        if arg == "--no-index" or (option in _index_options and "=" in arg):
+            kept.append(arg)
+        elif arg in _index_options:
+            kept.extend(args[index : index + 2])
+        elif arg[:2] in ("-i", "-f") and not arg.startswith("--"):
+            kept.append(arg)
+    return kept
+
+
+def print_index_args(pip_args):
+    """Print the arguments of 'index_args' separated by spaces"""
+    print(" ".join(index_args(pip_args)))
+
+
+def prefetch(lock_file, download_dir, jobs, wheelhouse="", pip_args=""):
+    """
+    Download the pinned requirements of a .lock-file into 'download_dir' with up to 'jobs' 'pip download' processes
+    in parallel, since 'pip install' downloads them one at a time. Requirements with a wheel in the wheelhouse are
+    skipped, and downloaded wheels are moved to the wheelhouse, if one is given. Requirements that can not be
+    downloaded are left for 'pip install' to report. Index options in the .lock-file, like '--index-url', are used too.
+    """
+    import shutil
+    import subprocess
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = wheelhouse_index(wheelhouse) if wheelhouse else {}
+    missing = []
+    file_options = []
+    for line in requirement_file_lines(lock_file):
+        if line.startswith("-") and not _requirement_option_pattern.match(line):
+            file_options.append(line)
+        name_version = _name_version_pattern.match(line)
+        if name_version and (canonicalize_name(name_version.group(1)), name_version.group(2)) not in index:
+            missing.append(f"{name_version.group(1)}=={name_version.group(2)}")
+
+    jobs = min(int(jobs), len(missing))
+    if jobs < 2:
+        # A single download is just as fast in 'pip install'
+        return 0
+
+    print(f"Downloading {len(missing)} package(s) with {jobs} parallel jobs")
+    sys.stdout.flush()
+
+    def download(requirements):
+        pip_download = [sys.executable, "-m", "pip", "download", "--no-deps", "--use-pep517", "--quiet"]
+        pip_download += ["--dest", download_dir, *requirements, *index_args(" ".join([*file_options, pip_args]))]
+        return subprocess.run(pip_download).returncode
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return_codes = list(executor.map(download, [missing[job::jobs] for job in range(jobs)]))
+    if any(return_codes):
+        print("Could not download all packages in parallel, continuing", file=sys.stderr)
+
+    if wheelhouse:
+        for entry in os.scandir(download_dir):
+            if entry.name.endswith(".whl"):
+                shutil.move(entry.path, os.path.join(wheelhouse, entry.name))
+    return 0
+
+
+def trace_summary(trace_file):
+    """
+    Print the phases recorded in a trace file written with $VENV_CLI_TRACE, slowest first on average,
+    with the number of runs, failed runs, and the mean, maximum and total duration of each phase
+    """
+    phases = {}
+    with open(trace_file) as file:
+        for line in file:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            phase = phases.setdefault(event["name"], {"runs": 0, "failed": 0, "durations": []})
+            phase["runs"] += 1
+            phase["failed"] += event.get("args", {}).get("exit_code", 0) != 0
+            phase["durations"].append(event["dur"] / 1_000_000)
+
+    name_width = max([len("Phase"), *map(len, phases)])
+    print(f"{'Phase':<{name_width}}  {'Runs':>5}  {'Failed':>6}  {'Mean':>9}  {'Max':>9}  {'Total':>9}")
+    rows = sorted(phases.items(), key=lambda item: sum(item[1]["durations"]) / item[1]["runs"], reverse=True)
+    for name, phase in rows:
+        durations = phase["durations"]
+        print(
+            f"{name:<{name_width}}  {phase['runs']:>5}  {phase['failed']:>6}  {sum(durations) / len(durations):>8.3f}s"
+            f"  {max(durations):>8.3f}s  {sum(durations):>8.3f}s"
+        )
+
+
+def pep610_url(url):
+    """The URL as pip records it in 'direct_url.json': Without credentials, except the 'git' user for SSH"""
+    if url.startswith("ssh://git@"):
+        return url
+    return strip_url_auth(url)
+
+
+def resolve_git_commit(url, revision):
+    """Resolve a git revision (branch, tag or commit) of the repository at 'url' to its commit hash"""
+    import subprocess
+
+    if re.fullmatch(r"[0-9a-f]{40}", revision):
+        return revision
+
+    result = subprocess.run(
+        ["git", "ls-remote", url, revision or "HEAD", f"{revision}^{{}}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+    )
+    if result.returncode != 0:
+        return None
+
+    # Prefer the commit an annotated tag points to ('refs/tags/<tag>^{}') over the tag object itself
+    refs = dict(reversed(line.split("\t", 1)) for line in result.stdout.splitlines() if "\t" in line)
+    for ref in [f"refs/tags/{revision}^{{}}", f"refs/tags/{revision}", f"refs/heads/{revision}", revision or "HEAD"]:
+        if ref in refs:
+            return refs[ref]
+    return next(iter(refs.values()), None)
+
+
+def cached_vcs_wheel(name, vcs_url, vcs_cache_dir, pip_args):
+    """
+    Return the path to a wheel built from a git requirement, e.g. 'git+https://${TOKEN}@host/repo@v1.0'.
+    The wheel is cached under the URL (without credentials) and the commit the revision resolves to,
+    so it only has to be built once per commit for each python and platform. Returns None if the wheel
+    can not be built.
+    """
+    import hashlib
+    import shutil
+    import subprocess
+    import tempfile
+    from urllib.parse import urlsplit
+
+    url, _, fragment = vcs_url[len("git+") :].partition("#")
+    scheme, netloc, path, _, _ = urlsplit(url)
+    path, _, revision = path.partition("@")
+    repository_url = f"{scheme}://{netloc}{path}"
+
+    commit = resolve_git_commit(os.path.expandvars(repository_url), revision)
+    if commit is None:
+        return None
+
+    subdirectory = re.search(r"(?:^|&)subdirectory=([^&]+)", fragment)
+    cache_key = hashlib.sha256(f"{pep610_url(repository_url)}#{fragment}".encode()).hexdigest()[:32]
+    cache_dir = os.path.join(vcs_cache_dir, cache_key, commit)
+    # The cache is shared by every environment, so it can hold wheels of the same commit for several pythons
+    supported_tags = supported_wheel_tags()
+    wheels = []
+    if os.path.isdir(cache_dir):
+        wheels = [
+            entry.path for entry in os.scandir(cache_dir) if wheel_name_version(entry.name, supported_tags) is not None
+        ]
+    if wheels:
+        os.utime(cache_dir)
+        return wheels[0]
+
+    print(f"Building wheel for {name} at commit {commit}", file=sys.stderr, flush=True)
+    with tempfile.TemporaryDirectory() as build_dir:
+        requirement = f"{name} @ git+{os.path.expandvars(repository_url)}@{commit}"
+        if subdirectory:
+            requirement += f"#subdirectory={subdirectory.group(1)}"
+        result = subprocess.run(
+            [sys.executable, "-m", "pip", "wheel", "--no-deps", "--use-pep517", "--quiet"]
+            + ["--wheel-dir", build_dir, requirement]
+            + index_args(pip_args),
+            stdout=sys.stderr,
+        )
+        wheels = [entry.path for entry in os.scandir(build_dir) if entry.name.endswith(".whl")]
+        if result.returncode != 0 or len(wheels) != 1:
+            return None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        direct_url = {
+            "url": pep610_url(repository_url),
+            "vcs_info": {"vcs": "git", "commit_id": commit, "requested_revision": revision or None},
+        }
+        if not revision:
+            del direct_url["vcs_info"]["requested_revision"]
+        if subdirectory:
+            direct_url["subdirectory"] = subdirectory.group(1)
+        with open(os.path.join(cache_dir, "direct_url.json"), "w") as file:
+            json.dump(direct_url, file)
+        return shutil.move(wheels[0], cache_dir)
+
+
+def cache_vcs_wheels(requirements_file, vcs_cache_dir, output_file, pip_args=""):
+    """
+    If the requirements (or any file they include) contain git requirements, write the requirements
+    to 'output_file' with every git requirement replaced by a wheel from the VCS wheel cache, and with
+    every included file expanded. Print the path to the requirements file to install from.
+    """
+    lines = []
+    rewritten = False
+
+    def collect_lines(path):
+        nonlocal rewritten
+        base_dir = os.path.dirname(path)
+        with open(path) as file:
+            for line in file:
+                line = line.rstrip("\n")
+                include = re.match(r"^\s*(-r|--requirement|-c|--constraint)(?:\s+|=)(\S+)", line)
+                direct = _direct_reference_pattern.match(line)
+                if include and include.group(1) in ("-r", "--requirement"):
+                    included_file = os.path.join(base_dir, include.group(2))
+                    if os.path.isfile(included_file):
+                        collect_lines(included_file)
+                    else:
+                        # Let pip report the missing file
+                        lines.append(line)
+                elif include:
+                    lines.append(f"-c {os.path.abspath(os.path.join(base_dir, include.group(2)))}")
+                elif direct and direct.group(3).startswith("git+"):
+                    wheel = cached_vcs_wheel(direct.group(1), direct.group(3), vcs_cache_dir, pip_args)
+                    marker = line.partition(";")[2]
+                    if wheel is None:
+                        lines.append(line)
+                        continue
+                    extras = direct.group(2) or ""
+                    lines.append(f"{direct.group(1)}{extras} @ file://{wheel}" + (f" ;{marker}" if marker else ""))
+                    rewritten = True
+                else:
+                    lines.append(line)
+
+    if os.path.isfile(requirements_file):
+        collect_lines(requirements_file)
+    if not rewritten:
+        print(requirements_file)
+        return
+
+    with open(output_file, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    print(output_file)
+
+
+def restore_vcs_direct_urls():
+    """
+    Packages installed from the VCS wheel cache are recorded as installed from a local wheel.
+    Record them as installed from VCS instead, like pip would have done, so 'pip freeze' shows the VCS URL.
+    """
+    for _, dist in installed_distributions():
+        direct_url_json = dist.read_text("direct_url.json")
+        if not direct_url_json:
+            continue
+        direct_url = json.loads(direct_url_json)
+        vcs_direct_url = cached_vcs_direct_url(direct_url)
+        if vcs_direct_url is not direct_url:
+            with open(os.path.join(dist._path, "direct_url.json"), "w") as file:
+                json.dump(vcs_direct_url, file)
+
+
+def recorded_files(dist):
+    """
+    Absolute paths of every file in the RECORD of a distribution, plus the bytecode files python may have
+    written for them. Returns None if the distribution has no RECORD, or if it records files outside
+    the environment, in which case it is not safe to remove the files directly.
+    """
+    import csv
+
+    record = dist.read_text("RECORD")
+    if record is None:
+        return None
+
+    prefix = os.path.normpath(sys.prefix)
+    site_dir = os.path.dirname(dist._path)
+    files = set()
+    for row in csv.reader(record.splitlines()):
+        if not row:
+            continue
+        path = os.path.normpath(os.path.join(site_dir, row[0]))
+        if not path.startswith(prefix + os.sep):
+            return None
+        files.add(path)
+        if path.endswith(".py"):
+            cache_dir = os.path.join(os.path.dirname(path), "__pycache__")
+            module = os.path.basename(path)[: -len(".py")]
+            for optimization in ["", ".opt-1", ".opt-2"]:
+                files.add(os.path.join(cache_dir, f"{module}.{sys.implementation.cache_tag}{optimization}.pyc"))
+    return files
+
+
+def remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_packages(*names):
+    """
+    Uninstall the named distributions, or every distribution except pip, setuptools and wheel if no names are given,
+    by removing the files in their RECORD directly and in parallel. Distributions that cannot be removed safely
+    this way, e.g. legacy installs without a RECORD, are uninstalled with pip instead.
+    """
+    import shutil
+    import subprocess
+    from concurrent.futures import ThreadPoolExecutor
+
+    requested = {canonicalize_name(name) for name in names}
+    files = set()
+    removed = []
+    pip_fallback = []
+    for name, dist in installed_distributions():
+        if requested and name not in requested:
+            continue
+        dist_files = recorded_files(dist)
+        if dist_files is None:
+            pip_fallback.append(name)
+            continue
+        files |= dist_files
+        files.add(str(dist._path))
+        removed.append(f"{dist.metadata['Name']}-{dist.version}")
+
+    # Legacy editable installs ('setup.py develop') are only known to pip
+    for site_dir in site_packages():
+        for entry in os.scandir(site_dir) if os.path.isdir(site_dir) else []:
+            name = canonicalize_name(entry.name[: -len(".egg-link")])
+            if entry.name.endswith(".egg-link") and (not requested or name in requested):
+                pip_fallback.append(name)
+
+    with ThreadPoolExecutor() as executor:
+        dist_info_dirs = [path for path in files if os.path.isdir(path) and not os.path.islink(path)]
+        list(executor.map(remove_file, files - set(dist_info_dirs)))
+        list(executor.map(lambda path: shutil.rmtree(path, ignore_errors=True), dist_info_dirs))
+
+    # Remove the folders that were emptied, deepest first, but never the top-level folders of the environment
+    keep = {os.path.normpath(path) for path in [sys.prefix, *site_packages(), *sysconfig.get_paths().values()]}
+    folders = {os.path.dirname(path) for path in files}
+    for folder in sorted(folders, key=len, reverse=True):
+        while folder not in keep and folder.startswith(os.path.normpath(sys.prefix) + os.sep):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+    for package in removed:
+        print(f"Successfully uninstalled {package}")
+
+    if pip_fallback:
+        pip_uninstall = [sys.executable, "-m", "pip", "uninstall", "--require-virtualenv", "-y", *sorted(pip_fallback)]
+        return subprocess.run(pip_uninstall).returncode
+    return 0
+
+
+def store_object(objects_dir, record_hash):
+    """The path in the store of a file with the given RECORD hash, or None if it is not a sha256 hash"""
+    import base64
+
+    algorithm, _, value = record_hash.partition("=")
+    if algorithm != "sha256" or not value:
+        return None
+    digest = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).hex()
+    return os.path.join(objects_dir, digest[:2], digest[2:])
+
+
+def file_sha256(path):
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_store_file(path, object_path):
+    """
+    Replace the file at <path> by a hardlink to <object_path> in the store, first adding the file to the store if the
+    object does not exist yet and the file has the hash of the object. Returns the size of the file if it is linked
+    """
+    import stat
+
+    try:
+        file_stat = os.lstat(path)
+    except FileNotFoundError:
+        return 0
+    if not stat.S_ISREG(file_stat.st_mode):
+        return 0
+    try:
+        object_stat = os.stat(object_path)
+    except FileNotFoundError:
+        object_stat = None
+
+    if object_stat is not None and os.path.samestat(file_stat, object_stat):
+        return file_stat.st_size
+    if object_stat is None:
+        # Only add files that are unchanged since they were installed, since every link shares their content
+        if file_sha256(path) != os.path.basename(os.path.dirname(object_path)) + os.path.basename(object_path):
+            return 0
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        try:
+            os.link(path, object_path)
+            return file_stat.st_size
+        except FileExistsError:
+            object_stat = os.stat(object_path)
+
+    # Files with the same content, but e.g. a different executable bit, are left alone
+    if stat.S_IMODE(file_stat.st_mode) != stat.S_IMODE(object_stat.st_mode):
+        return 0
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.link(object_path, tmp_path)
+    os.replace(tmp_path, path)
+    return file_stat.st_size
+
+
+def link_store(store_dir):
+    """
+    Replace the files of the installed distributions by hardlinks to the identical files in the content-addressed
+    store, adding the files that are not in the store yet. Files are keyed by the sha256 hash in the RECORD of their
+    distribution. Prints the number of linked files and their total size, separated by a tab.
+    """
+    import csv
+    import errno
+    from concurrent.futures import ThreadPoolExecutor
+
+    objects_dir = os.path.join(store_dir, "objects")
+    prefix = os.path.normpath(sys.prefix)
+    files = []
+    for _, dist in installed_distributions():
+        site_dir = os.path.dirname(dist._path)
+        for row in csv.reader((dist.read_text("RECORD") or "").splitlines()):
+            path = os.path.normpath(os.path.join(site_dir, row[0])) if row else ""
+            object_path = store_object(objects_dir, row[1]) if len(row) > 1 else None
+            if object_path is not None and path.startswith(prefix + os.sep):
+                files.append((path, object_path))
+
+    try:
+        with ThreadPoolExecutor() as executor:
+            sizes = list(executor.map(lambda file: link_store_file(*file), files))
+    except OSError as error:
+        if error.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            print(f"Could not hardlink files into the store in {store_dir}: {error.strerror}", file=sys.stderr)
+            return 1
+        raise
+    linked = [size for size in sizes if size]
+    print(f"{len(linked)}\t{sum(linked)}")
+    return 0
+
+
+def store_gc(store_dir):
+    """
+    Remove the files in the store that are not linked from any environment anymore, i.e. have a single link.
+    Prints the number of removed files and their total size, separated by a tab.
+    """
+    objects_dir = os.path.join(store_dir, "objects")
+    removed = []
+    for folder in os.scandir(objects_dir) if os.path.isdir(objects_dir) else []:
+        for entry in os.scandir(folder.path):
+            entry_stat = entry.stat(follow_symlinks=False)
+            if entry_stat.st_nlink == 1:
+                remove_file(entry.path)
+                removed.append(entry_stat.st_size)
+        try:
+            os.rmdir(folder.path)
+        except OSError:
+            pass
+    print(f"{len(removed)}\t{sum(removed)}")
+    return 0
+
+
+def link_base(base_dir=""):
+    """
+    Make the running environment a layer on top of the base environment in <base_dir>, by adding the site-packages
+    folders of the base environment to a .pth-file in site-packages, after the environment's own site-packages.
+    Removes the .pth-file if no base environment is given.
+    """
+    pth_file = os.path.join(sysconfig.get_paths()["purelib"], _base_pth_file)
+    if not base_dir:
+        remove_file(pth_file)
+        return 0
+
+    base_paths = sysconfig.get_paths(vars={"base": base_dir, "platbase": base_dir})
+    contents = "".join(f"{path}\n" for path in dict.fromkeys([base_paths["purelib"], base_paths["platlib"]]))
+    with open(f"{pth_file}.tmp", "w") as file:
+        file.write(contents)
+    os.replace(f"{pth_file}.tmp", pth_file)
+    return 0
+
+
+def python_fingerprint():
+    """The python version, bytecode cache tag and platform of the running python, which packed environments need"""
+    return {
+        "version": sys.version.split()[0],
+        "cache_tag": sys.implementation.cache_tag,
+        "platform": sysconfig.get_platform(),
+    }
+
+
+def base_executable():
+    """
+    The python executable outside the environment its 'bin/python' links to, which must exist at the same path
+    wherever the environment is unpacked
+    """
+    bin_dir = os.path.join(sys.prefix, "bin")
+    path = os.path.join(bin_dir, "python")
+    while os.path.islink(path) and os.path.dirname(path) == bin_dir:
+        path = os.path.normpath(os.path.join(bin_dir, os.readlink(path)))
+    return path
+
+
+def pack_metadata(metadata_file):
+    """
+    Write the metadata of a packed environment to <metadata_file>: The prefix it was installed in, the python it was
+    created with and the locked requirements. Returns 1 if the environment can't be packed
+    """
+    import io
+    from contextlib import redirect_stdout
+
+    if base_site_packages():
+        print("Layered environments can't be packed, since their base environment is not part of them", file=sys.stderr)
+        return 1
+    lock = io.StringIO()
+    with redirect_stdout(lock):
+        freeze()
+    metadata = {
+        "prefix": sys.prefix,
+        "python": {"executable": base_executable(), **python_fingerprint()},
+        "lock": lock.getvalue().splitlines(),
+    }
+    with open(metadata_file, "w") as file:
+        json.dump(metadata, file, indent=2)
+        file.write("\n")
+    return 0
+
+
+def check_pack(metadata_file):
+    """
+    Check that the python a packed environment was created with exists here, and is the same python,
+    then print the prefix the environment was packed from
+    """
+    import subprocess
+
+    with open(metadata_file) as file:
+        metadata = json.load(file)
+    python = metadata["python"]
+    fingerprint_code = (
+        "import json, sys, sysconfig; "
+        "print(json.dumps([sys.version.split()[0], sys.implementation.cache_tag, sysconfig.get_platform()]))"
+    )
+    try:
+        result = subprocess.run([python["executable"], "-I", "-c", fingerprint_code], capture_output=True, text=True)
+    except OSError:
+        print(f"Python {python['version']} not found in {python['executable']}", file=sys.stderr)
+        return 1
+    expected = [python["version"], python["cache_tag"], python["platform"]]
+    if result.returncode != 0 or json.loads(result.stdout) != expected:
+        print(f"The environment needs Python {' '.join(expected)} in {python['executable']}", file=sys.stderr)
+        return 1
+    print(metadata["prefix"])
+    return 0
+
+
+def module_distributions():
+    """
+    Map of top-level module names to the name of the distribution installing them, in the environment and its
+    base environment, from the 'top_level.txt' of the distributions, or else the files in their RECORD
+    """
+    from importlib import metadata
+
+    modules = {}
+    for dist in metadata.distributions(path=environment_site_packages()):
+        top_level = dist.read_text("top_level.txt")
+        if top_level:
+            names = top_level.split()
+        else:
+            names = []
+            for file in dist.files or []:
+                first = file.parts[0]
+                if first == ".." or first == "__pycache__" or first.endswith((".dist-info", ".data")):
+                    continue
+                names.append(first if len(file.parts) > 1 else first.split(".")[0])
+        for name in names:
+            modules.setdefault(name, dist.metadata["Name"])
+    return modules
+
+
+def import_times(log_file, distribution_of):
+    """
+    Self and cumulative import time in microseconds, and the number of modules imported, per distribution
+    in the output of 'python -X importtime'. The cumulative time of a distribution is the time spent importing
+    the modules it is imported by from other distributions, including everything they import. Also returns
+    the total import time.
+    """
+    entries = []
+    with open(log_file) as file:
+        for line in file:
+            match = _importtime_pattern.match(line.rstrip("\n"))
+            if match:
+                self_us, cumulative_us, indent, module = match.groups()
+                entries.append((int(self_us), int(cumulative_us), len(indent) // 2, module))
+
+    # Modules are written after the modules they import, so in reverse they are written before them
+    times = {}
+    total_us = 0
+    importers = []
+    for self_us, cumulative_us, depth, module in reversed(entries):
+        distribution = distribution_of(module.split(".")[0])
+        while importers and importers[-1][0] >= depth:
+            importers.pop()
+        importer = importers[-1][1] if importers else None
+        importers.append((depth, distribution))
+
+        distribution_times = times.setdefault(distribution, {"self_us": 0, "cumulative_us": 0, "modules": 0})
+        distribution_times["self_us"] += self_us
+        distribution_times["modules"] += 1
+        if distribution != importer:
+            distribution_times["cumulative_us"] += cumulative_us
+        if depth == 0:
+            total_us += cumulative_us
+    return times, total_us
+
+
+def profile_imports(target, json_file, *log_files):
+    """
+    Print the mean import time per distribution over the outputs of 'python -X importtime' in <log_files>,
+    ranked by cumulative time, and write the report to <json_file>. Modules that are not installed by a
+    distribution are counted as '(stdlib)' or '(other)'.
+    """
+    modules = module_distributions()
+    stdlib = set(getattr(sys, "stdlib_module_names", ())) | set(sys.builtin_module_names)
+
+    def distribution_of(module):
+        return modules.get(module) or ("(stdlib)" if module in stdlib else "(other)")
+
+    runs = [import_times(log_file, distribution_of) for log_file in log_files]
+    totals = [total_us for _, total_us in runs]
+    distributions = []
+    for name in set().union(*(times for times, _ in runs)):
+        run_times = [times.get(name, {"self_us": 0, "cumulative_us": 0, "modules": 0}) for times, _ in runs]
+        distributions.append(
+            {
+                "name": name,
+                "self_ms": sum(times["self_us"] for times in run_times) / len(runs) / 1000,
+                "cumulative_ms": sum(times["cumulative_us"] for times in run_times) / len(runs) / 1000,
+                "modules": max(times["modules"] for times in run_times),
+            }
+        )
+    distributions.sort(key=lambda distribution: (-distribution["cumulative_ms"], distribution["name"]))
+
+    report = {
+        "target": target,
+        "runs": len(runs),
+        "total_ms": sum(totals) / len(runs) / 1000,
+        "total_ms_per_run": [total_us / 1000 for total_us in totals],
+        "distributions": distributions,
+    }
+    with open(json_file, "w") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+
+    shown = 20
+    print(f"Import time of {target}, mean of {len(runs)} run(s): {report['total_ms']:.1f} ms")
+    print()
+    print(f"{'':>4}  {'Distribution':<30} {'Cumulative (ms)':>15} {'Self (ms)':>10} {'Modules':>8}")
+    for rank, distribution in enumerate(distributions[:shown], start=1):
+        print(
+            f"{rank:>4}  {distribution['name']:<30} {distribution['cumulative_ms']:>15.1f} "
+            f"{distribution['self_ms']:>10.1f} {distribution['modules']:>8}"
+        )
+    if len(distributions) > shown:
+        print(f"      ... and {len(distributions) - shown} more")
+    return 0
+
+
+def exchange_paths(path_a, path_b):
+    """
+    Swap two paths with a single atomic rename where the platform supports it (renameat2 with RENAME_EXCHANGE),
+    or else with three renames
+    """
+    import ctypes
+    import errno
+
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (AttributeError, OSError):
+        renameat2 = None
+
+    at_fdcwd, rename_exchange = -100, 2
+    if renameat2 is not None:
+        if renameat2(at_fdcwd, os.fsencode(path_a), at_fdcwd, os.fsencode(path_b), rename_exchange) == 0:
+            return 0
+        error = ctypes.get_errno()
+        if error not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            print(f"Could not swap {path_a} and {path_b}: {os.strerror(error)}", file=sys.stderr)
+            return 1
+
+    tmp_path = f"{path_b}.{os.getpid()}.tmp"
+    os.rename(path_b, tmp_path)
+    os.rename(path_a, path_b)
+    os.rename(tmp_path, path_a)
+    return 0
+
+
+def main(command, *args):
+    commands = {
+        "add-requirements": add_requirements,
+        "cache-vcs-wheels": cache_vcs_wheels,
+        "check-dependencies": check_dependencies,
+        "check-pack": check_pack,
+        "exchange-paths": exchange_paths,
+        "fetch-package-names": fetch_package_names,
+        "freeze": freeze,
+        "index-args": print_index_args,
+        "install-stamp": install_stamp,
+        "link-base": link_base,
+        "link-store": link_store,
+        "missing-always-installed": missing_always_installed,
+        "orphaned-packages": orphaned_packages,
+        "pack-metadata": pack_metadata,
+        "package-names": package_names,
+        "prefetch": prefetch,
+        "profile-imports": profile_imports,
+        "remove-packages": remove_packages,
+        "report-lock": report_lock,
+        "remove-requirements": remove_requirements,
+        "requirements-fingerprint": requirements_fingerprint,
+        "restore-vcs-direct-urls": restore_vcs_direct_urls,
+        "stale-packages": stale_packages,
+        "status": status,
+        "store-gc": store_gc,
+        "trace-summary": trace_summary,
+        "wheelhouse-has-lock": wheelhouse_has_lock,
+        "wheelhouse-missing": wheelhouse_missing,
+        "wheelhouse-prune": wheelhouse_prune,
+    }
+    return commands[command](*args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
+EOF
+}
+
+
+venv::_sed_escape() {
+  ### Escape a string so it can be used literally as both pattern and replacement in 'sed s|<pattern>|<replacement>|'
+  echo "$1" | sed 's/[][\\.*^$|&/]/\\&/g'
+}
+
+venv::_relocate_venv() {
+  ### Replace every occurrence of the path <old prefix> with <new prefix> in the scripts and config of
+  ### the virtual environment in <venv dir>, e.g. after copying or moving it.
+  ### Optionally also replaces the prompt <old prompt> with <new prompt>.
+  local venv_dir="$1"
+  local old_prefix="$(venv::_sed_escape "$2")"
+  local new_prefix="$(venv::_sed_escape "$3")"
+  local old_prompt="$(venv::_sed_escape "$4")"
+  local new_prompt="$(venv::_sed_escape "$5")"
+
+  local sed_script="s|${old_prefix}|${new_prefix}|g"
+  if [ -n "${old_prompt}" ]; then
+    sed_script="${sed_script}; s|${old_prompt}|${new_prompt}|g"
+  fi
+  # Shebangs with spaces, or longer than the kernel allows, are replaced with a shell wrapper, like pip does
+  sed_script="${sed_script}; 1s%^#!\(.* .*\|.\{126,\}\)\$%#!/bin/sh\n'''exec' \"\1\" \"\$0\" \"\$@\"\n' '''%"
+  sed_script="${sed_script}; 2s%^'''exec' \([^\"].*\) \"\$0\" \"\$@\"\$%'''exec' \"\1\" \"\$0\" \"\$@\"%"
+
+  # Only regular text files are rewritten; the python executables are (symlinks to) binaries
+  find "${venv_dir}/bin" "${venv_dir}/pyvenv.cfg" -maxdepth 1 -type f -print0 \
+    | xargs -0 --no-run-if-empty grep -lI --null -e "$2" -e "${4:-$2}" \
+    | xargs -0 --no-run-if-empty sed -i "${sed_script}"
+}
+
+venv::_python_registry() {
+  ### Print the path of the registry of the python interpreters on $PATH, after (re)building it if $PATH
+  ### or any folder on it has changed since the registry was built.
+  ### The first line of the registry holds a key of $PATH and the modification times of its folders. Every
+  ### following line holds the version in the name of an executable (e.g. '3.11'), its path, its full python
+  ### version, and '1' or '0' for whether the 'venv' and 'ensurepip' modules are available, separated by tabs.
+  local path_key
+  path_key="# $(echo "${PATH}" | tr ':' '\n' | xargs -d '\n' stat -c '%n %y' 2> /dev/null | cksum)"
+
+  local registry_key=""
+  if [ -f "${_python_registry_file}" ]; then
+    read -r registry_key < "${_python_registry_file}"
+  fi
+
+  if [ "${registry_key}" != "${path_key}" ]; then
+    mkdir -p "${_cache_dir}"
+    local registry_tmp_file
+    registry_tmp_file="$(mktemp "${_python_registry_file}.XXXXXXXX")"
+    echo "${path_key}" > "${registry_tmp_file}"
+
+    # Like 'command -v', only the first executable with a given name on $PATH is used
+    local path_dir python_executable python_version python_info
+    local seen_versions=" "
+    while IFS= read -r path_dir; do
+      [ -d "${path_dir}" ] || continue
+      while IFS= read -r python_executable; do
+        python_version="${python_executable##*/python}"
+        case "${seen_versions}" in
+          *" ${python_version} "*) continue ;;
+        esac
+        seen_versions+="${python_version} "
+
+        # Interpreters that fail to start, e.g. pyenv shims of versions that are not enabled, are left out
+        if python_info="$("${python_executable}" -I -c 'import importlib.util as u, platform
+print(platform.python_version(), *(int(u.find_spec(m) is not None) for m in ("venv", "ensurepip")), sep="\t")' \
+          2> /dev/null)"; then
+          printf '%s\t%s\t%s\n' "${python_version}" "${python_executable}" "${python_info}" >> "${registry_tmp_file}"
+        fi
+      done < <(find "${path_dir}" -maxdepth 1 -regex '.*/python3\.[0-9]+' -executable 2> /dev/null | sort)
+    done < <(echo "${PATH}" | tr ':' '\n')
+
+    mv "${registry_tmp_file}" "${_python_registry_file}"
+  fi
+
+  echo "${_python_registry_file}"
+}
+
+venv::_find_python() {
+  ### Print the path and full version of the python interpreter for the given version, separated by a tab.
+  ### A version of only the major version, e.g. '3', selects the newest interpreter of that major version
+  ### which can create virtual environments. Falls back to looking up 'python<version>' on $PATH
+  ### when the registry has no matching interpreter.
+  ### Fails if no interpreter is found, or if it can't create virtual environments.
+  local python_version="$1"
+  local registry_file
+  registry_file="$(venv::_python_registry)"
+
+  # Versions are compared as strings, since awk compares numeric-looking fields as numbers, where '3.1' == '3.10'
+  local python_entry
+  python_entry="$(awk -F '\t' -v version="${python_version}" \
+    'NR > 1 && ($1 "" == version "" || (index($1, version ".") == 1 && $4 && $5))' "${registry_file}" \
+    | sort -V | tail -n 1)"
+
+  local entry_version python_executable full_python_version has_venv has_ensurepip
+  if [ -n "${python_entry}" ]; then
+    IFS=$'\t' read -r entry_version python_executable full_python_version has_venv has_ensurepip <<< "${python_entry}"
+  else
+    python_executable="python${python_version}"
+    if ! command -v "${python_executable}" > /dev/null; then
+      venv::raise "Couldn't locate '${python_executable}'. Please make sure it is installed and on \$PATH."
+      return "$?"
+    fi
+    if ! full_python_version="$("${python_executable}" -c 'import platform; print(platform.python_version())' \
+      2> /dev/null)"; then
+      venv::raise "Couldn't run '${python_executable}'. Please make sure it is installed correctly."
+      return "$?"
+    fi
+    has_venv=1
+    has_ensurepip=1
+  fi
+
+  if [ "${has_venv}" != 1 ] || [ "${has_ensurepip}" != 1 ]; then
+    venv::raise "'${python_executable}' can't create virtual environments, since the 'venv' or 'ensurepip' module is missing. On Debian and Ubuntu, install the 'python${python_version}-venv' package."
+    return "$?"
+  fi
+
+  printf '%s\t%s\n' "${python_executable}" "${full_python_version}"
+}
+
+venv::_create_from_template() {
+  ### Create the virtual environment in '.venv' by copying a pristine template environment for the given
+  ### python executable. The template is created first if it does not already exist.
+  ### Fails without creating anything if the python executable cannot tell its version.
+  local python_executable="$1"
+  local venv_prompt="$2"
+
+  # Templates are specific to the python executable, the python version and the version of pip it bundles
+  local python_fingerprint
+  if ! python_fingerprint="$("${python_executable}" -I -c \
+    'import ensurepip, platform, sys; print(sys._base_executable, platform.python_version(), ensurepip.version())' \
+    2> /dev/null)"; then
+    return "${_fail}"
+  fi
+  local template_dir="${_templates_dir}/$(echo "${python_fingerprint}" | sha256sum | cut -c -32)"
+
+  if [ ! -d "${template_dir}" ]; then
+    # Build the template in a temporary folder and move it into place, so other processes never see a half-built one
+    mkdir -p "${_templates_dir}"
+    local build_dir
+    build_dir="$(mktemp -d "${_templates_dir}/.build-XXXXXXXX")"
+    if ! "${python_executable}" -m venv "${build_dir}" --prompt "${_template_prompt}"; then
+      rm -rf "${build_dir}"
+      return "${_fail}"
+    fi
+    venv::_relocate_venv "${build_dir}" "${build_dir}" "${template_dir}"
+    if ! mv -T "${build_dir}" "${template_dir}" 2> /dev/null; then
+      # Another process created the template first
+      rm -rf "${build_dir}"
+    fi
+  fi
+
+  # Copy-on-write copies are used where the file system supports them, otherwise it is a regular copy
+  if ! cp -a --reflink=auto "${template_dir}" .venv; then
+    rm -rf .venv
+    return "${_fail}"
+  fi
+  venv::_relocate_venv .venv "${template_dir}" "${PWD}/.venv" "${_template_prompt}" "${venv_prompt}"
+}
+
 
 venv::create() {
   if venv::_check_if_help_requested "$1"; then
-    echo "venv create <python-version> [<name>]"
+    echo "venv create <python-version> [<name>] [--no-template]"
     echo
     echo "Create a new virtual environment using python version <python-version>."
     echo "The virtual environment will be placed in '.venv',"
     echo "and when activated will be named the same as the containing folder."
     echo "It is also possible to specify the name that will be used in the shell prompt."
     echo
-    echo 'Requires an executable python of version <python-version> on $PATH'
+    echo 'Requires an executable python of version <python-version> on $PATH.'
+    echo "If <python-version> is only a major version, e.g. '3', the newest python of that major version is used."
+    echo "The python interpreters found on \$PATH are cached in '${_python_registry_file}',"
+    echo "and looked up again when \$PATH or any folder on it changes."
+    echo
+    echo "To make creating environments fast, a pristine template environment is kept for every python version"
+    echo "in '${_templates_dir}', and new environments are copies of that template."
+    echo
+    echo "Options:"
+    echo "  -h, --help       Show this help and exit."
+    echo "  --no-template    Create the environment from scratch using 'python -m venv' instead of copying a template."
     echo
     echo "Examples:"
     echo "$ venv create 3.9 my-39-env"
@@ -106,9 +2008,25 @@ venv::create() {
     echo "$ venv create 3.9"
     echo "When run from a folder called 'my-folder', this wil create a virtual environment"
     echo "called 'my-folder' using python3.9."
+    echo
+    echo "$ venv create 3"
+    echo "This will create a virtual environment using the newest python3.X on \$PATH."
     return "${_success}"
   fi
 
+  # Separate the '--no-template' option from the positional arguments
+  local use_template=true
+  local positional_args=()
+  local arg
+  for arg in "$@"; do
+    if [ "${arg}" = "--no-template" ]; then
+      use_template=false
+    else
+      positional_args+=( "${arg}" )
+    fi
+  done
+  set -- "${positional_args[@]}"
+
   if [ -z "$1" ]; then
     venv::raise "You need to specify the python version to use, e.g. 'venv-create 3.10'"
     return "$?"
@@ -125,16 +2043,20 @@ venv::create() {
     venv_name="${venv_prompt}"
   fi
 
-  # Check if python command exists
-  local python_executable="python${python_version}"
-  if ! command -v "${python_executable}" > /dev/null; then
-    venv::raise "Couldn't locate '${python_executable}'. Please make sure it is installed and on \$PATH."
-    return "$?"
+  # Look up the python interpreter in the registry of interpreters on $PATH
+  local python_entry python_executable full_python_version
+  if ! python_entry="$(venv::_find_python "${python_version}")"; then
+    echo "${python_entry}"
+    return "${_fail}"
   fi
+  IFS=$'\t' read -r python_executable full_python_version <<< "${python_entry}"
 
-  local full_python_version="$(${python_executable} -V)"
-  venv::color_echo "${_green}" "Creating virtual environment '${venv_name}' using ${full_python_version}"
-  ${python_executable} -m venv .venv --prompt "${venv_prompt}"
+  venv::color_echo "${_green}" "Creating virtual environment '${venv_name}' using Python ${full_python_version}"
+  if "${use_template}" && [ ! -e .venv ] \
+    && venv::_trace "create: copy template" venv::_create_from_template "${python_executable}" "${venv_name}"; then
+    return "${_success}"
+  fi
+  venv::_trace "create: python -m venv" "${python_executable}" -m venv .venv --prompt "${venv_prompt}"
 }
 
 
@@ -209,7 +2131,7 @@ venv::delete() {
     venv::deactivate
   fi
 
-  if ! rm -rf .venv; then
+  if ! venv::_with_lock exclusive .venv rm -rf .venv; then
     # If the virtual environment could not be deleted
     return "${_fail}"
   fi
@@ -221,7 +2143,10 @@ venv::install() {
   if venv::_check_if_help_requested "$1"; then
     echo "venv install [requirement specifiers] [OPTIONS]"
     echo
-    echo "Clear the environment, then install requirements from a requirements file, like 'requirements.txt' or 'requirements.lock'."
+    echo "Install requirements from a requirements file, like 'requirements.txt' or 'requirements.lock'."
+    echo "Installed packages that are not part of the requirements, or installed in a different version, are removed first,"
+    echo "so the environment ends up containing exactly the requirements and their dependencies. Use '--clean' to clear"
+    echo "the entire environment before installing instead."
     echo "Installed packages are then locked into the corresponding .lock-file, e.g. 'venv install -r requirements.txt'" will lock packages into
     echo "'requirements.lock'. This step is skipped if '--skip-lock' or '-s' is specified, or when installing directly from a .lock-file."
     echo
@@ -237,7 +2162,34 @@ venv::install() {
     echo "                                           are passed, they will be added to the requirements file before installation."
     echo "                                           If not specified, will default to using 'requirements.txt'."
     echo "  -s, --skip-lock                          Skip locking packages to a .lock-file after installation."
+    echo "  --clean                                  Clear the entire environment before installing, instead of only"
+    echo "                                           removing the packages that are not part of the requirements."
+    echo "  --no-wheelhouse                          Don't use or fill the local wheelhouse and the cache of wheels built"
+    echo "                                           from git requirements (see 'venv cache --help')."
+    echo "  --refresh                                Resolve the requirements again, even if the requirements file is unchanged"
+    echo "                                           since it was last resolved."
+    echo "  -j, --jobs <N>                           Download the packages in a .lock-file with up to <N> downloads in parallel"
+    echo "                                           before installing them (default: ${_default_jobs}). Use '--jobs 1' to let pip"
+    echo "                                           download the packages one at a time instead."
     echo "  --pip-args <ARGS>                        Additional arguments to pass through to pip install."
+    echo "  --atomic                                 Install into a copy of the environment next to it, and swap the copy into"
+    echo "                                           place when the installation succeeded. The active environment is never"
+    echo "                                           half-installed, and the previous environment is kept for 'venv rollback'."
+    echo "  --store                                  Replace the installed files by hardlinks to identical files in the store"
+    echo "                                           shared by all environments (see 'venv store --help'). This is the default"
+    echo "                                           when \$VENV_CLI_STORE is set."
+    echo "  --base[=<lock file>]                     Install the requirements in <lock file> (default: 'requirements.lock') into"
+    echo "                                           a base environment shared by all environments with the same base, and only"
+    echo "                                           install the remaining requirements into this environment, on top of it."
+    echo "  --compile[=<jobs>]                       Compile the bytecode of the installed packages after installing them, in"
+    echo "                                           <jobs> parallel processes (default: one per CPU core), instead of letting"
+    echo "                                           pip compile it one file at a time."
+    echo "  --no-compile                             Don't compile the bytecode of the installed packages. Python compiles"
+    echo "                                           each module the first time it is imported instead."
+    echo
+    echo "When the requirements in a .txt-file are unchanged since they were last resolved (including files included"
+    echo "with '-r', the '--pip-args' and the python version), the packages resolved then are installed again,"
+    echo "without resolving the requirements. Use '--refresh' to resolve the requirements again, e.g. to get newer versions."
     echo
     echo "Examples:"
     echo "$ venv install"
@@ -252,11 +2204,21 @@ venv::install() {
     echo "This will add 'numpy' and 'pandas >= 2.0' to 'requirements/dev-requirements.txt', then install"
     echo "all requirements from 'dev-requirements.txt' without locking them."
     echo "The arguments '--no-cache' and '--pre' are passed on to 'pip install'."
+    echo
+    echo "$ venv install -r requirements.lock --atomic"
+    echo "This will install the requirements from 'requirements.lock' into '.venv.new', a copy of '.venv', then swap it with"
+    echo "'.venv' and keep the previous environment in '.venv.prev'. Processes using '.venv' keep working meanwhile."
+    echo
+    echo "$ venv install -r dev-requirements.txt --base"
+    echo "This will install the requirements from 'requirements.lock' into a shared base environment in '${_bases_dir}',"
+    echo "and only the requirements in 'dev-requirements.txt' that are not in the base environment into '.venv'."
     return "${_success}"
   fi
 
+  local original_args=( "$@" )
+
   # Parse arguments. Fail if invalid arguments are passed
-  local TEMP=$(getopt -o 'r:s' --long 'requirement:,skip-lock,pip-args::' -n 'venv install' -- "$@")
+  local TEMP=$(getopt -o 'r:sj:' --long 'requirement:,skip-lock,clean,no-wheelhouse,refresh,jobs:,pip-args::,atomic,store,base::,compile::,no-compile' -n 'venv install' -- "$@")
   local _exit="$?"
   if [ "${_exit}" -ne 0 ]; then
     return "${_exit}"
@@ -265,7 +2227,19 @@ venv::install() {
   local package_args=()  # List of packages to install
   local requirements_file=""
   local skip_lock=false
+  local clean=false
+  local use_wheelhouse=true
+  local refresh=false
+  local jobs="${_default_jobs}"
   local pip_args=""
+  local atomic=false
+  local use_store=false
+  if [ -n "${VENV_CLI_STORE}" ]; then
+    use_store=true
+  fi
+  local base_lock=""
+  local compile=true
+  local compile_jobs=""
 
   eval set -- "$TEMP"  # Unpack the arguments in $TEMP into the positional parameters #1, #2, ...
 
@@ -287,10 +2261,48 @@ venv::install() {
         skip_lock=true
         shift
       ;;
+      "--clean")
+        clean=true
+        shift
+      ;;
+      "--no-wheelhouse")
+        use_wheelhouse=false
+        shift
+      ;;
+      "--refresh")
+        refresh=true
+        shift
+      ;;
+      "-j" | "--jobs")
+        jobs="$2"
+        shift 2
+      ;;
       "--pip-args")
         pip_args="$2"
         shift 2
       ;;
+      "--atomic")
+        atomic=true
+        shift
+      ;;
+      "--store")
+        use_store=true
+        shift
+      ;;
+      "--base")
+        base_lock="${2:-requirements.lock}"
+        shift 2
+      ;;
+      "--compile")
+        compile=true
+        compile_jobs="${2:-0}"
+        shift 2
+      ;;
+      "--no-compile")
+        compile=false
+        compile_jobs=""
+        shift
+      ;;
       --)
         # -- marks the end of the options, and anything after it is treated as a positional argument.
         # For venv install, positional arguments are package specifiers
@@ -316,6 +2328,66 @@ venv::install() {
     return "${_fail}"
   fi
 
+  if [[ ! "${jobs}" =~ ^[1-9][0-9]*$ ]]; then
+    venv::raise "Number of jobs must be a positive integer, was '${jobs}'"
+    return "$?"
+  fi
+  if [[ ! "${compile_jobs}" =~ ^[0-9]*$ ]]; then
+    venv::raise "Number of compile jobs must be a non-negative integer, was '${compile_jobs}'"
+    return "$?"
+  fi
+
+  # pip compiles the bytecode one file at a time. With '--compile', it is compiled in parallel after installing
+  local compile_args=()
+  if ! "${compile}" || [ -n "${compile_jobs}" ]; then
+    compile_args=( --no-compile )
+  fi
+
+  if ! venv::_check_venv_activated; then
+    return "${_fail}"
+  fi
+
+  # Wait for other venv commands using the same requirements file, since it is backed up and edited in place.
+  # The lock of a base environment is taken first, since installing it locks its base .lock-file, which can be
+  # the requirements file of another installation. Taking the locks in the same order everywhere avoids deadlocks.
+  # If the base environment can't be found, that is reported when installing it
+  if ! venv::_holds_lock "${requirements_file}"; then
+    local base_lock_dir=""
+    if [ -n "${base_lock}" ]; then
+      base_lock_dir="$(venv::_base_dir "${base_lock}" "${pip_args}")" || base_lock_dir=""
+    fi
+    venv::_with_lock exclusive "${base_lock_dir}" \
+      venv::_with_lock exclusive "${requirements_file}" venv::install -r "${requirements_file}" "${original_args[@]}"
+    return "$?"
+  fi
+
+  if "${atomic}"; then
+    # Install the same way into a copy of the environment, and lock once it has been swapped into place
+    local install_args=( -r "${requirements_file}" --skip-lock --jobs "${jobs}" --pip-args="${pip_args}" )
+    if "${clean}"; then
+      install_args+=( --clean )
+    fi
+    if ! "${use_wheelhouse}"; then
+      install_args+=( --no-wheelhouse )
+    fi
+    if "${refresh}"; then
+      install_args+=( --refresh )
+    fi
+    if "${use_store}"; then
+      install_args+=( --store )
+    fi
+    if [ -n "${base_lock}" ]; then
+      install_args+=( --base="${base_lock}" )
+    fi
+    if [ -n "${compile_jobs}" ]; then
+      install_args+=( --compile="${compile_jobs}" )
+    elif ! "${compile}"; then
+      install_args+=( --no-compile )
+    fi
+    venv::_install_side_by_side "${requirements_file}" "${skip_lock}" "${install_args[@]}" -- "${package_args[@]}"
+    return "$?"
+  fi
+
   # Add package specifiers to requirements file if they are not already there
   if [ "${#package_args[@]}" -gt 0 ]; then
     # Create the requirements file if it doesn't already exist, otherwise the next command will fail
@@ -325,130 +2397,565 @@ venv::install() {
 
     # Make a temporary backup of the requirements file, in case something fails
     venv::_create_backup_file "${requirements_file}"
-    if ! venv::_add_packages_to_requirements "${requirements_file}" "${package_args[@]}"; then
+    if ! venv::_trace "install: edit requirements" \
+      venv::_add_packages_to_requirements "${requirements_file}" "${package_args[@]}"; then
+      return "${_fail}"
+    fi
+  fi
+
+  # With a base .lock-file, install it into a base environment shared by all environments with the same base,
+  # and make this environment a layer on top of it, so only the remaining requirements are installed here.
+  # Without one, an environment that was a layer before gets all its requirements installed into it again
+  if [ -n "${base_lock}" ]; then
+    local base_install_args=( -r "${base_lock}" --skip-lock --jobs "${jobs}" --pip-args="${pip_args}" )
+    if ! "${use_wheelhouse}"; then
+      base_install_args+=( --no-wheelhouse )
+    fi
+    if "${use_store}"; then
+      base_install_args+=( --store )
+    fi
+    if [ -n "${compile_jobs}" ]; then
+      base_install_args+=( --compile="${compile_jobs}" )
+    elif ! "${compile}"; then
+      base_install_args+=( --no-compile )
+    fi
+    local base_dir
+    if ! base_dir="$(venv::_base_dir "${base_lock}" "${pip_args}")" \
+      || ! venv::_trace "install: base environment" \
+        venv::_with_lock exclusive "${base_dir}" venv::_install_base "${base_dir}" "${base_install_args[@]}" \
+      || ! venv::_python_helper link-base "${base_dir}"; then
+      venv::raise "Could not install the base environment from ${base_lock}"
+      return "$?"
+    fi
+  elif [ -n "$(find "${VIRTUAL_ENV}/lib" -maxdepth 3 -name '_venv_cli_base.pth' -print -quit 2> /dev/null)" ]; then
+    venv::color_echo "${_yellow}" "No base .lock-file given, installing all requirements into ${VIRTUAL_ENV} instead of using its base environment"
+    venv::_python_helper link-base
+  fi
+
+  # Skip the installation entirely if neither the requirements nor the installed packages have changed
+  # since the last installation, and the requirements have already been locked. Linking to the store
+  # and compiling bytecode are not part of the stamp, so they are still done if requested
+  local lock_file="$(venv::_get_lock_from_requirements "${requirements_file}")"
+  local stamp_file="$(venv::_state_dir)/install.stamp"
+  if ! "${clean}" && ! "${refresh}" && [ -f "${stamp_file}" ] \
+    && [ "$(venv::_trace "install: check stamp" venv::_python_helper install-stamp "${requirements_file}" "${pip_args}")" \
+      = "$(cat "${stamp_file}")" ] \
+    && { "${skip_lock}" || [ -f "${lock_file}" ]; }; then
+    venv::_remove_backup_file "${requirements_file}"
+    venv::color_echo "${_green}" "Requirements in ${requirements_file} are already installed, nothing to install"
+    if "${use_store}"; then
+      venv::_trace "install: link store" venv::_link_store
+    fi
+    if [ -n "${compile_jobs}" ]; then
+      venv::_trace "install: compile" venv::_compile_bytecode "${compile_jobs}"
+    fi
+    return "${_success}"
+  fi
+
+  # If the requirements in a .txt-file have been resolved before, install the packages resolved then
+  # from a .lock-file, instead of resolving the requirements again
+  local resolved_file="${requirements_file}"
+  local resolution_file=""
+  local fingerprint
+  if ! venv::_check_lock_requirements_file "${requirements_file}" -q \
+    && fingerprint="$(venv::_trace "install: fingerprint requirements" \
+      venv::_python_helper requirements-fingerprint "${requirements_file}" "${pip_args}")"; then
+    resolution_file="${_resolutions_dir}/${fingerprint}.lock"
+    if ! "${refresh}" && [ -f "${resolution_file}" ]; then
+      venv::color_echo "${_green}" "Requirements in ${requirements_file} are unchanged since they were last resolved, reusing that resolution"
+      resolved_file="${resolution_file}"
+    fi
+  fi
+
+  # Replace git requirements with wheels built once per commit and cached, instead of cloning and building them.
+  # The requirements are then installed from a temporary copy of the requirements file
+  local install_file="${resolved_file}"
+  local rewritten_file="$(mktemp --suffix ".${resolved_file##*.}")"
+  if "${use_wheelhouse}" && ! install_file="$(venv::_trace "install: cache git wheels" \
+    venv::_python_helper cache-vcs-wheels "${resolved_file}" "${_vcs_cache_dir}" "${rewritten_file}" "${pip_args}")"; then
+    rm -f "${rewritten_file}"
+    return "${_fail}"
+  fi
+
+  # Resolve the requirements in a .txt-file once, without installing anything. The resolution decides which
+  # installed packages are stale, and its pins are installed like a .lock-file, so pip doesn't resolve them again
+  local pinned=false
+  local report_file=""
+  local pinned_file="$(mktemp --suffix ".lock")"
+  if venv::_check_lock_requirements_file "${resolved_file}" -q; then
+    pinned=true
+  else
+    report_file="$(mktemp)"
+    # ${pip_args} is unquoted on purpose so it is not passed as a single string argument, but several arguments
+    if ! venv::_trace "install: resolve" pip install --require-virtualenv --use-pep517 --dry-run --ignore-installed \
+      --quiet --report "${report_file}" -r "${install_file}" ${pip_args}; then
+      rm -f "${rewritten_file}" "${report_file}" "${pinned_file}"
       return "${_fail}"
     fi
+    if venv::_python_helper report-lock "${report_file}" "${install_file}" > "${pinned_file}"; then
+      install_file="${pinned_file}"
+      pinned=true
+    fi
   fi
 
-  # Clear the environment before running pip install to avoid orphaned packages
+  # Remove packages that are not part of the requirements before running pip install to avoid orphaned packages.
+  # With '--clean', the whole environment is cleared instead
   # https://github.com/SallingGroup-AI-and-ML/venv-cli/issues/9
-  if ! venv::clear; then
+  if "${clean}"; then
+    if ! venv::_trace "install: clear" venv::clear; then
+      rm -f "${rewritten_file}" "${report_file}" "${pinned_file}"
+      return "${_fail}"
+    fi
+  elif ! venv::_trace "install: remove stale packages" \
+    venv::_remove_stale_packages "${install_file}" "${pip_args}" "${report_file}"; then
+    rm -f "${rewritten_file}" "${report_file}" "${pinned_file}"
     return "${_fail}"
   fi
+  rm -f "${report_file}"
+
+  # A .lock-file, or the pins of a resolution, already lists every dependency, so pip's dependency resolution
+  # can be skipped. The installed dependencies are checked afterwards instead
+  local resolver_args=()
+  if "${pinned}"; then
+    resolver_args=( --no-deps )
+  fi
+
+  # pip downloads the packages one at a time, so download the packages in a .lock-file in parallel first.
+  # Downloaded wheels are added to the wheelhouse, other downloads are installed from a temporary folder
+  local download_dir="$(mktemp -d)"
+  if [ "${#resolver_args[@]}" -gt 0 ]; then
+    local download_wheelhouse=""
+    if "${use_wheelhouse}"; then
+      mkdir -p "${_wheelhouse_dir}"
+      download_wheelhouse="${_wheelhouse_dir}"
+    fi
+    venv::_trace "install: download" \
+      venv::_python_helper prefetch "${install_file}" "${download_dir}" "${jobs}" "${download_wheelhouse}" "${pip_args}"
+  fi
+
+  # Look for wheels in the local wheelhouse. If every requirement in a .lock-file has a wheel there,
+  # the index is not needed at all
+  local wheelhouse_args=( --find-links "${download_dir}" )
+  local index_args=()
+  if "${use_wheelhouse}"; then
+    mkdir -p "${_wheelhouse_dir}"
+    wheelhouse_args+=( --find-links "${_wheelhouse_dir}" )
+    if "${pinned}" && venv::_python_helper wheelhouse-has-lock "${_wheelhouse_dir}" "${install_file}"; then
+      venv::color_echo "${_green}" "All requirements found in wheelhouse, installing without index"
+      index_args=( --no-index )
+    fi
+  fi
 
   venv::color_echo "${_green}" "Installing requirements from ${requirements_file}"
   # ${pip_args} is unquoted on purpose so it is not passed as a single string argument, but several arguments
-  if ! pip install --require-virtualenv --use-pep517 -r "${requirements_file}" ${pip_args}; then
+  if ! venv::_trace "install: pip install" pip install --require-virtualenv --use-pep517 -r "${install_file}" \
+    "${resolver_args[@]}" "${wheelhouse_args[@]}" "${index_args[@]}" "${compile_args[@]}" ${pip_args}; then
+    rm -rf "${rewritten_file}" "${pinned_file}" "${download_dir}"
     return "${_fail}"
   fi
 
+  # Like 'pip freeze', .lock-files leave out pip, setuptools and wheel, so without resolving dependencies,
+  # the versions of them required by the installed packages are installed separately
+  if [ "${#resolver_args[@]}" -gt 0 ]; then
+    local required_file="$(mktemp --suffix ".txt")"
+    venv::_python_helper missing-always-installed > "${required_file}"
+    if [ -s "${required_file}" ] && ! venv::_trace "install: install required pip, setuptools and wheel" \
+      pip install --require-virtualenv -r "${required_file}" "${wheelhouse_args[@]}" "${compile_args[@]}" ${pip_args}; then
+      rm -rf "${rewritten_file}" "${pinned_file}" "${download_dir}" "${required_file}"
+      return "${_fail}"
+    fi
+    rm -f "${required_file}"
+  fi
+
+  rm -rf "${rewritten_file}" "${pinned_file}" "${download_dir}"
+  if "${use_wheelhouse}"; then
+    venv::_python_helper restore-vcs-direct-urls
+  fi
+
+  if [ "${#resolver_args[@]}" -gt 0 ] && ! venv::_trace "install: check dependencies" venv::_python_helper check-dependencies; then
+    if [ "${resolved_file}" = "${resolution_file}" ]; then
+      rm -f "${resolution_file}"
+      venv::raise "Dependencies missing from the previous resolution of ${requirements_file}, see above. Install again to resolve the requirements"
+      return "$?"
+    fi
+    if ! venv::_check_lock_requirements_file "${resolved_file}" -q; then
+      venv::raise "Dependencies missing from the resolution of ${requirements_file}, see above"
+      return "$?"
+    fi
+    venv::raise "Dependencies missing from ${requirements_file}, see above. Install from the corresponding .txt-file to lock all dependencies"
+    return "$?"
+  fi
+
   # Remove the backup file if installation went well
   venv::_remove_backup_file "${requirements_file}"
 
+  if "${use_store}"; then
+    venv::_trace "install: link store" venv::_link_store
+  fi
+
+  if [ -n "${compile_jobs}" ]; then
+    venv::_trace "install: compile" venv::_compile_bytecode "${compile_jobs}"
+  fi
+
+  if "${use_wheelhouse}"; then
+    venv::_trace "install: fill wheelhouse" venv::_fill_wheelhouse "${pip_args}"
+  fi
+
   # Lock the installed packages into a .lock-file
-  local lock_file="$(venv::_get_lock_from_requirements "${requirements_file}")"
   if "${skip_lock}" || [ "${requirements_file}" = "${lock_file}" ]; then
     venv::color_echo "${_yellow}" "Skipping locking packages to ${lock_file}"
-    return "${_success}"
+  elif ! venv::_trace "install: lock" venv::lock "${lock_file}" -r "${requirements_file}"; then
+    return "${_fail}"
   fi
-  venv::lock "${lock_file}"
-}
-
-venv::_add_packages_to_requirements() {
-  local requirements_file="$1"
-  local package_args=("${@:2}")
 
-  local package_spec
-  for package_spec in "${package_args[@]}"; do
-    # Use the sed command to remove everything after the package name in the 'package_spec' string
-    local package_name="$(echo "${package_spec}" | sed -n 's|^\([a-zA-Z][a-zA-Z0-9_-]*\).*$|\1|p')"
-    if [ -z "${package_name}" ]; then
-      # Append the package spec directly to the requirements file if the package name could not be extracted
-      venv::color_echo "${_yellow}" "Could not extract package name from '${package_spec}', adding directly to ${requirements_file}"
-      echo "${package_spec}" >> "${requirements_file}"
-      continue
-    fi
-
-    # Look for the package name in the requirements file
-    if command grep -q "^${package_name}" "${requirements_file}"; then
-      # Replace package from requirements file if it's already there
-      echo "Replacing existing ${package_name} requirement with '${package_spec}' in ${requirements_file}"
-      sed -i "s|^${package_name}.*$|${package_spec}|g" "${requirements_file}"
+  # Record the resolved packages, so they can be installed without resolving the same requirements again
+  if [ -n "${resolution_file}" ] && [ "${resolved_file}" != "${resolution_file}" ]; then
+    mkdir -p "${_resolutions_dir}"
+    local resolution_tmp_file="$(mktemp "${resolution_file}.XXXXXX")"
+    if venv::_python_helper freeze "${requirements_file}" include-required > "${resolution_tmp_file}"; then
+      mv "${resolution_tmp_file}" "${resolution_file}"
     else
-      # Add package to requirements file if it's not already there
-      echo "Adding '${package_spec}' to ${requirements_file}"
-      echo "${package_spec}" >> "${requirements_file}"
+      rm -f "${resolution_tmp_file}"
     fi
-  done
+  fi
 
-  # Sort requirements file after adding packages. LC_COLLATE is set to C to ensure lines beginning with '-'
-  # are sorted first, instad of being ignored
-  LC_COLLATE=C sort --ignore-case --stable -o "${requirements_file}" "${requirements_file}"
+  # Record what was installed, so the next installation can be skipped if nothing changes
+  venv::_python_helper install-stamp "${requirements_file}" "${pip_args}" > "${stamp_file}"
 }
 
-venv::uninstall() {
-  if venv::_check_if_help_requested "$1"; then
-    echo "venv uninstall <package> [...] [OPTIONS]"
-    echo
-    echo "Remove one or more installed packages from a requirements file, then reinstall the environment from that requirements file."
-    echo "The resulting environment will be locked into a .lock-file."
-    echo
-    echo "The packages to uninsall must be the canonical package names as specified in the requirements file, e.g. 'numpy' or 'scikit-learn'."
-    echo "If specified, the requirements file must have file extension '.txt'."
-    echo "If no requirements file is passed, the command will assume the file 'requirements.txt' is to be used, and will fail if this file cannot be found."
-    echo
-    echo "Options:"
-    echo "  -h, --help                               Show this help and exit."
-    echo "  -r, --requirement <requirements file>    Remove the package(s) from the given requirements file, then reinstall the environment."
-    echo "                                           If not specified, will default to using 'requirements.txt' and will fail if this file does not exist."
-    echo "  -s, --skip-lock                          Skip locking packages to a .lock-file after reinstallation."
-    echo "  --pip-args <ARGS>                        Additional arguments to pass through to pip install on reinstallation."
-    echo
-    echo "Examples:"
-    echo "$ venv uninstall numpy"
-    echo "$ venv uninstall numpy -r requirements.txt"
-    echo "This will remove the 'numpy' requirement from 'requirements.txt', then reinstall the environment from 'requirements.txt' and lock them into 'requirements.lock'."
-    echo
-    echo "$ venv uninstall numpy pandas -r requirements/dev-requirements.txt -s --pip-args='--no-cache --pre'"
-    echo "This will remove 'numpy' and 'pandas' requirements from 'requirements/dev-requirements.txt', then reinstall"
-    echo "all requirements from 'dev-requirements.txt' without locking them."
-    echo "The arguments '--no-cache' and '--pre' are passed on to 'pip install' on reinstallation."
-    return "${_success}"
+venv::_compile_bytecode() {
+  ### Compile the bytecode of every module installed in the active environment in <jobs> parallel processes,
+  ### or one per CPU core if <jobs> is 0, and print how long it took. Modules that are already compiled are skipped
+  local jobs="$1"
+  local start="$(venv::_timestamp_us)"
+  venv::color_echo "${_green}" "Compiling bytecode"
+  # Packages may include files that are not valid python on purpose, e.g. test data, so failing to compile
+  # some files does not fail the installation
+  if ! python -m compileall -qq -j "${jobs}" "${VIRTUAL_ENV}/lib"; then
+    venv::color_echo "${_yellow}" "Some files could not be compiled, they are compiled when imported instead"
   fi
+  local end="$(venv::_timestamp_us)"
+  printf 'Compiled bytecode in %d.%02d s\n' "$(((end - start) / 1000000))" "$(((end - start) / 10000 % 100))"
+}
 
-  # Parse arguments. Fail if invalid arguments are passed
-  local TEMP=$(getopt -o 'r:s' --long 'requirement:,skip-lock,pip-args::' -n 'venv uninstall' -- "$@")
-  local _exit="$?"
-  if [ "${_exit}" -ne 0 ]; then
-    return "${_exit}"
+venv::_base_dir() {
+  ### Print the folder of the base environment for <base lock file>, shared by all environments using the same
+  ### base .lock-file, <pip args> and python version
+  local base_lock="$1"
+  local pip_args="$2"
+  if ! venv::_check_lock_requirements_file "${base_lock}"; then
+    return "${_fail}"
+  elif [ ! -f "${base_lock}" ]; then
+    venv::raise "Base lock file ${base_lock} not found. Run 'venv install' with the corresponding .txt-file first"
+    return "$?"
   fi
 
-  local package_names=()  # List of packages to uninstall
-  local requirements_file=""
-  local skip_lock=""
-  local pip_args=""
-
-  eval set -- "$TEMP"  # Unpack the arguments in $TEMP into the positional parameters #1, #2, ...
-  unset TEMP
+  local fingerprint
+  if ! fingerprint="$(venv::_python_helper requirements-fingerprint "${base_lock}" "${pip_args}")"; then
+    venv::raise "${base_lock} contains local paths or editable installs, and can't be installed into a base environment"
+    return "$?"
+  fi
+  echo "${_bases_dir}/${fingerprint}"
+}
 
-  # Parse arguments
-  while true; do
-    # -- marks the end of the options, and anything after it is treated as a positional argument.
-    # If "$*" = "--", there are no optional parameters left, and we can break the loop
-    if [ "$*" = "--" ]; then
-      shift
-      break
+venv::_install_base() {
+  ### Create the base environment in <base dir> with the python of the active environment, if it doesn't exist yet,
+  ### and run 'venv install' with the remaining arguments in it. The installation is skipped if nothing has changed
+  local base_dir="$1"
+  shift
+  if [ ! -x "${base_dir}/bin/pip" ]; then
+    venv::color_echo "${_green}" "Creating base environment in ${base_dir}"
+    mkdir -p "${_bases_dir}"
+    if ! python -m venv --prompt base "${base_dir}"; then
+      rm -rf "${base_dir}"
+      return "${_fail}"
     fi
+  fi
 
-    case "$1" in
-      "-r" | "--requirement")
-        requirements_file="$2"
-        shift 2
-      ;;
-      "-s" | "--skip-lock")
+  ( . "${base_dir}/bin/activate" && venv::install "$@" )
+}
+
+venv::_link_store() {
+  ### Replace the files of the installed packages by hardlinks to the files in the store shared by all environments.
+  ### The installation is left as it is if the files can't be linked, e.g. because the store is on another file system
+  local linked
+  if ! linked="$(venv::_python_helper link-store "${_store_dir}")"; then
+    venv::color_echo "${_yellow}" "Could not link the installed packages to the store in ${_store_dir}, see above"
+    return "${_success}"
+  fi
+  local file_count="${linked%%$'\t'*}"
+  local files_size="${linked##*$'\t'}"
+  echo "Linked ${file_count} file(s) ($(numfmt --to=iec "${files_size}")) to the store in ${_store_dir}"
+}
+
+venv::_install_side_by_side() {
+  ### Install into a copy of the active environment in '<environment>.new', leaving the active environment untouched,
+  ### check the dependencies of the installed packages, then swap the copy into place. The previous environment
+  ### is kept in '<environment>.prev' for 'venv rollback'.
+  ### Takes the requirements file, 'true' to skip locking, and the arguments to pass on to 'venv install'.
+  local requirements_file="$1"
+  local skip_lock="$2"
+  local venv_dir="${VIRTUAL_ENV}"
+  local new_dir="${VIRTUAL_ENV}.new"
+  local prev_dir="${VIRTUAL_ENV}.prev"
+
+  # Copy-on-write copies are used where the file system supports them, otherwise it is a regular copy
+  venv::color_echo "${_green}" "Installing into a copy of the environment in ${new_dir}"
+  rm -rf "${new_dir}"
+  if ! venv::_trace "install: copy environment" cp -a --reflink=auto "${venv_dir}" "${new_dir}"; then
+    rm -rf "${new_dir}"
+    return "${_fail}"
+  fi
+  venv::_relocate_venv "${new_dir}" "${venv_dir}" "${new_dir}"
+
+  # Install in a subshell with the copy activated, so the active environment is left alone
+  if ! ( . "${new_dir}/bin/activate" \
+    && venv::install "${@:3}" \
+    && venv::_trace "install: verify" venv::_python_helper check-dependencies ); then
+    rm -rf "${new_dir}"
+    venv::raise "Installation failed, the environment in ${venv_dir} was left unchanged"
+    return "$?"
+  fi
+
+  # Point the copy at the location of the active environment, then swap the two in a single rename
+  venv::_relocate_venv "${new_dir}" "${new_dir}" "${venv_dir}"
+  if ! venv::_trace "install: swap environment" venv::_python_helper exchange-paths "${new_dir}" "${venv_dir}"; then
+    rm -rf "${new_dir}"
+    venv::raise "Could not swap the new environment into ${venv_dir}, it was left unchanged"
+    return "$?"
+  fi
+  rm -rf "${prev_dir}"
+  mv -T "${new_dir}" "${prev_dir}"
+  venv::color_echo "${_green}" "Swapped the new environment into ${venv_dir}, the previous environment is kept in ${prev_dir}"
+
+  # Lock the installed packages into a .lock-file
+  local lock_file="$(venv::_get_lock_from_requirements "${requirements_file}")"
+  if "${skip_lock}" || [ "${requirements_file}" = "${lock_file}" ]; then
+    venv::color_echo "${_yellow}" "Skipping locking packages to ${lock_file}"
+  elif ! venv::_trace "install: lock" venv::lock "${lock_file}" -r "${requirements_file}"; then
+    return "${_fail}"
+  fi
+}
+
+venv::_add_packages_to_requirements() {
+  ### Add the package specifiers to the requirements file, replacing existing requirements of the same packages.
+  ### Package names are matched after normalizing them, e.g. 'Foo_Bar' matches 'foo-bar', and the file is sorted
+  local requirements_file="$1"
+  local package_args=("${@:2}")
+
+  # Edit the requirements file in a single pass, then report what was changed
+  local edits
+  if ! edits="$(venv::_python_helper add-requirements "${requirements_file}" "${package_args[@]}")"; then
+    return "${_fail}"
+  fi
+
+  local edit package_name package_spec
+  while IFS=$'\t' read -r edit package_name package_spec; do
+    case "${edit}" in
+      "added")
+        echo "Adding '${package_spec}' to ${requirements_file}"
+        ;;
+      "replaced")
+        echo "Replacing existing ${package_name} requirement with '${package_spec}' in ${requirements_file}"
+        ;;
+      "unparsed")
+        venv::color_echo "${_yellow}" "Could not extract package name from '${package_spec}', adding directly to ${requirements_file}"
+        ;;
+    esac
+  done <<< "${edits}"
+}
+
+venv::_remove_stale_packages() {
+  ### Uninstall every installed package that is not part of the requirements in the requirements file,
+  ### or is installed in a different version than the one required.
+  ### For .lock-files the pins are compared directly, for .txt-files pip resolves the requirements
+  ### without installing anything, and the resolved set is compared with the installed packages.
+  ### The report of a resolution already done with 'pip install --report' can be given instead.
+  local requirements_file="$1"
+  local pip_args="$2"
+  local given_report_file="$3"
+
+  if ! venv::_check_venv_activated; then
+    return "${_fail}"
+  fi
+
+  local stale_packages
+  if [ -n "${given_report_file}" ]; then
+    stale_packages="$(venv::_python_helper stale-packages "${requirements_file}" "${given_report_file}")"
+  elif venv::_check_lock_requirements_file "${requirements_file}" -q; then
+    stale_packages="$(venv::_python_helper stale-packages "${requirements_file}")"
+  else
+    local report_file
+    report_file="$(mktemp)"
+    # ${pip_args} is unquoted on purpose so it is not passed as a single string argument, but several arguments
+    if ! pip install --require-virtualenv --use-pep517 --dry-run --ignore-installed --quiet \
+      --report "${report_file}" -r "${requirements_file}" ${pip_args}; then
+      rm -f "${report_file}"
+      return "${_fail}"
+    fi
+    stale_packages="$(venv::_python_helper stale-packages "${requirements_file}" "${report_file}")"
+    rm -f "${report_file}"
+  fi
+
+  if [ -z "${stale_packages}" ]; then
+    return "${_success}"
+  fi
+
+  venv::color_echo "${_yellow}" "Removing packages not matching ${requirements_file} from virtual environment ..."
+  local package_names=()
+  local package_name
+  while read -r package_name; do
+    package_names+=( "${package_name}" )
+  done <<< "${stale_packages}"
+  venv::_python_helper remove-packages "${package_names[@]}"
+}
+
+venv::_fill_wheelhouse() {
+  ### Add a wheel for every package installed from an index to the wheelhouse, if it is not already there,
+  ### then evict the least recently used wheels if the wheelhouse has grown beyond its maximum size.
+  local pip_args="$1"
+
+  local missing_packages=()
+  local package
+  while read -r package; do
+    missing_packages+=( "${package}" )
+  done < <(venv::_python_helper wheelhouse-missing "${_wheelhouse_dir}")
+
+  if [ "${#missing_packages[@]}" -gt 0 ]; then
+    echo "Adding ${#missing_packages[@]} package(s) to wheelhouse in ${_wheelhouse_dir}"
+    mkdir -p "${_wheelhouse_dir}"
+    # Only the arguments choosing the index are passed on, since 'pip wheel' fails on install options like '--upgrade'.
+    # ${index_args} is unquoted on purpose so it is not passed as a single string argument, but several arguments
+    local index_args="$(venv::_python_helper index-args "${pip_args}")"
+    local wheel_args=( --require-virtualenv --use-pep517 --no-deps --quiet
+      --find-links "${_wheelhouse_dir}" --wheel-dir "${_wheelhouse_dir}" )
+    if ! pip wheel "${wheel_args[@]}" "${missing_packages[@]}" ${index_args} 2> /dev/null; then
+      # A single package that fails to build stops pip from building any of them, so build them one at a time
+      local failed_packages=()
+      for package in "${missing_packages[@]}"; do
+        if ! pip wheel "${wheel_args[@]}" "${package}" ${index_args}; then
+          failed_packages+=( "${package}" )
+        fi
+      done
+      if [ "${#failed_packages[@]}" -gt 0 ]; then
+        venv::color_echo "${_yellow}" "Could not add ${failed_packages[*]} to the wheelhouse, continuing"
+      fi
+    fi
+    venv::_update_package_names
+  fi
+
+  venv::_prune_wheelhouse "${_wheelhouse_max_size}" > /dev/null
+}
+
+venv::_update_package_names() {
+  ### Rebuild the sorted file of package names used for completing 'venv install' from the names of the wheels
+  ### in the wheelhouse, the git wheel cache and pip's wheel cache, and the last fetched listing of the package index
+  mkdir -p "${_cache_dir}"
+  venv::_python_helper package-names "${_package_names_file}" "${_index_names_file}" \
+    "${_wheelhouse_dir}" "${_vcs_cache_dir}"
+}
+
+venv::_prune_wheelhouse() {
+  ### Evict the least recently used wheels from the wheelhouse until it is at most the given size, e.g. '10G'.
+  ### Prints the number of wheels removed
+  local max_size
+  if ! max_size="$(numfmt --from=iec "$1" 2> /dev/null)"; then
+    venv::raise "Invalid wheelhouse size '$1', must be a number of bytes with an optional unit, e.g. '500M' or '10G'"
+    return "$?"
+  fi
+
+  if [ ! -d "${_wheelhouse_dir}" ]; then
+    echo 0
+    return "${_success}"
+  fi
+  venv::_python_helper wheelhouse-prune "${_wheelhouse_dir}" "${max_size}"
+}
+
+venv::uninstall() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv uninstall <package> [...] [OPTIONS]"
+    echo
+    echo "Remove one or more installed packages from a requirements file, then uninstall them from the environment,"
+    echo "along with every dependency that is no longer required by the remaining requirements."
+    echo "The resulting environment will be locked into a .lock-file."
+    echo
+    echo "The dependencies that are still required are found from the 'Requires-Dist' metadata of the installed packages,"
+    echo "so nothing is reinstalled. If the requirements file contains requirements that can't be matched to installed"
+    echo "packages, e.g. editable installs, the environment is reinstalled from the requirements file instead."
+    echo
+    echo "The packages to uninsall must be the canonical package names as specified in the requirements file, e.g. 'numpy' or 'scikit-learn'."
+    echo "If specified, the requirements file must have file extension '.txt'."
+    echo "If no requirements file is passed, the command will assume the file 'requirements.txt' is to be used, and will fail if this file cannot be found."
+    echo
+    echo "Options:"
+    echo "  -h, --help                               Show this help and exit."
+    echo "  -r, --requirement <requirements file>    Remove the package(s) from the given requirements file, then reinstall the environment."
+    echo "                                           If not specified, will default to using 'requirements.txt' and will fail if this file does not exist."
+    echo "  -s, --skip-lock                          Skip locking packages to a .lock-file after reinstallation."
+    echo "  --full-reinstall                         Reinstall the environment from the requirements file using 'venv install',"
+    echo "                                           instead of only uninstalling the packages that are no longer required."
+    echo "  --clean                                  Clear the entire environment and reinstall it from the requirements file."
+    echo "  --pip-args <ARGS>                        Additional arguments to pass through to pip install on reinstallation."
+    echo
+    echo "Examples:"
+    echo "$ venv uninstall numpy"
+    echo "$ venv uninstall numpy -r requirements.txt"
+    echo "This will remove the 'numpy' requirement from 'requirements.txt', uninstall 'numpy' and the dependencies that"
+    echo "are no longer required, and lock the environment into 'requirements.lock'."
+    echo
+    echo "$ venv uninstall numpy pandas -r requirements/dev-requirements.txt -s --pip-args='--no-cache --pre'"
+    echo "This will remove 'numpy' and 'pandas' requirements from 'requirements/dev-requirements.txt', then uninstall them"
+    echo "and the dependencies that are no longer required, without locking the environment."
+    echo "The arguments '--no-cache' and '--pre' are passed on to 'pip install' if the environment has to be reinstalled."
+    return "${_success}"
+  fi
+
+  local original_args=( "$@" )
+
+  # Parse arguments. Fail if invalid arguments are passed
+  local TEMP=$(getopt -o 'r:s' --long 'requirement:,skip-lock,clean,full-reinstall,pip-args::' -n 'venv uninstall' -- "$@")
+  local _exit="$?"
+  if [ "${_exit}" -ne 0 ]; then
+    return "${_exit}"
+  fi
+
+  local package_names=()  # List of packages to uninstall
+  local requirements_file=""
+  local skip_lock=""
+  local clean=""
+  local full_reinstall=false
+  local pip_args=""
+
+  eval set -- "$TEMP"  # Unpack the arguments in $TEMP into the positional parameters #1, #2, ...
+  unset TEMP
+
+  # Parse arguments
+  while true; do
+    # -- marks the end of the options, and anything after it is treated as a positional argument.
+    # If "$*" = "--", there are no optional parameters left, and we can break the loop
+    if [ "$*" = "--" ]; then
+      shift
+      break
+    fi
+
+    case "$1" in
+      "-r" | "--requirement")
+        requirements_file="$2"
+        shift 2
+      ;;
+      "-s" | "--skip-lock")
         skip_lock="--skip-lock"
         shift
       ;;
+      "--clean")
+        clean="--clean"
+        full_reinstall=true
+        shift
+      ;;
+      "--full-reinstall")
+        full_reinstall=true
+        shift
+      ;;
       "--pip-args")
         pip_args="$2"
         shift 2
@@ -484,55 +2991,126 @@ venv::uninstall() {
     return "${_fail}"
   fi
 
+  if ! venv::_check_venv_activated; then
+    return "${_fail}"
+  fi
+
+  # Wait for other venv commands using the same requirements file, since it is backed up and edited in place
+  if ! venv::_holds_lock "${requirements_file}"; then
+    venv::_with_lock exclusive "${requirements_file}" venv::uninstall -r "${requirements_file}" "${original_args[@]}"
+    return "$?"
+  fi
+
+  # Check whether the environment was installed from the requirements file before editing it,
+  # so the record of the installation can be kept up to date after uninstalling the packages
+  local stamp_file="$(venv::_state_dir)/install.stamp"
+  local was_installed=false
+  if [ -f "${stamp_file}" ] \
+    && [ "$(venv::_python_helper install-stamp "${requirements_file}" "${pip_args}")" = "$(cat "${stamp_file}")" ]; then
+    was_installed=true
+  fi
+
   # Make a temporary backup of the requirements file, in case something fails
   venv::_create_backup_file "${requirements_file}"
 
   # Remove package names from requirements file
-  if ! venv::_remove_packages_from_requirements "${requirements_file}" "${package_names[@]}"; then
-    return "${_fail}"
-  fi
-  if [ "$?" -eq 2 ]; then
+  local remove_status=0
+  venv::_trace "uninstall: edit requirements" \
+    venv::_remove_packages_from_requirements "${requirements_file}" "${package_names[@]}" || remove_status="$?"
+  if [ "${remove_status}" -eq 2 ]; then
     # If none of the packages were found in the requirements file, return without reinstalling
     venv::_remove_backup_file "${requirements_file}"
     return "${_success}"
+  elif [ "${remove_status}" -ne 0 ]; then
+    return "${_fail}"
   fi
 
   # Remove the backup file if everything went well
   venv::_remove_backup_file "${requirements_file}"
 
+  # Uninstall only the packages that are no longer required, unless a full reinstall was requested
+  local orphaned_packages
+  if ! "${full_reinstall}" \
+    && orphaned_packages="$(venv::_trace "uninstall: find orphans" \
+      venv::_python_helper orphaned-packages "${requirements_file}")"; then
+    venv::_uninstall_orphaned_packages "${requirements_file}" "${skip_lock}" "${orphaned_packages}" || return "${_fail}"
+    if "${was_installed}"; then
+      venv::_python_helper install-stamp "${requirements_file}" "${pip_args}" > "${stamp_file}"
+    else
+      rm -f "${stamp_file}"
+    fi
+    return "${_success}"
+  fi
+
   # Reinstall the environment from the requirements file. Pass through additional arguments
   venv::color_echo "${_green}" "Reinstalling requirements from ${requirements_file}"
-  if ! venv::install -r "${requirements_file}" ${skip_lock} --pip-args="${pip_args}"; then
+  if ! venv::_trace "uninstall: install" venv::install -r "${requirements_file}" ${skip_lock} ${clean} --pip-args="${pip_args}"; then
+    return "${_fail}"
+  fi
+}
+
+venv::_uninstall_orphaned_packages() {
+  ### Uninstall the packages given as a newline-separated list, which are no longer required by the requirements file,
+  ### then lock the environment unless '--skip-lock' is given
+  local requirements_file="$1"
+  local skip_lock="$2"
+
+  local orphaned_packages=()
+  local package
+  while read -r package; do
+    if [ -n "${package}" ]; then
+      orphaned_packages+=( "${package}" )
+    fi
+  done <<< "$3"
+
+  if [ "${#orphaned_packages[@]}" -eq 0 ]; then
+    venv::color_echo "${_yellow}" "The packages are still required by other requirements in ${requirements_file}, nothing to uninstall"
+  else
+    venv::color_echo "${_green}" "Uninstalling ${#orphaned_packages[@]} package(s) that are no longer required by ${requirements_file}"
+    if ! venv::_trace "uninstall: remove packages" venv::_python_helper remove-packages "${orphaned_packages[@]}"; then
+      return "${_fail}"
+    fi
+  fi
+
+  # Lock the remaining packages into the .lock-file
+  local lock_file="$(venv::_get_lock_from_requirements "${requirements_file}")"
+  if [ -n "${skip_lock}" ] || [ "${requirements_file}" = "${lock_file}" ]; then
+    venv::color_echo "${_yellow}" "Skipping locking packages to ${lock_file}"
+  elif ! venv::_trace "uninstall: lock" venv::lock "${lock_file}" -r "${requirements_file}"; then
     return "${_fail}"
   fi
 }
 
 venv::_remove_packages_from_requirements() {
+  ### Remove the packages from the requirements file, matching their names after normalizing them.
+  ### Returns 2 if none of the packages were found
   local requirements_file="$1"
   local package_names=("${@:2}")
 
-  local package_name
+  # Edit the requirements file in a single pass, then report what was changed
+  local edits
+  if ! edits="$(venv::_python_helper remove-requirements "${requirements_file}" "${package_names[@]}")"; then
+    return "${_fail}"
+  fi
+
+  local edit package_name
   local packages_removed=0
-  for package_name in "${package_names[@]}"; do
-    # Check if the package is in the requirements file
-    if ! command grep -q "^${package_name}" "${requirements_file}"; then
-      venv::color_echo "${_yellow}" "Package '${package_name}' not found in ${requirements_file}, skipping"
-      continue
-    fi
-    # Remove the package from the requirements file
-    sed -i "/^${package_name}/d" "${requirements_file}"
-    packages_removed=$((packages_removed+1))
-    echo "Removed '${package_name}' from ${requirements_file}"
-  done
+  while IFS=$'\t' read -r edit package_name; do
+    case "${edit}" in
+      "removed")
+        packages_removed=$((packages_removed+1))
+        echo "Removed '${package_name}' from ${requirements_file}"
+        ;;
+      "missing")
+        venv::color_echo "${_yellow}" "Package '${package_name}' not found in ${requirements_file}, skipping"
+        ;;
+    esac
+  done <<< "${edits}"
 
   if [ "${packages_removed}" -eq 0 ]; then
     venv::color_echo "${_yellow}" "None of the specified packages found in ${requirements_file}, nothing to remove"
     return 2
   fi
-
-  # Sort requirements file after removing packages. LC_COLLATE is set to C to ensure lines beginning with '-'
-  # are sorted first, instad of being ignored
-  LC_COLLATE=C sort --ignore-case --stable -o "${requirements_file}" "${requirements_file}"
 }
 
 venv::_create_backup_file() {
@@ -549,9 +3127,29 @@ venv::_remove_backup_file() {
   fi
 }
 
+venv::_lock_file_name() {
+  ### The name of the lock file given by <lock file>, <lock file prefix> or nothing, as described in 'venv lock --help'.
+  ### Fails if the argument looks like a file name, but is not a .lock-file
+  if [ -z "$1" ]; then
+    # If nothing was passed, default to "requirements.lock"
+    echo "requirements.lock"
+
+  elif [[ "$1" = *"."* ]]; then
+    # If first argument looks like a file name, it must be a lock file
+    if ! venv::_check_lock_requirements_file "$1" -q; then
+      return "${_fail}"
+    fi
+    echo "$1"
+
+  else
+    # If first argument is not a full filename, assume it is a lock file prefix
+    echo "$1-requirements.lock"
+  fi
+}
+
 venv::lock() {
   if venv::_check_if_help_requested "$1"; then
-    echo "venv lock [<lock file>|<lock file prefix>]"
+    echo "venv lock [<lock file>|<lock file prefix>] [OPTIONS]"
     echo
     echo "Lock all installed package versions and write them to <lock file>."
     echo "The <lock file> must have the file extension '.lock'."
@@ -562,6 +3160,15 @@ venv::lock() {
     echo
     echo "If no <lock file> is specified, defaults to 'requirements.lock'."
     echo
+    echo "The lock file is written from the package metadata in the environment, in the same format as 'pip freeze'."
+    echo
+    echo "Options:"
+    echo "  -h, --help                               Show this help and exit."
+    echo "  -r, --requirement <requirements file>    Restore environment variable credentials, e.g. '\${USER}:\${TOKEN}@',"
+    echo "                                           of URLs in the lock file from the given requirements file."
+    echo "  --verify                                 Compare the lock file with the output of 'pip freeze',"
+    echo "                                           and use the output of 'pip freeze' if they differ."
+    echo
     echo "Examples:"
     echo "$ venv lock"
     echo "This will lock requirements into 'requirements.lock'."
@@ -574,30 +3181,638 @@ venv::lock() {
     return "${_success}"
   fi
 
+  # Parse arguments. Fail if invalid arguments are passed
+  local TEMP
+  TEMP=$(getopt -o 'r:' --long 'requirement:,verify' -n 'venv lock' -- "$@")
+  local _exit="$?"
+  if [ "${_exit}" -ne 0 ]; then
+    return "${_exit}"
+  fi
+
+  local reference_file=""
+  local verify=false
+
+  eval set -- "$TEMP"  # Unpack the arguments in $TEMP into the positional parameters #1, #2, ...
+  unset TEMP
+
+  while true; do
+    case "$1" in
+      "-r" | "--requirement")
+        reference_file="$2"
+        shift 2
+      ;;
+      "--verify")
+        verify=true
+        shift
+      ;;
+      --)
+        # -- marks the end of the options, and anything after it is treated as a positional argument
+        shift
+        break
+      ;;
+    esac
+  done
+
   local lock_file
-  if [ -z "$1" ]; then
-    # If nothing was passed, default to "requirements.lock"
-    lock_file="requirements.lock"
+  if ! lock_file="$(venv::_lock_file_name "$1")"; then
+    venv::raise "Input file(s) had wrong format. See 'venv lock --help' for more info."
+    return "$?"
+  fi
 
-  elif [[ "$1" = *"."* ]]; then
-    # If first argument looks like a file name ...
-    if venv::_check_lock_requirements_file "$1" -q; then
-      # ... and is a lock file
-      lock_file="$1"
-    else
-      venv::raise "Input file(s) had wrong format. See 'venv lock --help' for more info."
+  if ! venv::_check_venv_activated; then
+    return "${_fail}"
+  fi
+
+  # Write locked requirements into lock file, read directly from the installed package metadata
+  local locked_file
+  locked_file="$(mktemp)"
+  if ! venv::_trace "lock: freeze" venv::_python_helper freeze "${reference_file}" > "${locked_file}"; then
+    venv::color_echo "${_yellow}" "Could not read installed packages, using 'pip freeze' instead"
+    pip freeze --require-virtualenv > "${locked_file}"
+  fi
+
+  if "${verify}"; then
+    local frozen_file
+    frozen_file="$(mktemp)"
+    venv::_trace "lock: pip freeze" pip freeze --require-virtualenv > "${frozen_file}"
+    # Credentials restored from the requirements file are not known to pip, so they are not compared
+    if ! diff -q <(sed -E "s|://${_env_var_auth_pattern}@|://|" "${locked_file}") "${frozen_file}" > /dev/null; then
+      venv::color_echo "${_yellow}" "Locked requirements differ from 'pip freeze', using 'pip freeze' instead:"
+      diff "${locked_file}" "${frozen_file}"
+      mv "${frozen_file}" "${locked_file}"
+    fi
+    rm -f "${frozen_file}"
+  fi
+
+  cat "${locked_file}" > "${lock_file}"
+  rm -f "${locked_file}"
+
+  venv::color_echo "${_green}" "Locked requirements in ${lock_file}"
+}
+
+
+venv::status() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv status [<lock file>|<lock file prefix>] [-q|--quiet]"
+    echo
+    echo "Check whether the installed packages match <lock file>, and list every package that is missing,"
+    echo "installed but not in <lock file>, or installed in a different version."
+    echo "Returns a non-zero exit code if the environment does not match <lock file>."
+    echo
+    echo "<lock file> and <lock file prefix> work the same way as for 'venv lock',"
+    echo "and if no <lock file> is specified, defaults to 'requirements.lock'."
+    echo
+    echo "The installed packages are read directly from the environment, and cached until packages are installed"
+    echo "or removed, so the check is fast enough to run in shell prompts or pre-commit hooks."
+    echo
+    echo "Options:"
+    echo "  -h, --help     Show this help and exit."
+    echo "  -q, --quiet    Don't print anything, only set the exit code."
+    echo
+    echo "Examples:"
+    echo "$ venv status"
+    echo "This will check the environment against 'requirements.lock'."
+    echo
+    echo "$ venv status dev -q || echo 'Environment is out of date'"
+    echo "This will check the environment against 'dev-requirements.lock' without printing anything."
+    return "${_success}"
+  fi
+
+  # Parse arguments. Fail if invalid arguments are passed
+  local TEMP
+  TEMP=$(getopt -o 'q' --long 'quiet' -n 'venv status' -- "$@")
+  local _exit="$?"
+  if [ "${_exit}" -ne 0 ]; then
+    return "${_exit}"
+  fi
+
+  local quiet=false
+
+  eval set -- "$TEMP"  # Unpack the arguments in $TEMP into the positional parameters #1, #2, ...
+  unset TEMP
+
+  while true; do
+    case "$1" in
+      "-q" | "--quiet")
+        quiet=true
+        shift
+      ;;
+      --)
+        # -- marks the end of the options, and anything after it is treated as a positional argument
+        shift
+        break
+      ;;
+    esac
+  done
+
+  local lock_file
+  if ! lock_file="$(venv::_lock_file_name "$1")"; then
+    venv::raise "Input file(s) had wrong format. See 'venv status --help' for more info."
+    return "$?"
+  fi
+  if [ ! -f "${lock_file}" ]; then
+    venv::raise "Lock file ${lock_file} does not exist"
+    return "$?"
+  fi
+
+  if ! venv::_check_venv_activated; then
+    return "${_fail}"
+  fi
+
+  local differences
+  if differences="$(venv::_python_helper status "${lock_file}")"; then
+    if ! "${quiet}"; then
+      venv::color_echo "${_green}" "Environment matches ${lock_file}"
+    fi
+    return "${_success}"
+  fi
+
+  if ! "${quiet}"; then
+    venv::color_echo "${_yellow}" "Environment does not match ${lock_file}:"
+    echo "${differences}"
+  fi
+  return "${_fail}"
+}
+
+
+venv::trace() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv trace summary [<trace file>]"
+    echo
+    echo "Show how long each phase of the venv commands took, as recorded in <trace file>."
+    echo
+    echo "To record a trace, set the environment variable VENV_CLI_TRACE to the path of a trace file,"
+    echo "e.g. 'export VENV_CLI_TRACE=~/venv-trace.jsonl'. Every venv command, and every phase of it,"
+    echo "like 'install: pip install' or 'install: lock', then appends its start time, duration, exit code and"
+    echo "the number of installed packages to the file, as one JSON object per line."
+    echo "Each line is a Chrome trace event, so a trace can be viewed in e.g. https://ui.perfetto.dev after"
+    echo "converting it to a JSON list: 'jq -s . trace.jsonl > trace.json'."
+    echo
+    echo "If no <trace file> is specified, defaults to \$VENV_CLI_TRACE."
+    echo
+    echo "Commands:"
+    echo "  summary    Show the number of runs, failed runs, and the mean, maximum and total duration of every phase,"
+    echo "             slowest first."
+    echo
+    echo "Examples:"
+    echo "$ VENV_CLI_TRACE=trace.jsonl venv install -r requirements.txt"
+    echo "$ venv trace summary trace.jsonl"
+    echo "This will record the phases of installing 'requirements.txt', and show how long each phase took."
+    return "${_success}"
+  fi
+
+  local trace_command="$1"
+  if [ "${trace_command}" != "summary" ]; then
+    venv::raise "Unknown trace command '${trace_command}'. See 'venv trace --help' for available commands."
+    return "$?"
+  fi
+
+  local trace_file="${2:-${VENV_CLI_TRACE}}"
+  if [ -z "${trace_file}" ]; then
+    venv::raise "No trace file specified, and \$VENV_CLI_TRACE is not set. See 'venv trace --help' for more info."
+    return "$?"
+  fi
+  if [ ! -f "${trace_file}" ]; then
+    venv::raise "Trace file ${trace_file} does not exist"
+    return "$?"
+  fi
+
+  venv::_python_helper trace-summary "${trace_file}"
+}
+
+
+venv::cache() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv cache [info|prune [<max size>]|purge|names [--fetch [<index url>]]]"
+    echo
+    echo "Show information about, or clean up, the wheelhouse shared by all environments."
+    echo
+    echo "'venv install' adds a wheel of every package it installs to the wheelhouse, and uses the wheels"
+    echo "from the wheelhouse when installing. When every requirement in a .lock-file is found in the wheelhouse,"
+    echo "the requirements are installed without contacting the package index at all."
+    echo
+    echo "Wheels built from git requirements are cached separately in '${_vcs_cache_dir}', under the commit"
+    echo "the requirement refers to, so each commit is only cloned and built once."
+    echo
+    echo "The packages resolved from the requirements in a .txt-file are cached in '${_resolutions_dir}',"
+    echo "so installing from the same requirements again does not resolve them again (see 'venv install --help')."
+    echo
+    echo "The wheelhouse is placed in '${_wheelhouse_dir}' (set \$VENV_CLI_WHEELHOUSE to change it)."
+    echo "When it grows beyond its maximum size of ${_wheelhouse_max_size} (set \$VENV_CLI_WHEELHOUSE_MAX_SIZE to change it),"
+    echo "the least recently used wheels are removed."
+    echo
+    echo "Commands:"
+    echo "  info                Show the location, number of wheels and size of the wheelhouse. This is the default."
+    echo "  prune [<max size>]  Remove the least recently used wheels until the wheelhouse is at most <max size>,"
+    echo "                      e.g. '500M'. Defaults to the maximum size of the wheelhouse."
+    echo "  purge               Remove all wheels from the wheelhouse and the git wheel cache, and all cached resolutions."
+    echo "  names [--fetch [<index url>]]"
+    echo "                      Update the package names used for completing 'venv install <TAB>' from the names of the"
+    echo "                      cached wheels. With '--fetch', first download the names of all projects on the package"
+    echo "                      index, which defaults to \$PIP_INDEX_URL or PyPI. The completion never contacts the index."
+    echo
+    echo "Examples:"
+    echo "$ venv cache"
+    echo "This will show the location, number of wheels and size of the wheelhouse."
+    echo
+    echo "$ venv cache prune 1G"
+    echo "This will remove the least recently used wheels until the wheelhouse takes up at most 1 GiB."
+    echo
+    echo "$ venv cache names --fetch"
+    echo "This will make 'venv install <TAB>' complete the names of all packages on the package index."
+    return "${_success}"
+  fi
+
+  local cache_command="${1:-info}"
+  case "${cache_command}" in
+    "info")
+      local wheel_count=0
+      local wheelhouse_size=0
+      if [ -d "${_wheelhouse_dir}" ]; then
+        wheel_count="$(find "${_wheelhouse_dir}" -maxdepth 1 -name '*.whl' | wc -l)"
+        wheelhouse_size="$(du -sb "${_wheelhouse_dir}" | cut -f1)"
+      fi
+      local vcs_wheel_count=0
+      local vcs_cache_size=0
+      if [ -d "${_vcs_cache_dir}" ]; then
+        vcs_wheel_count="$(find "${_vcs_cache_dir}" -name '*.whl' | wc -l)"
+        vcs_cache_size="$(du -sb "${_vcs_cache_dir}" | cut -f1)"
+      fi
+      echo "Wheelhouse: ${_wheelhouse_dir}"
+      echo "Wheels:     ${wheel_count}"
+      echo "Size:       $(numfmt --to=iec "${wheelhouse_size}") (max. ${_wheelhouse_max_size})"
+      echo
+      echo "Git wheels: ${_vcs_cache_dir}"
+      echo "Wheels:     ${vcs_wheel_count}"
+      echo "Size:       $(numfmt --to=iec "${vcs_cache_size}")"
+      echo
+      local resolution_count=0
+      if [ -d "${_resolutions_dir}" ]; then
+        resolution_count="$(find "${_resolutions_dir}" -maxdepth 1 -name '*.lock' | wc -l)"
+      fi
+      echo "Resolved requirements: ${_resolutions_dir}"
+      echo "Resolutions:           ${resolution_count}"
+      echo
+      local base_count=0
+      if [ -d "${_bases_dir}" ]; then
+        base_count="$(find "${_bases_dir}" -mindepth 1 -maxdepth 1 -type d | wc -l)"
+      fi
+      echo "Base environments: ${_bases_dir}"
+      echo "Environments:      ${base_count}"
+      ;;
+
+    "prune")
+      local removed
+      if ! removed="$(venv::_prune_wheelhouse "${2:-${_wheelhouse_max_size}}")"; then
+        echo "${removed}"
+        return "${_fail}"
+      fi
+      venv::color_echo "${_green}" "Removed ${removed} wheel(s) from the wheelhouse"
+      ;;
+
+    "purge")
+      rm -rf "${_wheelhouse_dir}" "${_vcs_cache_dir}" "${_resolutions_dir}"
+      venv::color_echo "${_green}" "Removed all wheels from the wheelhouse and the git wheel cache, and all cached resolutions"
+      ;;
+
+    "names")
+      if [ "$2" = "--fetch" ]; then
+        local index_url="${3:-${PIP_INDEX_URL:-https://pypi.org/simple}}"
+        echo "Fetching package names from $(echo "${index_url}" | sed -E 's|://[^/@]*@|://|')"
+        mkdir -p "${_cache_dir}"
+        local fetched_count
+        if ! fetched_count="$(venv::_python_helper fetch-package-names "${index_url}" "${_index_names_file}")"; then
+          venv::raise "Could not fetch package names from the package index"
+          return "$?"
+        fi
+        echo "Fetched ${fetched_count} package names"
+      elif [ -n "$2" ]; then
+        venv::raise "Unknown option '$2'. See 'venv cache --help' for available options."
+        return "$?"
+      fi
+
+      venv::_update_package_names || return "${_fail}"
+      venv::color_echo "${_green}" "Updated the package names in ${_package_names_file}"
+      ;;
+
+    *)
+      venv::raise "Unknown cache command '${cache_command}'. See 'venv cache --help' for available commands."
+      return "$?"
+      ;;
+  esac
+}
+
+
+venv::store() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv store [info|gc]"
+    echo
+    echo "Show information about, or clean up, the store of installed files shared by all environments."
+    echo
+    echo "'venv install --store', or 'venv install' when \$VENV_CLI_STORE is set, adds every installed file to the store,"
+    echo "keyed by its sha256 hash, and replaces the file in the environment by a hardlink to the file in the store."
+    echo "Every version of a package is then only kept on disk and in memory once, no matter how many environments"
+    echo "it is installed in. Removing a package, e.g. with 'venv clear', only removes the link from the environment."
+    echo "Since the files are shared, they must not be edited in place."
+    echo
+    echo "The store is placed in '${_store_dir}' (set \$VENV_CLI_STORE to change it), and must be on the same file system"
+    echo "as the environments."
+    echo
+    echo "Commands:"
+    echo "  info  Show the location, number of files and size of the store. This is the default."
+    echo "  gc    Remove the files that are not installed in any environment anymore."
+    echo
+    echo "Examples:"
+    echo "$ venv install -r requirements.lock --store"
+    echo "$ venv store gc"
+    echo "This will remove the files in the store that no environment links to anymore, e.g. after deleting environments."
+    return "${_success}"
+  fi
+
+  local store_command="${1:-info}"
+  case "${store_command}" in
+    "info")
+      local file_count=0
+      local store_size=0
+      if [ -d "${_store_dir}/objects" ]; then
+        file_count="$(find "${_store_dir}/objects" -type f | wc -l)"
+        store_size="$(du -sb "${_store_dir}" | cut -f1)"
+      fi
+      echo "Store: ${_store_dir}"
+      echo "Files: ${file_count}"
+      echo "Size:  $(numfmt --to=iec "${store_size}")"
+      ;;
+
+    "gc")
+      local removed
+      if ! removed="$(venv::_python_helper store-gc "${_store_dir}")"; then
+        return "${_fail}"
+      fi
+      local file_count="${removed%%$'\t'*}"
+      local files_size="${removed##*$'\t'}"
+      venv::color_echo "${_green}" "Removed ${file_count} file(s) ($(numfmt --to=iec "${files_size}")) from the store"
+      ;;
+
+    *)
+      venv::raise "Unknown store command '${store_command}'. See 'venv store --help' for available commands."
+      return "$?"
+      ;;
+  esac
+}
+
+
+venv::pack() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv pack [<archive>] [--strip]"
+    echo
+    echo "Pack the active environment into a compressed archive, which 'venv unpack' can unpack anywhere,"
+    echo "e.g. on another machine, without installing anything or contacting the package index."
+    echo "The archive holds the environment, the locked requirements and the python it was created with."
+    echo "It can only be unpacked where the same python version is installed in the same location."
+    echo
+    echo "The compression is chosen by the extension of <archive>, e.g. '.tar.gz', '.tar.zst' or '.tar.xz'."
+    echo "If no <archive> is specified, defaults to 'venv.tar.gz'."
+    echo
+    echo "Options:"
+    echo "  --strip  Leave out bytecode ('__pycache__'), and the 'tests' and 'docs' folders of the installed packages."
+    echo
+    echo "Examples:"
+    echo "$ venv pack environment.tar.zst --strip"
+    echo "This will pack the active environment into 'environment.tar.zst', without bytecode, tests and docs."
+    return "${_success}"
+  fi
+
+  local TEMP
+  TEMP=$(getopt -o '' --long 'strip' -n 'venv pack' -- "$@")
+  local _exit="$?"
+  if [ "${_exit}" -ne 0 ]; then
+    return "${_exit}"
+  fi
+  eval set -- "$TEMP"
+  unset TEMP
+
+  local strip=false
+  while [ "$1" != "--" ]; do
+    case "$1" in
+      "--strip")
+        strip=true
+        ;;
+    esac
+    shift
+  done
+  shift
+  local archive="${1:-venv.tar.gz}"
+
+  if ! venv::_check_venv_activated; then
+    return "${_fail}"
+  fi
+
+  # The metadata is packed first, so 'venv unpack' can check it without decompressing the whole archive
+  local metadata_dir="$(mktemp -d)"
+  if ! venv::_python_helper pack-metadata "${metadata_dir}/venv-pack.json"; then
+    rm -rf "${metadata_dir}"
+    return "${_fail}"
+  fi
+
+  local exclude_args=( --exclude="./.venv-cli/installed-index.json" --exclude="./.venv-cli/pack.json" )
+  if "${strip}"; then
+    exclude_args+=( --exclude="__pycache__" --exclude="./lib/*/site-packages/*/tests" --exclude="./lib/*/site-packages/*/docs" )
+  fi
+
+  venv::color_echo "${_green}" "Packing ${VIRTUAL_ENV} into ${archive}"
+  if ! venv::_trace "pack: archive" tar --create --auto-compress --file "${archive}" \
+    -C "${metadata_dir}" venv-pack.json -C "${VIRTUAL_ENV}" "${exclude_args[@]}" .; then
+    rm -rf "${metadata_dir}" "${archive}"
+    return "${_fail}"
+  fi
+  rm -rf "${metadata_dir}"
+  venv::color_echo "${_green}" "Packed the environment into ${archive} ($(du -h "${archive}" | cut -f1))"
+}
+
+venv::unpack() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv unpack <archive> [<environment folder>]"
+    echo
+    echo "Unpack an environment packed with 'venv pack' into <environment folder>, which defaults to '.venv'"
+    echo "in the current folder, and update the paths in its scripts to the new location."
+    echo "The archive is decompressed and unpacked in a single pass, without any temporary copy."
+    echo "Fails without unpacking anything if the python the environment was created with is not installed"
+    echo "in the same location, or is a different version."
+    echo
+    echo "Examples:"
+    echo "$ venv unpack environment.tar.zst"
+    echo "$ venv activate"
+    echo "This will unpack the environment in 'environment.tar.zst' into '.venv', and activate it."
+    return "${_success}"
+  fi
+
+  local archive="$1"
+  local venv_dir="${2:-.venv}"
+  if [ -z "${archive}" ]; then
+    venv::raise "No archive specified. See 'venv unpack --help' for more info."
+    return "$?"
+  elif [ ! -f "${archive}" ]; then
+    venv::raise "Archive ${archive} not found"
+    return "$?"
+  elif [ -e "${venv_dir}" ]; then
+    venv::raise "${venv_dir} already exists. Delete it first, or unpack into another folder"
+    return "$?"
+  fi
+
+  # Check the python in the metadata, which is the first file in the archive
+  local metadata_dir="$(mktemp -d)"
+  local old_prefix
+  if ! tar --extract --file "${archive}" --occurrence=1 -C "${metadata_dir}" venv-pack.json \
+    || ! old_prefix="$(venv::_python_helper check-pack "${metadata_dir}/venv-pack.json")"; then
+    rm -rf "${metadata_dir}"
+    venv::raise "Could not unpack ${archive}, see above"
+    return "$?"
+  fi
+  rm -rf "${metadata_dir}"
+
+  venv::color_echo "${_green}" "Unpacking ${archive} into ${venv_dir}"
+  mkdir -p "${venv_dir}"
+  if ! venv::_trace "unpack: archive" tar --extract --file "${archive}" -C "${venv_dir}"; then
+    rm -rf "${venv_dir}"
+    return "${_fail}"
+  fi
+  mkdir -p "${venv_dir}/.venv-cli"
+  mv "${venv_dir}/venv-pack.json" "${venv_dir}/.venv-cli/pack.json"
+
+  venv::_relocate_venv "${venv_dir}" "${old_prefix}" "$(realpath "${venv_dir}")"
+  venv::color_echo "${_green}" "Unpacked the environment into ${venv_dir}"
+}
+
+
+venv::profile_imports() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv profile-imports [-n|--runs <runs>] [--json <file>] <module or script> [script arguments]"
+    echo
+    echo "Show how long importing <module or script> takes in the active environment, per installed package."
+    echo "A module is imported (e.g. 'pandas' or 'myservice.app'), while a script is run with the given arguments,"
+    echo "so it must exit by itself. Both are run <runs> times (default: 5) with 'python -X importtime', and the"
+    echo "mean import time of the modules installed by every package is shown, ranked by cumulative time."
+    echo
+    echo "The self time of a package is the time spent importing its own modules. The cumulative time also includes"
+    echo "everything those modules import from other packages. Modules that are not installed by any package are"
+    echo "counted as '(stdlib)' or '(other)'."
+    echo
+    echo "The full report is written as JSON to <file>, which defaults to '.venv-cli/import-profile.json' in the"
+    echo "active environment."
+    echo
+    echo "Examples:"
+    echo "$ venv profile-imports -n 10 myservice.app"
+    echo "This will import 'myservice.app' 10 times, and show which packages take the longest to import."
+    return "${_success}"
+  fi
+
+  # Options are only parsed up to the module or script, the rest are arguments for the script
+  local TEMP
+  TEMP=$(getopt -o '+n:' --long 'runs:,json:' -n 'venv profile-imports' -- "$@")
+  local _exit="$?"
+  if [ "${_exit}" -ne 0 ]; then
+    return "${_exit}"
+  fi
+  eval set -- "$TEMP"
+  unset TEMP
+
+  local runs=5
+  local json_file=""
+  while [ "$1" != "--" ]; do
+    case "$1" in
+      "-n" | "--runs")
+        runs="$2"
+        shift
+        ;;
+      "--json")
+        json_file="$2"
+        shift
+        ;;
+    esac
+    shift
+  done
+  shift
+
+  local target="$1"
+  if [ -z "${target}" ]; then
+    venv::raise "No module or script specified. See 'venv profile-imports --help' for more info."
+    return "$?"
+  fi
+  shift
+  if [[ ! "${runs}" =~ ^[1-9][0-9]*$ ]]; then
+    venv::raise "Number of runs must be a positive integer, was '${runs}'"
+    return "$?"
+  fi
+  local run_args=( -c "import ${target}" )
+  if [ -f "${target}" ]; then
+    run_args=( "${target}" "$@" )
+  elif [[ ! "${target}" =~ ^[A-Za-z_][A-Za-z0-9_.]*$ ]]; then
+    venv::raise "'${target}' is neither a script nor a module name"
+    return "$?"
+  fi
+
+  if ! venv::_check_venv_activated; then
+    return "${_fail}"
+  fi
+  if [ -z "${json_file}" ]; then
+    json_file="$(venv::_state_dir)/import-profile.json"
+  fi
+
+  venv::color_echo "${_green}" "Profiling the imports of ${target} in ${runs} run(s)"
+  local log_dir="$(mktemp -d)"
+  local run
+  for run in $(seq "${runs}"); do
+    if ! python -X importtime "${run_args[@]}" > /dev/null 2> "${log_dir}/${run}.log"; then
+      grep -v '^import time:' "${log_dir}/${run}.log"
+      rm -rf "${log_dir}"
+      venv::raise "Importing ${target} failed, see above"
       return "$?"
     fi
+  done
 
-  else
-    # If first argument is not a full filename, assume it is a lock file prefix
-    lock_file="$1-requirements.lock"
+  local log_files=()
+  for run in $(seq "${runs}"); do
+    log_files+=( "${log_dir}/${run}.log" )
+  done
+  if ! venv::_python_helper profile-imports "${target}" "${json_file}" "${log_files[@]}"; then
+    rm -rf "${log_dir}"
+    return "${_fail}"
   fi
+  rm -rf "${log_dir}"
+  echo
+  echo "Full report written to ${json_file}"
+}
 
-  # Write locked requirements into lock file
-  pip freeze --require-virtualenv > "${lock_file}"
 
-  venv::color_echo "${_green}" "Locked requirements in ${lock_file}"
+venv::rollback() {
+  if venv::_check_if_help_requested "$1"; then
+    echo "venv rollback"
+    echo
+    echo "Swap the active environment with the previous environment, which 'venv install --atomic' keeps"
+    echo "next to it, e.g. in '.venv.prev'. The swap is a single rename, so it takes effect immediately."
+    echo "Running 'venv rollback' again swaps the environments back."
+    echo
+    echo "Examples:"
+    echo "$ venv install -r requirements.lock --atomic"
+    echo "$ venv rollback"
+    echo "This will restore the environment as it was before the installation."
+    return "${_success}"
+  fi
+
+  if ! venv::_check_venv_activated; then
+    return "${_fail}"
+  fi
+
+  local prev_dir="${VIRTUAL_ENV}.prev"
+  if [ ! -d "${prev_dir}" ]; then
+    venv::raise "No previous environment found in ${prev_dir}, nothing to roll back to"
+    return "$?"
+  fi
+
+  if ! venv::_python_helper exchange-paths "${prev_dir}" "${VIRTUAL_ENV}"; then
+    return "${_fail}"
+  fi
+  venv::color_echo "${_green}" "Rolled back ${VIRTUAL_ENV} to the previous environment. Run 'venv rollback' again to undo"
 }
 
 
@@ -605,7 +3820,11 @@ venv::clear() {
   if venv::_check_if_help_requested "$1"; then
     echo "venv clear"
     echo
-    echo "Clear the virtual environment by uninstalling all packages."
+    echo "Clear the virtual environment by uninstalling all packages, except pip, setuptools and wheel."
+    echo
+    echo "Packages are removed by deleting the files listed in their RECORD directly, which is much faster"
+    echo "than 'pip uninstall'. Packages without a RECORD, or with files outside the environment, are"
+    echo "uninstalled using pip."
     echo
     echo "Examples:"
     echo "$ venv clear"
@@ -617,12 +3836,9 @@ venv::clear() {
   fi
 
   venv::color_echo "${_yellow}" "Removing all packages from virtual environment ..."
-  pip list --format freeze \
-    --exclude pip \
-    --exclude setuptools \
-    --exclude wheel \
-    | cut -d "=" -f1 \
-    | xargs --no-run-if-empty pip uninstall --require-virtualenv -y
+  if ! venv::_trace "clear: remove packages" venv::_python_helper remove-packages; then
+    return "${_fail}"
+  fi
   venv::color_echo "${_green}" "All packages removed!"
 }
 
@@ -640,7 +3856,16 @@ venv::help() {
   echo "install        Install individual packages, or requirements from a requirements file, in the current environment"
   echo "uninstall      Uninstall packages from the current environment and reinstall from a requirements file"
   echo "lock           Lock installed requirements in a '.lock'-file"
+  echo "rollback       Restore the environment replaced by 'venv install --atomic'"
+  echo "status         Check whether the installed packages match a '.lock'-file"
   echo "clear          Remove all installed packages in the current environment"
+  echo "cache          Show information about, or clean up, the wheelhouse shared by all environments"
+  echo "store          Show information about, or clean up, the store of installed files shared by all environments"
+  echo "pack           Pack the current environment into a compressed archive, which can be unpacked anywhere"
+  echo "unpack         Unpack an environment packed with 'venv pack'"
+  echo "profile-imports"
+  echo "               Show how long importing a module or running a script spends importing each installed package"
+  echo "trace          Show how long each phase of the venv commands took, recorded with \$VENV_CLI_TRACE"
   echo "deactivate     Deactivate the currently activated virtual environment"
   echo "-h, --help     Show this help and exit"
   echo "-v, --version  Show the venv-cli version number and exit"
@@ -662,16 +3887,34 @@ venv::main() {
       ;;
 
     activate \
+    | cache \
     | clear \
     | create \
     | deactivate \
     | delete \
     | install \
     | lock \
+    | pack \
+    | profile-imports \
+    | rollback \
+    | status \
+    | store \
+    | trace \
     | uninstall \
+    | unpack \
     )
       shift
-      venv::"${subcommand}" "$@"
+      # Commands changing the active environment wait for each other, while commands reading it share the lock
+      local lock_mode=""
+      case "${subcommand}" in
+        clear | install | rollback | uninstall)
+          lock_mode="exclusive"
+          ;;
+        lock | pack | profile-imports | status)
+          lock_mode="shared"
+          ;;
+      esac
+      venv::_trace "venv ${subcommand}" venv::_with_lock "${lock_mode}" "${VIRTUAL_ENV}" venv::"${subcommand//-/_}" "$@"
       ;;
 
     *)
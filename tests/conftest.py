@@ -1,3 +1,7 @@
+import base64
+import hashlib
+import subprocess
+import zipfile
 from pathlib import Path
 from shutil import copy2
 
@@ -31,3 +35,107 @@ def venv_dir(tmp_path: Path) -> RequirementFiles:
         }
     )
     return files
+
+
+@pytest.fixture
+def git_package(tmp_path: Path) -> str:
+    """
+    Create a git repository containing a minimal package called 'tinypkg', tagged 'v0.1.0',
+    with an extra 'two' depending on 'fakepkg-two'. Returns the git URL
+    """
+    repository = tmp_path / "tinypkg-repository"
+    (repository / "tinypkg").mkdir(parents=True)
+    (repository / "tinypkg" / "__init__.py").touch()
+    (repository / "pyproject.toml").write_text(
+        "\n".join(
+            [
+                "[build-system]",
+                'requires = ["setuptools"]',
+                'build-backend = "setuptools.build_meta"',
+                "[project]",
+                'name = "tinypkg"',
+                'version = "0.1.0"',
+                "[project.optional-dependencies]",
+                'two = ["fakepkg-two"]',
+            ]
+        )
+    )
+
+    git = ["git", "-C", str(repository), "-c", "user.name=venv-cli", "-c", "user.email=venv-cli@example.com"]
+    subprocess.run([*git, "init", "--quiet"], check=True)
+    subprocess.run([*git, "add", "."], check=True)
+    subprocess.run([*git, "commit", "--quiet", "-m", "Initial commit"], check=True)
+    subprocess.run([*git, "tag", "-a", "v0.1.0", "-m", "v0.1.0"], check=True)
+    return f"git+file://localhost{repository}"
+
+
+def _build_wheel(name: str, version: str, wheel_dir: Path, requires: tuple[str, ...] = ()) -> Path:
+    """Build a minimal pure python wheel for the package 'name' in 'version' in 'wheel_dir',
+    depending on the requirements in 'requires'"""
+    module = name.replace("-", "_")
+    dist_info = f"{module}-{version}.dist-info"
+    requires_dist = "".join(f"Requires-Dist: {requirement}\n" for requirement in requires)
+    files = {
+        f"{module}/__init__.py": "",
+        f"{dist_info}/METADATA": f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n{requires_dist}",
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nGenerator: venv-cli-tests\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    record_lines = []
+    for path, contents in files.items():
+        digest = base64.urlsafe_b64encode(hashlib.sha256(contents.encode()).digest()).rstrip(b"=").decode()
+        record_lines.append(f"{path},sha256={digest},{len(contents.encode())}")
+    files[f"{dist_info}/RECORD"] = "\n".join([*record_lines, f"{dist_info}/RECORD,,"]) + "\n"
+
+    wheel_path = wheel_dir / f"{module}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(wheel_path, "w") as wheel:
+        for path, contents in files.items():
+            wheel.writestr(path, contents)
+    return wheel_path
+
+
+def _build_index(index: Path, packages: dict[str, tuple[str, ...]]) -> str:
+    """Build a local package index with the packages in version 1.0, each depending on the given requirements.
+    Returns the index URL, to be used with 'pip install --index-url'"""
+    files = index / "files"
+    files.mkdir(parents=True)
+    for name, requires in packages.items():
+        wheel_path = _build_wheel(name=name, version="1.0", wheel_dir=files, requires=requires)
+        project = index / "simple" / name
+        project.mkdir(parents=True)
+        (project / "index.html").write_text(f'<a href="../../files/{wheel_path.name}">{wheel_path.name}</a>\n')
+    return f"file://{index / 'simple'}"
+
+
+@pytest.fixture
+def local_index(tmp_path: Path) -> str:
+    """
+    Create a local package index with the packages 'fakepkg-one', 'fakepkg-two' and 'fakepkg-three' in version 1.0.
+    Returns the index URL, to be used with 'pip install --index-url'
+    """
+    return _build_index(tmp_path / "index", {"fakepkg-one": (), "fakepkg-two": (), "fakepkg-three": ()})
+
+
+@pytest.fixture
+def dependency_index(tmp_path: Path) -> str:
+    """
+    Create a local package index where 'fakeapp-one' depends on 'fakepkg-shared' and 'fakepkg-one',
+    'fakepkg-one' depends on 'fakepkg-two', and 'fakeapp-two' depends on 'fakepkg-shared'.
+    Returns the index URL, to be used with 'pip install --index-url'
+    """
+    packages = {
+        "fakeapp-one": ("fakepkg-shared", "fakepkg-one"),
+        "fakeapp-two": ("fakepkg-shared",),
+        "fakepkg-one": ("fakepkg-two",),
+        "fakepkg-two": (),
+        "fakepkg-shared": (),
+    }
+    return _build_index(tmp_path / "index", packages)
+
+
+@pytest.fixture
+def wheel_dependency_index(tmp_path: Path) -> str:
+    """
+    Create a local package index where 'fakepkg-one' depends on 'wheel', which 'pip freeze' leaves out of .lock-files,
+    and a stand-in 'wheel' package. Returns the index URL, to be used with 'pip install --index-url'
+    """
+    return _build_index(tmp_path / "index", {"fakepkg-one": ("wheel>=0.1",), "wheel": ()})
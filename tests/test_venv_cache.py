@@ -0,0 +1,132 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import run_command
+
+
+@pytest.fixture
+def wheelhouse(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Use a wheelhouse in a temporary folder, so tests don't share wheels"""
+    wheelhouse = tmp_path / "wheels"
+    monkeypatch.setenv(name="VENV_CLI_WHEELHOUSE", value=str(wheelhouse))
+    return wheelhouse
+
+
+@pytest.mark.order(after="test_venv_install.py::test_venv_install")
+def test_venv_install_fills_wheelhouse(wheelhouse: Path, tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv install' adds installed packages to the wheelhouse, and installs from it without an index"""
+    (tmp_path / "requirements.txt").write_text("python-json-logger==2.0.7\n")
+    run_command("venv install -r requirements.txt", cwd=tmp_path, activated=True)
+
+    wheels = [wheel.name for wheel in wheelhouse.glob("*.whl")]
+    assert wheels == ["python_json_logger-2.0.7-py3-none-any.whl"]
+
+    run_command(["venv clear", "venv install -r requirements.lock"], cwd=tmp_path, activated=True)
+    output = capfd.readouterr().out
+    assert "All requirements found in wheelhouse, installing without index" in output
+
+
+def test_venv_install_fills_wheelhouse_with_install_options(
+    wheelhouse: Path, local_index: str, tmp_path: Path, capfd: pytest.CaptureFixture[str]
+):
+    """Checks that install options in '--pip-args', which 'pip wheel' does not accept, don't stop 'venv install'
+    from adding the installed packages to the wheelhouse"""
+    (tmp_path / "requirements.txt").write_text("fakepkg-one\nfakepkg-two\n")
+    pip_args = f"--index-url {local_index} --upgrade --no-warn-script-location"
+    run_command(f"venv install -r requirements.txt --pip-args='{pip_args}'", cwd=tmp_path, activated=True)
+
+    wheels = sorted(wheel.name for wheel in wheelhouse.glob("*.whl"))
+    assert wheels == ["fakepkg_one-1.0-py3-none-any.whl", "fakepkg_two-1.0-py3-none-any.whl"]
+    assert "to the wheelhouse, continuing" not in capfd.readouterr().out
+
+
+@pytest.mark.order(after="test_venv_install.py::test_venv_install")
+def test_venv_install_no_wheelhouse(wheelhouse: Path, tmp_path: Path):
+    """Checks that 'venv install --no-wheelhouse' leaves the wheelhouse alone"""
+    (tmp_path / "requirements.txt").write_text("python-json-logger==2.0.7\n")
+    run_command("venv install -r requirements.txt --no-wheelhouse", cwd=tmp_path, activated=True)
+
+    assert not wheelhouse.exists()
+
+
+def test_venv_cache_info(wheelhouse: Path, tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv cache' shows information about the wheelhouse"""
+    wheelhouse.mkdir()
+    (wheelhouse / "pkg-1.0-py3-none-any.whl").write_bytes(b"0" * 1024)
+
+    run_command("venv cache", cwd=tmp_path)
+
+    output = capfd.readouterr().out
+    assert f"Wheelhouse: {wheelhouse}" in output
+    assert "Wheels:     1" in output
+
+
+def test_venv_cache_prune(wheelhouse: Path, tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv cache prune' removes the least recently used wheels first"""
+    wheelhouse.mkdir()
+    for age, name in enumerate(["new", "old", "older"]):
+        wheel = wheelhouse / f"{name}-1.0-py3-none-any.whl"
+        wheel.write_bytes(b"0" * 1024)
+        timestamp = 1_700_000_000 - age * 1000
+        os.utime(wheel, (timestamp, timestamp))
+
+    run_command("venv cache prune 1K", cwd=tmp_path)
+
+    output = capfd.readouterr().out
+    assert "Removed 2 wheel(s)" in output
+    assert [wheel.name for wheel in wheelhouse.glob("*.whl")] == ["new-1.0-py3-none-any.whl"]
+
+
+def test_venv_cache_purge(wheelhouse: Path, tmp_path: Path):
+    """Checks that 'venv cache purge' removes every wheel"""
+    wheelhouse.mkdir()
+    (wheelhouse / "pkg-1.0-py3-none-any.whl").write_bytes(b"0")
+
+    run_command("venv cache purge", cwd=tmp_path)
+
+    assert not wheelhouse.exists()
+
+
+def test_venv_cache_names(
+    wheelhouse: Path,
+    local_index: str,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capfd: pytest.CaptureFixture[str],
+):
+    """Checks that 'venv cache names' collects the package names from the wheelhouse and the package index,
+    and that 'venv install <TAB>' completes them"""
+    monkeypatch.setenv(name="XDG_CACHE_HOME", value=str(tmp_path / "cache"))
+    monkeypatch.setenv(name="PIP_CACHE_DIR", value=str(tmp_path / "pip"))
+    wheelhouse.mkdir()
+    (wheelhouse / "Fake_Pkg.Four-1.0-py3-none-any.whl").write_bytes(b"0")
+
+    run_command(f"venv cache names --fetch {local_index}", cwd=tmp_path)
+
+    output = capfd.readouterr().out
+    assert "Fetched 3 package names" in output
+    names_file = tmp_path / "cache" / "venv-cli" / "package-names"
+    assert names_file.read_text().splitlines() == ["fake-pkg-four", "fakepkg-one", "fakepkg-three", "fakepkg-two"]
+
+    completion_script = Path.cwd() / "src" / "venv-cli" / "completions" / "bash" / "venv_completion.sh"
+    run_command(
+        [
+            f". {completion_script} 2> /dev/null",
+            "COMP_WORDS=(venv install FakePkg-T)",
+            "COMP_CWORD=2",
+            "_venv 2> /dev/null",
+            'echo "${COMPREPLY[*]}"',
+        ],
+        cwd=tmp_path,
+    )
+    assert capfd.readouterr().out == "fakepkg-three fakepkg-two\n"
+
+
+@pytest.mark.parametrize("command", ["venv cache asdf", "venv cache prune asdf", "venv cache names asdf"])
+def test_venv_cache_raises(command: str, wheelhouse: Path, tmp_path: Path):
+    """Checks that 'venv cache' fails on unknown commands and invalid sizes"""
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command(command, cwd=tmp_path)
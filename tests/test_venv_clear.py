@@ -13,3 +13,26 @@ def test_venv_clear(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
     output = capfd.readouterr().out
     assert "Removing all packages" in output
     assert "All packages removed" in output
+
+
+@pytest.mark.order(after="test_venv_install.py::test_venv_install")
+def test_venv_clear_removes_all_files(git_package: str, tmp_path: Path):
+    """Checks that 'venv clear' removes every file of installed packages, including editable installs and scripts"""
+    editable_package = tmp_path / "tinypkg-repository"
+    run_command(
+        [
+            "pip install python-json-logger==2.0.7",
+            f"pip install -e {editable_package}",
+            "venv clear",
+            "pip freeze --all > installed.txt",
+        ],
+        activated=True,
+        cwd=tmp_path,
+    )
+
+    installed = [line.split("==")[0] for line in (tmp_path / "installed.txt").read_text().splitlines()]
+    assert sorted(installed) == ["pip", "setuptools"]
+
+    site_packages = next((tmp_path / ".venv" / "lib").glob("python*/site-packages"))
+    leftovers = [path.name for path in site_packages.iterdir() if "json" in path.name or "tinypkg" in path.name]
+    assert leftovers == []
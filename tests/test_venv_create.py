@@ -1,4 +1,7 @@
+import os
+import platform
 import subprocess
+import sys
 from pathlib import Path
 
 import pytest
@@ -35,3 +38,103 @@ def test_venv_create_name(venv_name: str, tmp_path: Path):
         actual_prompt = prompt_config.removeprefix("prompt = '").removesuffix("'")
 
     assert actual_prompt == venv_name
+
+
+@pytest.mark.order(after="test_venv_source.py::test_venv_source")
+def test_venv_create_from_template(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]):
+    """Checks that environments are copied from a template, and work from their new location"""
+    monkeypatch.setenv(name="XDG_CACHE_HOME", value=str(tmp_path / "cache"))
+    for project in ["project-1", "project 2"]:
+        (tmp_path / project).mkdir()
+        run_command(f"venv create {current_python_version}", cwd=tmp_path / project)
+
+    templates = list((tmp_path / "cache" / "venv-cli" / "templates").iterdir())
+    assert len(templates) == 1
+
+    for project in ["project-1", "project 2"]:
+        venv_path = tmp_path / project / ".venv"
+        run_command(
+            ["venv activate", "pip --version", "python -c 'import sys; print(sys.prefix)'"], cwd=venv_path.parent
+        )
+        output = capfd.readouterr().out
+        assert f"from {venv_path}" in output
+        assert f"{venv_path}\n" in output
+
+        activate_script = (venv_path / "bin" / "activate").read_text()
+        assert f'VIRTUAL_ENV="{venv_path}"' in activate_script
+        assert f"({project})" in activate_script
+
+
+@pytest.mark.order(after="test_venv_source.py::test_venv_source")
+def test_venv_create_no_template(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Checks that 'venv create --no-template' creates the environment from scratch"""
+    monkeypatch.setenv(name="XDG_CACHE_HOME", value=str(tmp_path / "cache"))
+    run_command(f"venv create {current_python_version} --no-template", cwd=tmp_path)
+
+    assert (tmp_path / ".venv" / "bin" / "pip").exists()
+    assert not (tmp_path / "cache" / "venv-cli" / "templates").exists()
+
+
+@pytest.mark.order(after="test_venv_source.py::test_venv_source")
+def test_venv_create_newest_python(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv create 3' uses the newest python3.X on $PATH, and that the registry of interpreters
+    is updated when a new one is added to $PATH"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "python3.997").symlink_to(sys.executable)
+    monkeypatch.setenv(name="PATH", value=f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv(name="XDG_CACHE_HOME", value=str(tmp_path / "cache"))
+
+    run_command("venv::_find_python 3", cwd=tmp_path)
+    assert capfd.readouterr().out == f"{bin_dir / 'python3.997'}\t{platform.python_version()}\n"
+
+    (bin_dir / "python3.998").symlink_to(sys.executable)
+    (tmp_path / "project").mkdir()
+    run_command("venv create 3", cwd=tmp_path / "project")
+    assert f"using Python {platform.python_version()}" in capfd.readouterr().out
+    assert f"home = {bin_dir}" in (tmp_path / "project" / ".venv" / "pyvenv.cfg").read_text()
+
+    registry = (tmp_path / "cache" / "venv-cli" / "pythons.tsv").read_text()
+    assert f"3.998\t{bin_dir / 'python3.998'}\t{platform.python_version()}\t1\t1\n" in registry
+
+
+@pytest.mark.order(after="test_venv_source.py::test_venv_source")
+def test_venv_create_python_without_venv(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]
+):
+    """Checks that a python without the 'venv' module is skipped by 'venv create 3', and fails 'venv create 3.X'"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    python_executable = bin_dir / "python3.999"
+    python_executable.write_text("#!/bin/sh\nprintf '3.999.0\\t0\\t1\\n'\n")
+    python_executable.chmod(0o755)
+    monkeypatch.setenv(name="PATH", value=f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv(name="XDG_CACHE_HOME", value=str(tmp_path / "cache"))
+
+    run_command("venv::_find_python 3", cwd=tmp_path)
+    assert "python3.999" not in capfd.readouterr().out
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command("venv create 3.999", cwd=tmp_path)
+    assert "the 'venv' or 'ensurepip' module is missing" in capfd.readouterr().out
+    assert not (tmp_path / ".venv").exists()
+
+
+@pytest.mark.order(after="test_venv_source.py::test_venv_source")
+def test_venv_create_python_version_compared_as_string(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]
+):
+    """Checks that 'venv create 3.9910' doesn't use a python3.991, even though the versions are equal as numbers"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "python3.991").symlink_to(sys.executable)
+    monkeypatch.setenv(name="PATH", value=f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv(name="XDG_CACHE_HOME", value=str(tmp_path / "cache"))
+
+    run_command("venv::_find_python 3.991", cwd=tmp_path)
+    assert capfd.readouterr().out == f"{bin_dir / 'python3.991'}\t{platform.python_version()}\n"
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command("venv create 3.9910", cwd=tmp_path)
+    assert "Couldn't locate 'python3.9910'" in capfd.readouterr().out
+    assert not (tmp_path / ".venv").exists()
@@ -27,7 +27,15 @@ def test_venv_help(arg: str, tmp_path: Path, capfd: pytest.CaptureFixture[str]):
         "install",
         "uninstall",
         "lock",
+        "rollback",
+        "status",
+        "trace",
         "clear",
+        "cache",
+        "store",
+        "pack",
+        "unpack",
+        "profile-imports",
     ],
 )
 @pytest.mark.parametrize("help_arg", ["-h", "--help"])
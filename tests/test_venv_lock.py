@@ -71,3 +71,44 @@ def test_venv_lock_echo(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
 
     output = capfd.readouterr().out
     assert "Locked requirements in" in output
+
+
+@pytest.mark.order(after="test_venv_activate.py::test_venv_activate")
+def test_venv_lock_matches_pip_freeze(git_package: str, tmp_path: Path):
+    """Checks that the lock file is identical to the output of 'pip freeze'"""
+    (tmp_path / "requirements.txt").write_text(f"python-json-logger==2.0.7\nTinyPkg @ {git_package}@v0.1.0\n")
+
+    run_command(
+        [
+            "venv install -r requirements.txt",
+            "pip freeze --require-virtualenv > freeze.txt",
+            "venv lock --verify",
+        ],
+        cwd=tmp_path,
+        activated=True,
+    )
+
+    assert (tmp_path / "requirements.lock").read_text() == (tmp_path / "freeze.txt").read_text()
+
+
+@pytest.mark.order(after="test_venv_activate.py::test_venv_activate")
+def test_venv_lock_restores_env_var_credentials(git_package: str, tmp_path: Path):
+    """Checks that environment variable credentials in the requirements file are kept in the lock file"""
+    (tmp_path / "requirements.txt").write_text(f"tinypkg @ {git_package}@v0.1.0\n")
+    credentials_url = git_package.replace("://", "://${TEST_USER}:${TEST_PASS}@")
+    (tmp_path / "credentials-requirements.txt").write_text(f"tinypkg @ {credentials_url}@v0.1.0\n")
+
+    run_command(
+        [
+            "venv install -r requirements.txt --skip-lock",
+            "venv lock -r credentials-requirements.txt",
+        ],
+        cwd=tmp_path,
+        activated=True,
+    )
+
+    commit = subprocess.run(
+        ["git", "-C", str(tmp_path / "tinypkg-repository"), "rev-parse", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    lock_file_contents = (tmp_path / "requirements.lock").read_text().splitlines()
+    assert lock_file_contents == [f"tinypkg @ {credentials_url}@{commit}"]
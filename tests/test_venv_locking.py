@@ -0,0 +1,79 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import run_command
+
+
+def _hold_lock(mode: str) -> str:
+    """Command holding a lock on .venv from another process for a few seconds"""
+    return f'mkdir -p "${{_lock_dir}}"; flock {mode} "$(venv::_lock_file .venv)" sleep 5 & sleep 0.5'
+
+
+@pytest.fixture(autouse=True)
+def lock_timeout(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("VENV_CLI_LOCK_TIMEOUT", "1")
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+
+
+def test_venv_command_waits_for_exclusive_lock(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that a command changing the environment times out while another venv command holds its lock"""
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command([_hold_lock("--exclusive"), "venv clear"], cwd=tmp_path, activated=True)
+
+    output = capfd.readouterr().out
+    assert "Waiting for another venv command" in output
+    assert "Timed out after 1 seconds" in output
+
+
+def test_venv_shared_lock(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that commands reading the environment share the lock, while commands changing it wait"""
+    run_command(
+        [
+            _hold_lock("--shared"),
+            "venv::_with_lock shared .venv echo 'shared lock taken'",
+            "venv::_with_lock exclusive .venv echo 'exclusive lock taken'",
+            "true",
+        ],
+        cwd=tmp_path,
+    )
+
+    output = capfd.readouterr().out
+    assert "shared lock taken" in output
+    assert "exclusive lock taken" not in output
+    assert "Timed out after 1 seconds" in output
+
+
+def test_venv_lock_is_reentrant(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that a venv command holding a lock can call other venv commands taking the same lock"""
+    run_command(
+        "venv::_with_lock exclusive .venv venv::_with_lock shared .venv echo 'nested lock taken'",
+        cwd=tmp_path,
+    )
+
+    assert "nested lock taken" in capfd.readouterr().out
+
+
+def test_venv_install_base_locks_base_first(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]
+):
+    """Checks that 'venv install --base' takes the lock of the base environment before the lock of the requirements
+    file, like installing the base environment for another requirements file does, so they can't deadlock"""
+    monkeypatch.setenv("VENV_CLI_LOCK_TIMEOUT", "3")
+    (tmp_path / "requirements.lock").write_text("fakepkg-one==1.0\n")
+    base_lock_file = '"$(venv::_lock_file "$(venv::_base_dir requirements.lock "")")"'
+    run_command(
+        [
+            f'mkdir -p "${{_lock_dir}}"; flock --exclusive {base_lock_file} sleep 5 & sleep 0.5',
+            "venv install -r requirements.lock --base & sleep 1",
+            'flock --exclusive --nonblock "$(venv::_lock_file requirements.lock)" echo "requirements file not locked"',
+            "wait",
+        ],
+        cwd=tmp_path,
+        activated=True,
+    )
+
+    output = capfd.readouterr().out
+    assert "Waiting for another venv command" in output
+    assert "requirements file not locked" in output
@@ -0,0 +1,70 @@
+import io
+import json
+import subprocess
+import sys
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import run_command
+
+
+def test_venv_pack_unpack(local_index: str, tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that an environment packed with 'venv pack' can be unpacked and used in another folder"""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    (source_dir / "requirements.txt").write_text("fakepkg-one\n")
+    run_command(
+        [
+            f"venv install --no-wheelhouse --pip-args='--index-url {local_index}'",
+            "python -c 'import fakepkg_one'",
+            "venv pack ../environment.tar.gz --strip",
+        ],
+        cwd=source_dir,
+        activated=True,
+    )
+
+    with tarfile.open(tmp_path / "environment.tar.gz") as archive:
+        names = archive.getnames()
+    assert names[0] == "venv-pack.json"
+    assert not [name for name in names if "__pycache__" in name]
+
+    target_dir = tmp_path / "target"
+    target_dir.mkdir()
+    run_command(
+        [
+            "venv unpack ../environment.tar.gz",
+            "venv activate",
+            "python -c 'import fakepkg_one, sys; print(sys.prefix)'",
+            "pip --version",
+        ],
+        cwd=target_dir,
+    )
+
+    output = capfd.readouterr().out
+    assert f"{target_dir / '.venv'}\n" in output
+    assert str(source_dir) not in (target_dir / ".venv" / "bin" / "pip").read_text()
+    metadata = json.loads((target_dir / ".venv" / ".venv-cli" / "pack.json").read_text())
+    assert metadata["prefix"] == str(source_dir / ".venv")
+    assert "fakepkg-one==1.0" in metadata["lock"]
+
+
+def test_venv_unpack_mismatched_python(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv unpack' refuses to unpack an environment created with a different python"""
+    metadata = {
+        "prefix": "/somewhere/.venv",
+        "python": {"executable": sys.executable, "version": "3.0.0", "cache_tag": "cpython-30", "platform": "linux"},
+        "lock": [],
+    }
+    metadata_bytes = json.dumps(metadata).encode()
+    with tarfile.open(tmp_path / "environment.tar.gz", "w:gz") as archive:
+        info = tarfile.TarInfo("venv-pack.json")
+        info.size = len(metadata_bytes)
+        archive.addfile(info, io.BytesIO(metadata_bytes))
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command("venv unpack environment.tar.gz", cwd=tmp_path)
+
+    assert "The environment needs Python 3.0.0" in capfd.readouterr().err
+    assert not (tmp_path / ".venv").exists()
@@ -0,0 +1,43 @@
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import run_command
+
+
+@pytest.mark.parametrize("target", ["fakepkg_one", "script.py"])
+def test_venv_profile_imports(target: str, local_index: str, tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv profile-imports' reports the import time of the installed packages, for modules and scripts"""
+    (tmp_path / "requirements.txt").write_text("fakepkg-one\n")
+    (tmp_path / "script.py").write_text("import json\nimport fakepkg_one\n")
+    run_command(
+        [
+            f"venv install --no-wheelhouse --pip-args='--index-url {local_index}'",
+            f"venv profile-imports -n 3 --json profile.json {target}",
+        ],
+        cwd=tmp_path,
+        activated=True,
+    )
+
+    output = capfd.readouterr().out
+    assert f"Import time of {target}, mean of 3 run(s)" in output
+    assert "fakepkg-one" in output
+    report = json.loads((tmp_path / "profile.json").read_text())
+    assert report["target"] == target
+    assert report["runs"] == 3
+    assert len(report["total_ms_per_run"]) == 3
+    distributions = {distribution["name"]: distribution for distribution in report["distributions"]}
+    assert distributions["fakepkg-one"]["modules"] == 1
+    assert distributions["fakepkg-one"]["cumulative_ms"] >= distributions["fakepkg-one"]["self_ms"] > 0
+
+
+def test_venv_profile_imports_failing_target_raises(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv profile-imports' fails when the module can't be imported"""
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command("venv profile-imports not_a_module", cwd=tmp_path, activated=True)
+
+    output = capfd.readouterr().out
+    assert "No module named 'not_a_module'" in output
+    assert "Importing not_a_module failed" in output
@@ -0,0 +1,72 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import run_command
+
+
+def _installed_packages(output: str) -> set[str]:
+    return {line.split("==")[0] for line in output.splitlines() if line.startswith("fakepkg-")}
+
+
+def test_venv_install_atomic_and_rollback(local_index: str, tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv install --atomic' swaps in the new environment, keeps the previous one,
+    and that 'venv rollback' swaps them back"""
+    requirements_file = tmp_path / "requirements.txt"
+    requirements_file.write_text("fakepkg-one\n")
+    install = f"venv install --atomic --no-wheelhouse --pip-args='--index-url {local_index}'"
+    run_command(
+        [
+            f"venv install --no-wheelhouse --pip-args='--index-url {local_index}'",
+            "echo fakepkg-two > requirements.txt",
+            install,
+            "pip list --format=freeze",
+        ],
+        cwd=tmp_path,
+        activated=True,
+    )
+
+    output = capfd.readouterr().out
+    assert _installed_packages(output) == {"fakepkg-two"}
+    assert (tmp_path / "requirements.lock").read_text() == "fakepkg-two==1.0\n"
+    assert (tmp_path / ".venv.prev").is_dir()
+    assert not (tmp_path / ".venv.new").exists()
+    assert str(tmp_path / ".venv.new") not in (tmp_path / ".venv" / "bin" / "activate").read_text()
+
+    run_command(["venv rollback", "pip list --format=freeze"], cwd=tmp_path, activated=True)
+
+    output = capfd.readouterr().out
+    assert "Rolled back" in output
+    assert _installed_packages(output) == {"fakepkg-one"}
+
+
+def test_venv_install_atomic_failure_leaves_environment(
+    local_index: str, tmp_path: Path, capfd: pytest.CaptureFixture[str]
+):
+    """Checks that a failing 'venv install --atomic' leaves the active environment unchanged"""
+    (tmp_path / "requirements.txt").write_text("fakepkg-one\n")
+    run_command(
+        f"venv install --no-wheelhouse --pip-args='--index-url {local_index}'",
+        cwd=tmp_path,
+        activated=True,
+    )
+    (tmp_path / "requirements.txt").write_text("fakepkg-does-not-exist\n")
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command(
+            f"venv install --atomic --no-wheelhouse --pip-args='--index-url {local_index}'",
+            cwd=tmp_path,
+            activated=True,
+        )
+
+    assert "the environment in" in capfd.readouterr().out
+    assert not (tmp_path / ".venv.new").exists()
+    assert not (tmp_path / ".venv.prev").exists()
+    assert list((tmp_path / ".venv").glob("lib/python*/site-packages/fakepkg_one*"))
+
+
+def test_venv_rollback_without_previous_environment_raises(tmp_path: Path):
+    """Checks that 'venv rollback' fails when there is no previous environment"""
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command("venv rollback", cwd=tmp_path, activated=True)
@@ -1,11 +1,32 @@
+import os
+import subprocess
 from pathlib import Path
 
 import pytest
 
-from tests.helpers import run_command
+from tests.helpers import _venv_cli_path, run_command
 
 
 @pytest.mark.order("first")
 def test_venv_source(tmp_path: Path):
     """Checks that simply sourcing the venv source script works"""
     run_command("", cwd=tmp_path)
+
+
+def test_venv_source_stub(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that the stub installed into the shell rc-file only loads the full script
+    when 'venv' is first used"""
+    stub_path = Path.cwd() / "src" / "venv-cli" / "venv-stub.sh"
+    commands = [
+        f". {stub_path}",
+        "type venv::create > /dev/null 2>&1 && echo 'loaded early'",
+        "venv --version",
+        "type venv::create > /dev/null && echo 'loaded'",
+    ]
+    env = {**os.environ, "VENV_CLI_SCRIPT": str(_venv_cli_path)}
+    subprocess.run([os.environ["SHELL"], "-c", "; ".join(commands)], cwd=tmp_path, env=env, check=True)
+
+    output = capfd.readouterr().out
+    assert "loaded early" not in output
+    assert output.startswith("venv-cli v")
+    assert output.rstrip().endswith("loaded")
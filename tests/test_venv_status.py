@@ -0,0 +1,42 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import run_command
+
+
+@pytest.mark.order(after="test_venv_activate.py::test_venv_activate")
+def test_venv_status(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv status' reports missing, extra and mismatched packages"""
+    (tmp_path / "requirements.txt").write_text("python-json-logger==2.0.7\n")
+    run_command(["venv install -r requirements.txt", "venv status"], cwd=tmp_path, activated=True)
+    assert "Environment matches requirements.lock" in capfd.readouterr().out
+
+    (tmp_path / "requirements.lock").write_text("python-json-logger==2.0.6\nsix==1.16.0\n")
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command(["venv activate", "pip install --quiet tomli==2.0.1", "venv status"], cwd=tmp_path)
+
+    output = capfd.readouterr().out
+    assert "Environment does not match requirements.lock" in output
+    assert "missing:    six==1.16.0" in output
+    assert "extra:      tomli==2.0.1" in output
+    assert "mismatched: python-json-logger==2.0.6 (installed: python-json-logger==2.0.7)" in output
+
+
+@pytest.mark.order(after="test_venv_activate.py::test_venv_activate")
+def test_venv_status_quiet(tmp_path: Path, capfd: pytest.CaptureFixture[str]):
+    """Checks that 'venv status --quiet' only sets the exit code"""
+    (tmp_path / "dev-requirements.lock").write_text("six==1.16.0\n")
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command("venv status dev --quiet", cwd=tmp_path, activated=True)
+
+    assert "match" not in capfd.readouterr().out
+
+
+@pytest.mark.parametrize("lock_arg", ["requirements.txt", "missing-requirements.lock"])
+def test_venv_status_raises(lock_arg: str, tmp_path: Path):
+    """Checks that 'venv status' raises when the lock file is invalid or missing"""
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command(f"venv status {lock_arg}", activated=True, cwd=tmp_path)
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import run_command
+
+
+def _metadata_file(project_dir: Path) -> Path:
+    return next((project_dir / ".venv").glob("lib/python*/site-packages/fakepkg_one-1.0.dist-info/METADATA"))
+
+
+def test_venv_install_store(
+    local_index: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]
+):
+    """Checks that 'venv install' with a store hardlinks the installed files of every environment to the same file
+    in the store, and that 'venv store gc' only removes the files no environment links to anymore"""
+    store_dir = tmp_path / "store"
+    monkeypatch.setenv("VENV_CLI_STORE", str(store_dir))
+    project_dirs = [tmp_path / "project-a", tmp_path / "project-b"]
+    for project_dir in project_dirs:
+        project_dir.mkdir()
+        (project_dir / "requirements.txt").write_text("fakepkg-one\n")
+        run_command(
+            f"venv install --no-wheelhouse --pip-args='--index-url {local_index}'",
+            cwd=project_dir,
+            activated=True,
+        )
+
+    assert "to the store in" in capfd.readouterr().out
+    metadata_a, metadata_b = (_metadata_file(project_dir) for project_dir in project_dirs)
+    assert metadata_a.samefile(metadata_b)
+    assert metadata_a.stat().st_nlink == 3
+
+    run_command("venv store gc", cwd=tmp_path)
+    assert "Removed 0 file(s)" in capfd.readouterr().out
+
+    run_command("venv clear", cwd=project_dirs[0], activated=True)
+    run_command("venv delete -y", cwd=project_dirs[1])
+    run_command("venv store gc", cwd=tmp_path)
+
+    assert "Removed 0 file(s)" not in capfd.readouterr().out
+    assert not list((store_dir / "objects").glob("*/*"))
+
+
+def test_venv_install_store_unchanged(
+    local_index: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]
+):
+    """Checks that 'venv install --store' links the installed files to the store when they are already installed"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    (tmp_path / "requirements.txt").write_text("fakepkg-one\n")
+    install_command = f"venv install --no-wheelhouse --pip-args='--index-url {local_index}'"
+    run_command([install_command, f"{install_command} --store"], cwd=tmp_path, activated=True)
+
+    output = capfd.readouterr().out
+    assert "Requirements in requirements.txt are already installed" in output
+    assert "to the store in" in output
+    assert _metadata_file(tmp_path).stat().st_nlink == 2
@@ -0,0 +1,46 @@
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import run_command
+
+
+@pytest.mark.order(after="test_venv_activate.py::test_venv_activate")
+def test_venv_trace(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]):
+    """Checks that every command and phase is recorded in the trace file, and shown in the summary"""
+    trace_file = tmp_path / "trace.jsonl"
+    monkeypatch.setenv(name="VENV_CLI_TRACE", value=str(trace_file))
+    (tmp_path / "requirements.txt").write_text("python-json-logger==2.0.7\n")
+
+    run_command("venv install -r requirements.txt", cwd=tmp_path, activated=True)
+
+    events = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    names = [event["name"] for event in events]
+    assert "venv create" in names
+    assert "venv install" in names
+    assert "install: pip install" in names
+    assert "install: lock" in names
+
+    pip_install = events[names.index("install: pip install")]
+    assert pip_install["ph"] == "X"
+    assert pip_install["dur"] > 0
+    assert pip_install["args"]["exit_code"] == 0
+    # python-json-logger, in addition to the packages the environment was created with
+    created_packages = events[names.index("venv activate")]["args"]["installed_packages"]
+    assert pip_install["args"]["installed_packages"] == created_packages + 1
+
+    capfd.readouterr()
+    run_command("venv trace summary", cwd=tmp_path)
+    output = capfd.readouterr().out
+    assert output.startswith("Phase")
+    assert "install: pip install" in output
+
+
+@pytest.mark.parametrize("trace_args", ["", "summary", "summary missing.jsonl", "unknown trace.jsonl"])
+def test_venv_trace_raises(trace_args: str, tmp_path: Path):
+    """Checks that 'venv trace' raises when the trace command or trace file is invalid"""
+    (tmp_path / "trace.jsonl").touch()
+    with pytest.raises(subprocess.CalledProcessError):
+        run_command(f"venv trace {trace_args}", cwd=tmp_path)